@@ -1 +1,4 @@
-from .search import extract_links
\ No newline at end of file
+from .search import extract_links
+from .batch import extract_links_many
+from .stream import extract_links_stream
+from .aio import extract_links_async
@@ -0,0 +1,263 @@
+"""
+Asyncio variant of extract_links. Finding the matches stays synchronous (it is CPU
+bound), but the laws of the matches of a document are resolved with concurrent queries
+over an asyncpg connection pool instead of sequential blocking psycopg2 calls.
+"""
+
+import asyncio
+import logging
+import os
+from time import perf_counter
+from typing import Any, Dict, List, Tuple
+from urllib.parse import urlencode
+
+from psycopg2.extensions import parse_dsn
+
+from linkextractor import db, law_index, metrics, snapshot, utils
+from linkextractor.law_index import get_law_index
+from linkextractor.metrics import ExtractStats
+from linkextractor.search import build_links, find_lookups
+from linkextractor.types import Alias, Fragment
+from linkextractor.utils import (LONGEST_ALIAS_QUERY, find_longest_alias_in_substring, get_aliased_bwb_ids, get_automaton,
+                                 get_fragment_tuples, get_trie, laws_statement)
+
+# maximum amount of concurrent queries of a single document
+ASYNC_CONCURRENCY = int(os.getenv("LINKEXTRACTOR_ASYNC_CONCURRENCY", 8))
+
+# asyncpg pools, and the locks that create them, per event loop: a pool can only be used
+# on the loop that it was created on (e.g. each asyncio.run has a loop of its own)
+_ASYNC_POOLS: Dict[asyncio.AbstractEventLoop, Any] = {}
+_ASYNC_POOL_LOCKS: Dict[asyncio.AbstractEventLoop, asyncio.Lock] = {}
+
+# libpq connection parameters that asyncpg reads from the query of a postgres:// url
+_URL_PARAMETERS = (
+    "host", "port", "user", "password", "dbname", "passfile",
+    "sslmode", "sslcert", "sslkey", "sslrootcert", "sslcrl", "sslpassword",
+    "ssl_min_protocol_version", "ssl_max_protocol_version",
+    "target_session_attrs", "krbsrvname", "gsslib",
+)
+
+def _connect_kwargs(dsn: str | None) -> Dict[str, Any]:
+    # asyncpg only understands postgres:// urls, key=value connection strings are converted
+    if dsn is None or "://" in dsn:
+        return {"dsn": dsn}
+    params = parse_dsn(dsn)
+    kwargs: Dict[str, Any] = {}
+    settings: Dict[str, str] = {}
+    if "options" in params:
+        # e.g. "-c search_path=..."
+        settings.update(option.split("=", 1) for option in params.pop("options").replace("-c ", "").split())
+    if "application_name" in params:
+        settings["application_name"] = params.pop("application_name")
+    if "connect_timeout" in params:
+        kwargs["timeout"] = float(params.pop("connect_timeout"))
+    unsupported = sorted(set(params) - set(_URL_PARAMETERS))
+    if len(unsupported) > 0:
+        raise ValueError(f"connection parameters not supported by asyncpg: {', '.join(unsupported)}")
+    kwargs["dsn"] = "postgresql://?" + urlencode(params)
+    if len(settings) > 0:
+        kwargs["server_settings"] = settings
+    return kwargs
+
+async def get_async_pool():
+    """
+    Returns the asyncpg connection pool of the running event loop, sized like the
+    psycopg2 pool (see db.configure_pool)
+    """
+    import asyncpg
+
+    loop = asyncio.get_running_loop()
+    pool = _ASYNC_POOLS.get(loop)
+    if pool is not None:
+        return pool
+
+    # the pools of loops that were closed without close_async_pool can not be used anymore
+    for closed_loop in [other for other in _ASYNC_POOL_LOCKS if other.is_closed()]:
+        _ASYNC_POOLS.pop(closed_loop, None)
+        del _ASYNC_POOL_LOCKS[closed_loop]
+
+    async with _ASYNC_POOL_LOCKS.setdefault(loop, asyncio.Lock()):
+        if loop not in _ASYNC_POOLS:
+            _ASYNC_POOLS[loop] = await asyncpg.create_pool(
+                min_size=db.POOL_MIN_SIZE,
+                max_size=db.POOL_MAX_SIZE,
+                **{"timeout": db.POOL_TIMEOUT, **_connect_kwargs(db.DB_URL)}
+            )
+    return _ASYNC_POOLS[loop]
+
+async def close_async_pool():
+    """
+    Close the asyncpg connection pool of the running event loop
+    """
+    loop = asyncio.get_running_loop()
+    pool = _ASYNC_POOLS.pop(loop, None)
+    _ASYNC_POOL_LOCKS.pop(loop, None)
+    if pool is not None:
+        await pool.close()
+
+def _has_unloaded_data(use_trie: bool = False) -> bool:
+    # whether finding the aliases (with use_trie) or resolving a law would load the
+    # automaton, trie, law index or alias payloads (and block) first
+    if use_trie and utils._AUTOMATON_CACHE is None:
+        return True
+    if not law_index._LAW_INDEX_LOADED:
+        return True
+    if (utils.ALIAS_PAYLOADS or law_index._LAW_INDEX_CACHE is not None) and utils._TRIE_CACHE is None:
+        # the longest alias fallback reads the trie
+        return True
+    if law_index._LAW_INDEX_CACHE is not None or db.is_sqlite() or not utils.ALIAS_PAYLOADS:
+        return False
+    aliased_bwb_ids = utils._ALIASED_BWB_IDS
+    return aliased_bwb_ids is None or aliased_bwb_ids[0] is not utils._PAYLOADS_CACHE
+
+def _load_data(use_trie: bool = False):
+    if use_trie:
+        get_automaton()
+    if utils._has_alias_index():
+        get_trie()
+    if get_law_index() is None and not db.is_sqlite() and utils.ALIAS_PAYLOADS:
+        # loads the payloads as well
+        get_aliased_bwb_ids()
+
+async def load_data(use_trie: bool = False):
+    """
+    Load (or build) the trie, law index and alias payloads, and with use_trie the
+    automaton, in a thread, so that loading them on the first lookup, or after they
+    were reset, does not block the event loop
+    """
+    if _has_unloaded_data(use_trie):
+        await asyncio.to_thread(_load_data, use_trie)
+
+async def find_laws_async(fragments: Fragment, alias: str | None = None, bwb_id: str | None = None) -> List[dict]:
+    """
+    Asyncio version of utils.find_laws
+    """
+    assert (alias is not None and len(alias.strip()) != 0) ^ (bwb_id is not None), "alias should not be empty"
+    assert fragments is not None and len(fragments) != 0, "list of fragments should not be empty"
+
+    fragment_tuples = get_fragment_tuples(fragments)
+
+    await load_data()
+    index = get_law_index()
+    if index is not None:
+        return index.find_laws(fragment_tuples, alias=alias, bwb_id=bwb_id)
+    if db.is_sqlite():
+        # a local file, there is no latency to overlap
+        return snapshot.find_laws(fragment_tuples, alias=alias, bwb_id=bwb_id)
+
+    # the same statement as utils.find_laws
+    statement = laws_statement(fragment_tuples, alias=alias, bwb_id=bwb_id)
+    if statement is None:
+        return []
+    _, query, params = statement
+    pool = await get_async_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(query, *params)
+
+    return [
+        {
+            'type': row[0],
+            'number': row[1],
+            'bwb_id': row[2],
+            'bwb_label_id': row[3],
+            'title': row[4],
+        } for row in rows
+    ]
+
+async def find_longest_alias_in_substring_async(input_text: str) -> Alias | None:
+    """
+    Asyncio version of utils.find_longest_alias_in_substring
+    """
+    await load_data()
+    if utils._has_alias_index() or db.is_sqlite():
+        # answered from the trie or the snapshot, no network I/O
+        return find_longest_alias_in_substring(input_text)
+
+    pool = await get_async_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(LONGEST_ALIAS_QUERY, input_text)
+    if row is None:
+        return None
+    return {
+        'alias': row[0],
+        'bwb_id': row[1]
+    }
+
+async def _resolve_law(fragments: Fragment, title: str, semaphore: asyncio.Semaphore) -> List[dict]:
+    async with semaphore:
+        laws = await find_laws_async(fragments, alias=title)
+        if len(laws) == 0:
+            # fallback for titles that are not an alias themselves
+            longest_alias = await find_longest_alias_in_substring_async(title)
+            if longest_alias is not None:
+                laws = await find_laws_async(fragments, bwb_id=longest_alias['bwb_id'])
+        return laws
+
+async def resolve_laws_async(lookups: List[Tuple[Fragment, str]], concurrency: int | None = None,
+                             stats: ExtractStats | None = None) -> List[List[dict]]:
+    """
+    Asyncio version of utils.resolve_laws: resolves the lookups concurrently, with at
+    most `concurrency` lookups in flight. Lookups are cached like in resolve_laws. When
+    this is cancelled (or one of the lookups fails), the lookups that are still in
+    flight are cancelled and their connections are returned to the pool.
+    """
+    # once, instead of in each of the concurrent lookups
+    await load_data()
+    keys = [utils.laws_cache_key(fragments, title) for fragments, title in lookups]
+    results = [utils.get_cached_laws(key) for key in keys]
+    if stats is not None:
+        stats.counts["cache_hits"] += sum(laws is not None for laws in results)
+
+    # resolve every lookup that is not cached once (see utils.resolve_laws)
+    pending: Dict[tuple, int] = {}
+    for i, laws in enumerate(results):
+        if laws is None:
+            pending.setdefault(keys[i], i)
+
+    semaphore = asyncio.Semaphore(concurrency if concurrency is not None else ASYNC_CONCURRENCY)
+    tasks = [asyncio.ensure_future(_resolve_law(*lookups[i], semaphore)) for i in pending.values()]
+    try:
+        resolved = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    for key, laws in zip(pending, resolved):
+        utils.cache_laws(key, laws)
+    resolved_by_key = dict(zip(pending, resolved))
+    return [
+        laws if laws is not None else [dict(law) for law in resolved_by_key[key]]
+        for key, laws in zip(keys, results)
+    ]
+
+async def extract_links_async(text, exact=False, loose=False, use_trie=True, concurrency: int | None = None,
+                              stats: ExtractStats | None = None, **kwargs):
+    """
+    Asyncio version of extract_links. The matches are found synchronously, after which
+    the laws of all matches are resolved with up to `concurrency` concurrent queries.
+    Without use_trie the aliases are looked up with psycopg2, so the matches are found in
+    a thread instead. Other keyword arguments (windowed, compare, longest) are passed on
+    to find_lookups. The asyncpg queries are not counted in the queries of stats.
+    """
+    stats = stats if stats is not None else ExtractStats()
+    if use_trie:
+        # the automaton is loaded (or built) in a thread, finding the matches is CPU bound
+        await load_data(use_trie=True)
+        lookups = find_lookups(text, exact=exact, loose=loose, use_trie=use_trie, stats=stats, **kwargs)
+    else:
+        lookups = await asyncio.to_thread(find_lookups, text, exact=exact, loose=loose, use_trie=use_trie, stats=stats, **kwargs)
+
+    start = perf_counter()
+    resolved = await resolve_laws_async(
+        [(fragments, sub_match['patterns']['TITLE']) for sub_match, fragments in lookups],
+        concurrency=concurrency,
+        stats=stats
+    )
+    stats.times["resolve"] += perf_counter() - start
+
+    metrics.record(stats)
+    logging.debug("%s", stats)
+
+    return build_links(lookups, resolved, exact=exact)
@@ -0,0 +1,124 @@
+"""
+Aho-Corasick automaton for finding all aliases in a text in a single pass.
+
+Transitions are kept in one flat dict keyed by `state << 21 | codepoint` and the
+per-state data in arrays, which is considerably more compact than a dict per state
+for the ~100k aliases in `law_alias`.
+"""
+
+from array import array
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+# unicode codepoints fit in 21 bits
+_SHIFT = 21
+
+def _is_word_char(ch: str) -> bool:
+    # equivalent of the \w character class of the re module
+    return ch.isalnum() or ch == "_"
+
+def is_word_boundary(text: str, start: int, end: int) -> bool:
+    """
+    True if text[start:end] is not preceded or followed by a word character
+    """
+    return (start == 0 or not _is_word_char(text[start - 1])) and \
+        (end == len(text) or not _is_word_char(text[end]))
+
+class AliasAutomaton:
+    def __init__(self, aliases: Iterable[str]):
+        goto: Dict[int, int] = {}
+        children: List[List[int]] = [[]]
+        depth = array('i', [0])
+        out_len = array('i', [0])
+
+        # 1. build the trie of all aliases
+        for alias in aliases:
+            if len(alias) == 0:
+                continue
+            state = 0
+            for ch in alias:
+                key = (state << _SHIFT) | ord(ch)
+                nxt = goto.get(key)
+                if nxt is None:
+                    nxt = len(depth)
+                    goto[key] = nxt
+                    children[state].append(ord(ch))
+                    children.append([])
+                    depth.append(depth[state] + 1)
+                    out_len.append(0)
+                state = nxt
+            out_len[state] = depth[state]
+
+        # 2. compute failure links (longest proper suffix that is also a state) and
+        # dictionary links (nearest state on the failure chain that ends an alias)
+        n = len(depth)
+        fail = array('i', bytes(4 * n))
+        dict_link = array('i', bytes(4 * n))
+
+        queue = deque([0])
+        while queue:
+            state = queue.popleft()
+            for c in children[state]:
+                child = goto[(state << _SHIFT) | c]
+                queue.append(child)
+                if state == 0:
+                    continue
+                f = fail[state]
+                while True:
+                    nxt = goto.get((f << _SHIFT) | c)
+                    if nxt is not None:
+                        fail[child] = nxt
+                        break
+                    if f == 0:
+                        break
+                    f = fail[f]
+                f = fail[child]
+                dict_link[child] = f if out_len[f] else dict_link[f]
+
+        self._goto = goto
+        self._fail = fail
+        self._out_len = out_len
+        self._dict_link = dict_link
+
+    def __len__(self):
+        return len(self._out_len)
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """
+        Yields (start, end) of every occurrence of every alias in text, ordered by end
+        """
+        goto = self._goto
+        fail = self._fail
+        out_len = self._out_len
+        dict_link = self._dict_link
+
+        state = 0
+        for i, ch in enumerate(text):
+            c = ord(ch)
+            while True:
+                nxt = goto.get((state << _SHIFT) | c)
+                if nxt is not None:
+                    state = nxt
+                    break
+                if state == 0:
+                    break
+                state = fail[state]
+
+            out = state if out_len[state] else dict_link[state]
+            while out:
+                yield i + 1 - out_len[out], i + 1
+                out = dict_link[out]
+
+    def longest_matches(self, text: str, word_boundaries: bool = False) -> List[Tuple[int, int]]:
+        """
+        Returns (start, end) of the longest alias starting at each position of text
+        where an alias starts, ordered by start. With word_boundaries, only aliases
+        that are not part of a larger word are considered.
+        """
+        longest: Dict[int, int] = {}
+        # matches are ordered by end, so the last match seen for a start is the longest
+        for start, end in self.iter_matches(text):
+            if word_boundaries and not is_word_boundary(text, start, end):
+                continue
+            longest[start] = end
+        return sorted(longest.items())
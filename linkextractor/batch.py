@@ -0,0 +1,277 @@
+"""
+Extraction of links from many documents at once over a pool of worker processes.
+"""
+
+import gc
+import json
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from time import perf_counter
+from typing import Any, Dict, Iterable, Iterator, List, TextIO, Tuple, Union
+
+from linkextractor import db
+from linkextractor.law_index import get_law_index
+from linkextractor.patterns import get_atoms, get_indicators_pattern, get_patterns
+from linkextractor.search import extract_links
+from linkextractor.types import BatchResult
+from linkextractor.utils import ALIAS_PAYLOADS, get_alias_payloads, get_automaton
+
+Document = Tuple[Any, str]
+WorkerStats = Dict[str, float]
+
+def _load_read_only(use_trie: bool = True):
+    # the alias trie, automaton and payloads, the compiled patterns and the law index
+    get_atoms()
+    get_patterns()
+    get_indicators_pattern()
+    if use_trie:
+        get_automaton()
+    if ALIAS_PAYLOADS:
+        get_alias_payloads()
+    get_law_index()
+
+def warm_up(use_trie: bool = True):
+    """
+    Load everything that is otherwise loaded lazily on the first document: the alias
+    trie and automaton, the compiled patterns, the law index and the connection pool.
+    """
+    _load_read_only(use_trie)
+    if not db.is_sqlite():
+        db.get_pool()
+
+def preload(use_trie: bool = True):
+    """
+    Load the read-only data (alias trie, automaton and payloads, compiled patterns and law index)
+    before worker processes are forked from this process, e.g. from gunicorn's
+    `on_starting` hook or with `preload_app`, so that the workers share these pages
+    instead of each loading a private copy on their first request.
+
+    The trie and law index are memory-mapped files and are shared regardless; the
+    automaton and patterns are shared copy-on-write, for which everything loaded so far
+    is frozen out of the garbage collector, whose collections would otherwise write to
+    (and thereby copy) their pages in every worker. Database connections are not
+    shared between processes, so the pool of this process is closed again.
+    """
+    start = perf_counter()
+    _load_read_only(use_trie)
+    db.close_pool()
+    gc.freeze()
+    logging.debug("time preloading: %s", perf_counter() - start)
+
+def _init_worker(db_url: str | None, log_level: int, use_trie: bool):
+    logging.getLogger().setLevel(log_level)
+    if db_url != db.DB_URL:
+        db.set_db_url(db_url)
+    try:
+        warm_up(use_trie)
+    except Exception as e:
+        # documents will fail (and be reported) individually instead
+        logging.warning("worker %s failed to warm up: %s", os.getpid(), e)
+
+def _extract_chunk(chunk: List[Document], kwargs: Dict[str, Any]) -> Tuple[List[BatchResult], WorkerStats]:
+    results: List[BatchResult] = []
+    characters = 0
+    errors = 0
+    start = perf_counter()
+    for id, text in chunk:
+        characters += len(text) if isinstance(text, str) else 0
+        try:
+            results.append({"id": id, "links": extract_links(text, **kwargs), "error": None})
+        except Exception as e:
+            errors += 1
+            logging.warning("extracting links of document %r failed: %s", id, e)
+            results.append({"id": id, "links": [], "error": f"{type(e).__name__}: {e}"})
+
+    stats = {
+        "pid": os.getpid(),
+        "documents": len(chunk),
+        "characters": characters,
+        "errors": errors,
+        "seconds": perf_counter() - start,
+    }
+    return results, stats
+
+def _documents(texts: Iterable[Union[str, Document]]) -> Iterator[Document]:
+    for i, item in enumerate(texts):
+        if isinstance(item, str):
+            yield i, item
+        else:
+            yield item
+
+def _chunks(documents: Iterator[Document], chunk_size: int) -> Iterator[List[Document]]:
+    while True:
+        chunk = list(islice(documents, chunk_size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+def _add_stats(worker_stats: Dict[int, WorkerStats], stats: WorkerStats):
+    totals = worker_stats.setdefault(int(stats["pid"]), {"documents": 0, "characters": 0, "errors": 0, "seconds": 0.0})
+    for key in ("documents", "characters", "errors", "seconds"):
+        totals[key] += stats[key]
+    totals["documents_per_second"] = totals["documents"] / totals["seconds"] if totals["seconds"] > 0 else 0.0
+    totals["characters_per_second"] = totals["characters"] / totals["seconds"] if totals["seconds"] > 0 else 0.0
+
+def extract_links_many(
+    texts: Iterable[Union[str, Document]],
+    workers: int | None = None,
+    chunk_size: int = 16,
+    ordered: bool = True,
+    stats: Dict[int, WorkerStats] | None = None,
+    **kwargs
+) -> Iterator[BatchResult]:
+    """
+    Extract the links of many documents, given as texts or (id, text) pairs (the id of a
+    text is its position), over a pool of `workers` processes (defaults to the amount of
+    CPUs; 0 extracts in this process). Documents are sent to the workers in chunks of
+    `chunk_size`, and each worker warms up the trie, patterns and connection pool once.
+    When the workers are forked, the read-only data is loaded and frozen out of the garbage
+    collector in this process until the workers are forked (see preload), so that the
+    workers share it. The connection pool of this process is left open.
+
+    Yields one BatchResult per document, in the order of the input, or with ordered=False
+    in the order in which they complete. A document that fails yields a result with the
+    error instead of stopping the batch; when a worker dies (e.g. it is killed), the chunks
+    that were in flight fail and the pool is replaced. Other keyword arguments are passed on to
+    extract_links. If `stats` is given, it is filled with the throughput per worker (pid).
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    assert workers >= 0 and chunk_size > 0, "invalid amount of workers or chunk size"
+
+    worker_stats: Dict[int, WorkerStats] = stats if stats is not None else {}
+    chunks = _chunks(_documents(texts), chunk_size)
+    start = perf_counter()
+
+    if workers == 0:
+        for chunk in chunks:
+            results, chunk_stats = _extract_chunk(chunk, kwargs)
+            _add_stats(worker_stats, chunk_stats)
+            yield from results
+    else:
+        use_trie = kwargs.get("use_trie", True)
+        # unlike preload, only freeze for the fork of the workers, and leave a freeze of the caller
+        # (e.g. preload itself) alone; the workers reset the inherited pool (see db._reset_after_fork)
+        frozen = False
+        if multiprocessing.get_start_method() == "fork":
+            _load_read_only(use_trie)
+            if gc.get_freeze_count() == 0:
+                gc.freeze()
+                frozen = True
+
+        def create_executor() -> ProcessPoolExecutor:
+            return ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(db.DB_URL, logging.getLogger().getEffectiveLevel(), use_trie)
+            )
+
+        executor = create_executor()
+        try:
+            # bound the amount of chunks in flight, so that the input is consumed lazily
+            pending: deque[Tuple[Future, List[Document]]] = deque()
+            max_pending = 2 * workers
+
+            def collect(future: Future, chunk: List[Document]) -> List[BatchResult]:
+                try:
+                    results, chunk_stats = future.result()
+                except Exception as e:
+                    # the worker itself failed (e.g. it was killed), fail the documents of the chunk
+                    logging.warning("chunk of %s documents failed: %s", len(chunk), e)
+                    return [{"id": id, "links": [], "error": f"{type(e).__name__}: {e}"} for id, _ in chunk]
+                _add_stats(worker_stats, chunk_stats)
+                return results
+
+            def drain(limit: int) -> Iterator[BatchResult]:
+                while len(pending) > limit:
+                    if ordered:
+                        yield from collect(*pending.popleft())
+                        continue
+                    done, _ = wait([future for future, _ in pending], return_when=FIRST_COMPLETED)
+                    for item in [item for item in pending if item[0] in done]:
+                        pending.remove(item)
+                        yield from collect(*item)
+
+            for chunk in chunks:
+                try:
+                    future = executor.submit(_extract_chunk, chunk, kwargs)
+                except BrokenProcessPool:
+                    # a worker died, the chunks that are still pending on the broken pool fail
+                    # when they are collected, the rest of the batch continues on a new pool
+                    logging.warning("worker pool is broken, starting a new one")
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = create_executor()
+                    future = executor.submit(_extract_chunk, chunk, kwargs)
+                pending.append((future, chunk))
+                if frozen:
+                    # with fork, all workers are started on the first submit
+                    gc.unfreeze()
+                    frozen = False
+                yield from drain(max_pending - 1)
+            yield from drain(0)
+        finally:
+            if frozen:
+                gc.unfreeze()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    elapsed = perf_counter() - start
+    documents = sum(s["documents"] for s in worker_stats.values())
+    logging.info("extracted links of %s documents in %.2fs (%.1f documents/s)", documents, elapsed, documents / elapsed if elapsed > 0 else 0.0)
+    for pid, s in sorted(worker_stats.items()):
+        logging.info("worker %s: %s documents, %s errors, %.1f documents/s, %.0f characters/s",
+                     pid, s["documents"], s["errors"], s["documents_per_second"], s["characters_per_second"])
+
+def read_jsonl(lines: Iterable[str], counters: Dict[str, int] | None = None) -> Iterator[Document]:
+    """
+    Parse newline-delimited JSON documents with an "id" and a "text" into (id, text)
+    pairs, skipping (and logging) lines that are not such a document. The id defaults to
+    the line number. If counters is given, the amount of characters read is kept in it.
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if counters is not None:
+            counters["characters"] = counters.get("characters", 0) + len(line)
+        if len(line.strip()) == 0:
+            continue
+        try:
+            document = json.loads(line)
+            text = document["text"]
+            assert isinstance(text, str), "text should be a string"
+        except (ValueError, KeyError, TypeError, AssertionError) as e:
+            logging.warning("skipping line %s, not a document: %s", line_number, e)
+            continue
+        yield document.get("id", line_number), text
+
+def extract_jsonl(input_file: TextIO, output_file: TextIO, progress_interval: float = 10.0, **kwargs) -> int:
+    """
+    Extract the links of the JSONL documents in input_file (see read_jsonl) with
+    extract_links_many and write one JSON line with the id, links and error of each
+    document to output_file. Every `progress_interval` seconds the throughput so far is
+    logged. Other keyword arguments are passed on to extract_links_many. Returns the
+    amount of documents.
+    """
+    counters: Dict[str, int] = {}
+    documents = 0
+    start = last_progress = perf_counter()
+
+    def log_throughput():
+        elapsed = perf_counter() - start
+        logging.info("%s documents in %.1fs: %.1f documents/s, %.2f MB/s", documents, elapsed,
+                     documents / elapsed if elapsed > 0 else 0.0,
+                     counters.get("characters", 0) / elapsed / 1e6 if elapsed > 0 else 0.0)
+
+    for result in extract_links_many(read_jsonl(input_file, counters), **kwargs):
+        output_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+        documents += 1
+        if perf_counter() - last_progress >= progress_interval:
+            output_file.flush()
+            log_throughput()
+            last_progress = perf_counter()
+
+    output_file.flush()
+    log_throughput()
+    return documents
@@ -0,0 +1,284 @@
+"""
+Benchmarks of the hot paths of the extraction pipeline, run with
+`linkextractor bench <name>`. Like `linkextractor test`, these require the
+database (or a previously built aliases.trie) to be available.
+"""
+
+import asyncio
+import gc
+import logging
+import multiprocessing
+from statistics import median
+from time import perf_counter
+from typing import Callable, Dict
+
+from linkextractor import db
+from linkextractor.aio import close_async_pool, extract_links_async
+from linkextractor.batch import preload
+from linkextractor.search import extract_links
+from linkextractor.patterns import get_alias_scanner, get_windows
+from linkextractor.utils import (BWB_IDS_LAWS_QUERY, LAWS_QUERY, _find_aliases_like_query, _find_aliases_trie_prefixes,
+                                 _find_laws_query, _laws_params, _longest_alias_prefix, _longest_alias_query, _longest_aliases_query,
+                                 find_aliases_in_text, get_alias_bwb_ids, get_alias_ngram_limits, get_alias_payloads,
+                                 get_automaton, get_fragment_tuples, invalidate_laws_cache, reset_trie)
+
+SAMPLE_TEXT = (
+    "De rechtbank oordeelt dat de werkgever op grond van artikel 7:658 van het BW aansprakelijk is "
+    "voor de schade die de werknemer in de uitoefening van zijn werkzaamheden heeft geleden. "
+    "Tevens is artikel 3:2 Algemene wet bestuursrecht van belang, nu het bestuursorgaan bij de "
+    "voorbereiding van het besluit de nodige kennis omtrent de relevante feiten had moeten vergaren. "
+    "Gelet op de artikelen 10, 14a en 22c van het Wetboek van Strafrecht en art. 1:75 Wft wordt "
+    "als volgt beslist. "
+)
+
+def sample_text(length: int) -> str:
+    """
+    Generate a judgment-like text of the given length from SAMPLE_TEXT
+    """
+    return (SAMPLE_TEXT * (length // len(SAMPLE_TEXT) + 1))[:length]
+
+def _time(fn: Callable, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        fn()
+        timings.append(perf_counter() - start)
+    return median(timings)
+
+def benchmark_alias_scan(repeat: int = 3):
+    """
+    Scan time against text length of the per-position trie loop and the automaton
+    """
+    # build/load the trie and automaton up front, so that only scanning is measured
+    get_automaton()
+
+    logging.info(f" {'length':>8} | {'trie prefixes (s)':>17} | {'automaton (s)':>13} | {'speedup':>7}")
+    logging.info(f" ---------+-------------------+---------------+--------")
+    for length in (1_000, 10_000, 50_000, 100_000, 200_000):
+        text = sample_text(length)
+        t_trie = _time(lambda: _find_aliases_trie_prefixes(text), repeat)
+        t_automaton = _time(lambda: find_aliases_in_text(text, use_trie=True), repeat)
+        logging.info(f" {length:>8} | {t_trie:>17.4f} | {t_automaton:>13.4f} | {t_trie / t_automaton:>6.1f}x")
+
+def benchmark_pattern_scan(repeat: int = 3):
+    """
+    Throughput of matching the in-text patterns with one pass per pattern, with the
+    single-pass scanner and with the single-pass scanner on windows around the anchors
+    """
+    logging.info(f" {'length':>8} | {'per pattern (MB/s)':>18} | {'single pass (MB/s)':>18} | {'windowed (MB/s)':>15}")
+    logging.info(f" ---------+--------------------+--------------------+----------------")
+    for length in (10_000, 100_000, 1_000_000):
+        text = sample_text(length)
+        hits = find_aliases_in_text(text, use_trie=True)
+        scanner = get_alias_scanner(hits)
+        title_starts = [hit.start for hit in hits]
+
+        t_separate = _time(lambda: [list(pattern.finditer(text)) for pattern in scanner.patterns], repeat)
+        t_single = _time(lambda: scanner.scan(text, title_starts), repeat)
+        t_windowed = _time(lambda: scanner.scan(text, title_starts, get_windows(text, hits)), repeat)
+        logging.info(f" {length:>8} | {length / t_separate / 1e6:>18.2f} | {length / t_single / 1e6:>18.2f} | {length / t_windowed / 1e6:>15.2f}")
+
+def benchmark_alias_db(repeat: int = 3):
+    """
+    Latency and amount of aliases found of the database alias detection (use_trie=False)
+    with the LIKE query over every alias and with the n-gram lookup, against the automaton
+    """
+    # load the n-gram limits and automaton up front, so that only detection is measured
+    get_alias_ngram_limits()
+    get_automaton()
+
+    logging.info(f" {'length':>8} | {'like (s)':>8} | {'n-grams (s)':>11} | {'automaton (s)':>13} | {'aliases like/n-grams/automaton':>30}")
+    logging.info(f" ---------+----------+-------------+---------------+-------------------------------")
+    for length in (1_000, 10_000, 50_000):
+        text = sample_text(length)
+        t_like = _time(lambda: _find_aliases_like_query(text), repeat)
+        t_ngrams = _time(lambda: find_aliases_in_text(text), repeat)
+        t_automaton = _time(lambda: find_aliases_in_text(text, use_trie=True), repeat)
+        found = "/".join(str(len(hits)) for hits in (
+            _find_aliases_like_query(text),
+            find_aliases_in_text(text),
+            find_aliases_in_text(text, use_trie=True)
+        ))
+        logging.info(f" {length:>8} | {t_like:>8.4f} | {t_ngrams:>11.4f} | {t_automaton:>13.4f} | {found:>30}")
+
+def _memory() -> Dict[str, int]:
+    """
+    Resident and proportional (shared pages divided over the processes sharing them) set
+    size of this process in kB, Linux only
+    """
+    memory = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("Rss", "Pss"):
+                memory[key.lower()] = int(value.split()[0])
+    return memory
+
+def _first_request(barrier, queue):
+    start = perf_counter()
+    find_aliases_in_text(SAMPLE_TEXT, use_trie=True)
+    latency = perf_counter() - start
+    # measure once all workers have loaded, so that shared pages are divided between them
+    barrier.wait()
+    queue.put((latency, _memory()))
+    barrier.wait()
+
+def benchmark_preload(workers: int = 4):
+    """
+    Memory per worker and latency of the first request of forked workers, without and
+    with preloading the read-only data in the parent before forking
+    """
+    context = multiprocessing.get_context("fork")
+
+    logging.info(f" {'preload':>7} | {'first request (s)':>17} | {'rss (MB)':>8} | {'pss (MB)':>8}")
+    logging.info(f" --------+-------------------+----------+---------")
+    for preloaded in (False, True):
+        reset_trie()
+        if preloaded:
+            preload()
+
+        barrier = context.Barrier(workers)
+        queue = context.Queue()
+        processes = [context.Process(target=_first_request, args=(barrier, queue)) for _ in range(workers)]
+        for process in processes:
+            process.start()
+        measurements = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        latency = median(latency for latency, _ in measurements)
+        rss = median(memory["rss"] for _, memory in measurements) / 1024
+        pss = median(memory["pss"] for _, memory in measurements) / 1024
+        logging.info(f" {str(preloaded):>7} | {latency:>17.4f} | {rss:>8.1f} | {pss:>8.1f}")
+
+    gc.unfreeze()
+
+def benchmark_async(repeat: int = 3):
+    """
+    Latency of extracting the links of a citation-dense document with one query per
+    reference, with the batched queries and with concurrent queries over the async pool
+    """
+    get_automaton()
+
+    # every run resolves the references of the document again, instead of from the cache
+    def extract(text, batch):
+        invalidate_laws_cache()
+        extract_links(text, batch=batch)
+
+    async def extract_async(text, concurrency):
+        invalidate_laws_cache()
+        await extract_links_async(text, concurrency=concurrency)
+
+    async def run():
+        logging.info(f" {'length':>8} | {'sequential (s)':>14} | {'batched (s)':>11} | {'async x8 (s)':>12} | {'async x32 (s)':>13}")
+        logging.info(f" ---------+----------------+-------------+--------------+--------------")
+        for length in (1_000, 10_000, 50_000):
+            text = sample_text(length)
+            t_sequential = _time(lambda: extract(text, batch=False), repeat)
+            t_batched = _time(lambda: extract(text, batch=True), repeat)
+            timings = {}
+            for concurrency in (8, 32):
+                # warm up the pool, so that connecting is not measured
+                await extract_async(text, concurrency)
+                samples = []
+                for _ in range(repeat):
+                    start = perf_counter()
+                    await extract_async(text, concurrency)
+                    samples.append(perf_counter() - start)
+                timings[concurrency] = median(samples)
+            logging.info(f" {length:>8} | {t_sequential:>14.4f} | {t_batched:>11.4f} | {timings[8]:>12.4f} | {timings[32]:>13.4f}")
+        await close_async_pool()
+
+    asyncio.run(run())
+
+# titles of references that are not an alias themselves, as resolved by the fallback
+FALLBACK_TITLES = [
+    "Burgerlijk Wetboek Boek 7",
+    "Algemene wet bestuursrecht (Awb)",
+    "Wetboek van Strafrecht (oud)",
+    "Wft juncto het Bbpm",
+    "BW en de Awb",
+    "Vreemdelingenwet 2000 (Vw)",
+    "onbekende regeling",
+]
+
+def benchmark_longest_prefix(repeat: int = 3, amount: int = 200):
+    """
+    Latency of the longest-alias fallback: the ILIKE query per title and for all titles
+    at once, against the longest prefix of the title in the trie and payloads
+    """
+    titles = (FALLBACK_TITLES * (amount // len(FALLBACK_TITLES) + 1))[:amount]
+    # load the trie and payloads up front, so that only the lookups are measured
+    get_automaton()
+    get_alias_payloads()
+
+    t_query = _time(lambda: [_longest_alias_query(title) for title in titles], repeat)
+    t_batch_query = _time(lambda: _longest_aliases_query(titles), repeat)
+    t_prefix = _time(lambda: [_longest_alias_prefix(title) for title in titles], repeat)
+
+    # the fallback should resolve to the same laws, whichever way it is answered
+    differences = sum(
+        (query or {}).get('bwb_id') != (prefix or {}).get('bwb_id')
+        for query, prefix in zip(_longest_aliases_query(FALLBACK_TITLES), map(_longest_alias_prefix, FALLBACK_TITLES))
+    )
+
+    logging.info(f" {'method':>18} | {'per title (ms)':>14}")
+    logging.info(f" -------------------+---------------")
+    logging.info(f" {'query':>18} | {t_query / amount * 1000:>14.4f}")
+    logging.info(f" {'batched query':>18} | {t_batch_query / amount * 1000:>14.4f}")
+    logging.info(f" {'trie prefix':>18} | {t_prefix / amount * 1000:>14.4f}")
+    logging.info(f" {len(FALLBACK_TITLES) - differences}/{len(FALLBACK_TITLES)} titles resolve to the same law")
+
+# (fragments, alias) lookups of SAMPLE_TEXT, with different amounts of fragments
+PREPARED_LOOKUPS = [
+    ({'boek': '7', 'artikel': '658'}, 'bw'),
+    ({'artikel': '3:2'}, 'algemene wet bestuursrecht'),
+    ({'artikel': '10'}, 'wetboek van strafrecht'),
+    ({'artikel': '1:75', 'lid': '1'}, 'wft'),
+]
+
+def benchmark_prepared(repeat: int = 3, amount: int = 200):
+    """
+    Per-call latency of the hot queries sent as text on every call, against executing
+    them as prepared statements
+    """
+    lookups = [(get_fragment_tuples(fragments), alias) for fragments, alias in PREPARED_LOOKUPS]
+    lookups = (lookups * (amount // len(lookups) + 1))[:amount]
+    bwb_ids = {alias: get_alias_bwb_ids(alias) for _, alias in PREPARED_LOOKUPS}
+    titles = (FALLBACK_TITLES * (amount // len(FALLBACK_TITLES) + 1))[:amount]
+    queries = {
+        "find_laws (alias)": lambda: [_find_laws_query("find_laws", LAWS_QUERY, (*_laws_params(fragment_tuples), alias, None)) for fragment_tuples, alias in lookups],
+        "find_laws (bwb_ids)": lambda: [_find_laws_query("find_laws_bwb_ids", BWB_IDS_LAWS_QUERY, (*_laws_params(fragment_tuples), bwb_ids[alias])) for fragment_tuples, alias in lookups],
+        "longest alias": lambda: [_longest_alias_query(title) for title in titles],
+    }
+
+    prepared_statements = db.PREPARED_STATEMENTS
+    timings = {}
+    try:
+        for prepared in (False, True):
+            db.PREPARED_STATEMENTS = prepared
+            for name, run in queries.items():
+                # connect and prepare up front, so that only the calls are measured
+                run()
+                timings[name, prepared] = _time(run, repeat) / amount
+    finally:
+        db.PREPARED_STATEMENTS = prepared_statements
+
+    logging.info(f" {'query':>20} | {'text (ms)':>9} | {'prepared (ms)':>13} | {'speedup':>7}")
+    logging.info(f" ---------------------+-----------+---------------+--------")
+    for name in queries:
+        t_text, t_prepared = timings[name, False], timings[name, True]
+        logging.info(f" {name:>20} | {t_text * 1000:>9.4f} | {t_prepared * 1000:>13.4f} | {t_text / t_prepared:>6.1f}x")
+
+BENCHMARKS: Dict[str, Callable] = {
+    "alias-scan": benchmark_alias_scan,
+    "alias-db": benchmark_alias_db,
+    "pattern-scan": benchmark_pattern_scan,
+    "preload": benchmark_preload,
+    "async": benchmark_async,
+    "longest-prefix": benchmark_longest_prefix,
+    "prepared": benchmark_prepared,
+}
+
+def run_benchmark(name: str):
+    BENCHMARKS[name]()
@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Dict, Hashable
+
+_MISSING = object()
+
+class LRUCache:
+    """
+    Bounded, thread-safe least-recently-used cache with hit/miss/eviction counters.
+    With a ttl (in seconds), entries older than the ttl are treated as missing.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float | None = None):
+        assert maxsize > 0, "maxsize should be positive"
+        assert ttl is None or ttl > 0, "ttl should be positive"
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is not _MISSING and self.ttl is not None:
+                value, expires_at = value
+                if monotonic() >= expires_at:
+                    del self._data[key]
+                    self.expirations += 1
+                    value = _MISSING
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = value if self.ttl is None else (value, monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable):
+        return key in self._data
+
+    def info(self) -> Dict[str, int]:
+        with self._lock:
+            info = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+            if self.ttl is not None:
+                info["expirations"] = self.expirations
+            return info
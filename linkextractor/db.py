@@ -1,17 +1,439 @@
 import os
-from typing import Iterator
+import re
+import logging
+import threading
+from time import monotonic
+from typing import Dict, Iterator, List, Set, Tuple
+from weakref import WeakKeyDictionary
 import psycopg2
-from psycopg2.pool import SimpleConnectionPool
-from psycopg2.extensions import connection
+import psycopg2.errors
+from psycopg2.pool import PoolError
+from psycopg2.extensions import connection, TRANSACTION_STATUS_IDLE
 from contextlib import contextmanager
 from dotenv import load_dotenv
+from linkextractor import querylog
 load_dotenv()
 
 DB_URL = os.getenv("LINKEXTRACTOR_DB_URL")
 
+# pool configuration, can be overridden by the environment or by configure_pool()
+POOL_MIN_SIZE = int(os.getenv("LINKEXTRACTOR_DB_POOL_MIN", 1))
+POOL_MAX_SIZE = int(os.getenv("LINKEXTRACTOR_DB_POOL_MAX", 8))
+# seconds to wait for a free connection before giving up
+POOL_TIMEOUT = float(os.getenv("LINKEXTRACTOR_DB_POOL_TIMEOUT", 30))
+# idle connections older than this (in seconds) are pinged before being handed out
+POOL_HEALTHCHECK_AFTER = float(os.getenv("LINKEXTRACTOR_DB_POOL_HEALTHCHECK_AFTER", 30))
+
+# tcp keepalive settings passed to libpq, so that idle pooled connections are not
+# silently dropped by firewalls or NAT in between
+KEEPALIVE_KWARGS = {
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 3,
+}
+
+# run the hot queries as named prepared statements, disable when connecting through a
+# pooler that does not keep sessions (e.g. pgbouncer in transaction mode)
+PREPARED_STATEMENTS = os.getenv("LINKEXTRACTOR_DB_PREPARED_STATEMENTS", "1") != "0"
+
+def is_sqlite(url: str | None = None) -> bool:
+    """
+    True if the database url (by default DB_URL) points at a SQLite snapshot, see snapshot.py
+    """
+    url = url if url is not None else DB_URL
+    return url is not None and url.startswith("sqlite:")
+
 def set_db_url(_db_url):
     global DB_URL
     DB_URL = _db_url
+    close_pool()
+
+def configure_pool(min_size: int | None = None, max_size: int | None = None,
+                   timeout: float | None = None, healthcheck_after: float | None = None):
+    """
+    Override the pool configuration. The current pool (if any) is closed and a new
+    one is created with the new settings on the next call to get_conn().
+    """
+    global POOL_MIN_SIZE, POOL_MAX_SIZE, POOL_TIMEOUT, POOL_HEALTHCHECK_AFTER
+    if min_size is not None: POOL_MIN_SIZE = min_size
+    if max_size is not None: POOL_MAX_SIZE = max_size
+    if timeout is not None: POOL_TIMEOUT = timeout
+    if healthcheck_after is not None: POOL_HEALTHCHECK_AFTER = healthcheck_after
+    close_pool()
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections.
+
+    Connections are created lazily up to `max_size`; when all of them are borrowed,
+    callers block (up to `timeout` seconds) until one is returned. Idle connections
+    that have not been used for `healthcheck_after` seconds are pinged before they
+    are handed out, and broken connections are replaced transparently.
+    """
+
+    def __init__(self, dsn, min_size=1, max_size=8, timeout=30.0, healthcheck_after=30.0):
+        assert 0 <= min_size <= max_size and max_size > 0, "invalid pool size"
+
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.healthcheck_after = healthcheck_after
+        self.pid = os.getpid()
+
+        self._cond = threading.Condition()
+        self._idle: List[Tuple[connection, float]] = []
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+
+        # statistics
+        self._created = monotonic()
+        self._last_change = self._created
+        self._in_use_integral = 0.0
+        self._peak_in_use = 0
+        self._borrows = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        self._connects = 0
+        self._discarded = 0
+
+        for _ in range(min_size):
+            self._idle.append((self._connect(), monotonic()))
+            self._size += 1
+
+    def _connect(self) -> connection:
+        conn = psycopg2.connect(self.dsn, connect_timeout=5, **KEEPALIVE_KWARGS)
+        # the condition's lock is reentrant, _close is also called with it held
+        with self._cond:
+            self._connects += 1
+        return conn
+
+    def _account(self):
+        # integrate the amount of borrowed connections over time (caller holds the lock)
+        now = monotonic()
+        self._in_use_integral += self._in_use * (now - self._last_change)
+        self._last_change = now
+
+    def _is_healthy(self, conn: connection, returned_at: float) -> bool:
+        if conn.closed:
+            return False
+        if monotonic() - returned_at < self.healthcheck_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _close(self, conn: connection):
+        with self._cond:
+            self._discarded += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self) -> connection:
+        """
+        Borrow a connection, waiting for one to become available if the pool is exhausted.
+        """
+        start = monotonic()
+        deadline = start + self.timeout
+        conn = None
+        returned_at = 0.0
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolError(f"no connection available within {self.timeout}s (max_size={self.max_size})")
+                self._cond.wait(remaining)
+
+            waited = monotonic() - start
+            self._account()
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+            self._borrows += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            if waited > 0.001:
+                self._waits += 1
+
+        # connecting and health checking happens outside of the lock
+        try:
+            if conn is not None and not self._is_healthy(conn, returned_at):
+                logging.debug("discarding unhealthy pooled connection")
+                self._close(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except BaseException:
+            with self._cond:
+                self._account()
+                self._in_use -= 1
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        return conn
+
+    def putconn(self, conn: connection, discard: bool = False):
+        """
+        Return a borrowed connection. Connections that are closed, broken or still in
+        a transaction that can not be rolled back are discarded instead of reused.
+        """
+        if not discard and not conn.closed and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        if discard or conn.closed:
+            self._close(conn)
+            conn = None
+
+        with self._cond:
+            self._account()
+            self._in_use -= 1
+            if conn is None or self._closed:
+                self._size -= 1
+                if conn is not None:
+                    self._close(conn)
+            else:
+                self._idle.append((conn, monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._close(conn)
+            self._size -= len(self._idle)
+            self._idle = []
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            self._account()
+            elapsed = self._last_change - self._created
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "peak_in_use": self._peak_in_use,
+                # current and time-averaged share of max_size that is borrowed
+                "utilisation": self._in_use / self.max_size,
+                "utilisation_avg": self._in_use_integral / (elapsed * self.max_size) if elapsed > 0 else 0.0,
+                "borrows": self._borrows,
+                "waits": self._waits,
+                "wait_time_total": self._wait_total,
+                "wait_time_avg": self._wait_total / self._borrows if self._borrows else 0.0,
+                "wait_time_max": self._wait_max,
+                "timeouts": self._timeouts,
+                "connects": self._connects,
+                "discarded": self._discarded,
+            }
+
+_POOL: ConnectionPool | None = None
+_POOL_LOCK = threading.Lock()
+# pools inherited from a parent process, see _reset_after_fork
+_INHERITED_POOLS: List[ConnectionPool] = []
+
+def _reset_after_fork():
+    """
+    Forget the pool inherited from the parent process. The inherited connections share
+    their sockets with the parent, so they are kept referenced and never closed here:
+    closing (or garbage collecting) them would terminate the parent's sessions.
+    """
+    global _POOL, _POOL_LOCK
+    _POOL_LOCK = threading.Lock()
+    if _POOL is not None:
+        _INHERITED_POOLS.append(_POOL)
+        _POOL = None
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def get_pool() -> ConnectionPool:
+    global _POOL
+    pool = _POOL
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+
+    if is_sqlite():
+        raise RuntimeError(f"{DB_URL} is a SQLite snapshot, which does not support this query")
+
+    with _POOL_LOCK:
+        if _POOL is not None and _POOL.pid != os.getpid():
+            # forked without the at-fork hook having run
+            _reset_after_fork()
+        if _POOL is None:
+            _POOL = ConnectionPool(
+                DB_URL,
+                min_size=POOL_MIN_SIZE,
+                max_size=POOL_MAX_SIZE,
+                timeout=POOL_TIMEOUT,
+                healthcheck_after=POOL_HEALTHCHECK_AFTER
+            )
+        return _POOL
+
+def close_pool():
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None and _POOL.pid == os.getpid():
+            _POOL.closeall()
+        _POOL = None
+
+def get_pool_stats() -> Dict[str, float]:
+    """
+    Returns wait time and utilisation statistics of the connection pool of this process
+    """
+    if _POOL is None or _POOL.pid != os.getpid():
+        return {}
+    return _POOL.stats()
+
+@contextmanager
+def get_conn() -> Iterator[connection]:
+    """
+    Borrow a connection from the pool for the duration of the with-block. The
+    transaction is committed when the block succeeds and rolled back otherwise, after
+    which the connection is returned to the pool.
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    discard = False
+    try:
+        yield conn
+        conn.commit()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        # the connection is broken, rolling back would only replace the error
+        discard = True
+        raise
+    except BaseException:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            discard = True
+        raise
+    finally:
+        pool.putconn(conn, discard=discard)
+
+# names of the statements prepared on each connection, a new connection (e.g. after a
+# reconnect) starts without any
+_PREPARED: "WeakKeyDictionary[connection, Set[str]]" = WeakKeyDictionary()
+
+def _inline_parameters(query: str) -> str:
+    """
+    Query with $n parameters as a psycopg2 query with %(n)s parameters
+    """
+    return re.sub(r"\$(\d+)", r"%(\1)s", query.replace("%", "%%"))
+
+def _execute_prepared(cur, name: str, query: str, params: tuple, prefix: str = ""):
+    if not PREPARED_STATEMENTS:
+        cur.execute(prefix + _inline_parameters(query), {str(i): param for i, param in enumerate(params, 1)})
+        return
+
+    statement = f"linkextractor_{name}"
+    execute = f"{prefix}EXECUTE {statement} ({', '.join(['%s'] * len(params))})" if len(params) > 0 else f"{prefix}EXECUTE {statement}"
+    # in a transaction that already ran statements, a failing EXECUTE is rolled back to a
+    # savepoint, so that the transaction of the caller can continue
+    savepoint = cur.connection.get_transaction_status() != TRANSACTION_STATUS_IDLE
+    prepared = _PREPARED.setdefault(cur.connection, set())
+    if statement not in prepared:
+        cur.execute(f"PREPARE {statement} AS {query}")
+        prepared.add(statement)
+    if savepoint:
+        cur.execute("SAVEPOINT linkextractor_prepared")
+    try:
+        cur.execute(execute, params)
+    except psycopg2.errors.InvalidSqlStatementName:
+        # the session lost the prepared statement (e.g. DISCARD ALL by a pooler)
+        logging.debug("re-preparing %s", statement)
+        if savepoint:
+            cur.execute("ROLLBACK TO SAVEPOINT linkextractor_prepared")
+        else:
+            cur.connection.rollback()
+        cur.execute(f"PREPARE {statement} AS {query}")
+        cur.execute(execute, params)
+    if savepoint:
+        # on a cursor of its own, so that the rows of the EXECUTE are kept
+        with cur.connection.cursor() as release_cur:
+            release_cur.execute("RELEASE SAVEPOINT linkextractor_prepared")
+
+def execute_prepared(cur, name: str, query: str, params: tuple, prefix: str = ""):
+    """
+    Execute a query with $n parameters as the prepared statement `linkextractor_{name}`
+    of the connection of the cursor, which is prepared on its first use on that
+    connection. prefix (e.g. "EXPLAIN ") is put in front of the EXECUTE. With
+    PREPARED_STATEMENTS disabled the query is sent as is. Executions without a prefix
+    are recorded under name, see querylog.py.
+    """
+    if prefix:
+        _execute_prepared(cur, name, query, params, prefix)
+        return
+
+    start = monotonic()
+    _execute_prepared(cur, name, query, params)
+    _record(cur, name, monotonic() - start, query, params,
+            lambda explain_cur: _execute_prepared(explain_cur, name, query, params, prefix=_EXPLAIN))
+
+def execute(cur, name: str, query: str, params=None):
+    """
+    cur.execute(query, params), recorded under name, see querylog.py
+    """
+    start = monotonic()
+    cur.execute(query, params)
+    _record(cur, name, monotonic() - start, query, params,
+            lambda explain_cur: explain_cur.execute(_EXPLAIN + query, params))
+
+_EXPLAIN = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+
+def _record(cur, name: str, duration: float, query: str, params, explain):
+    """
+    Record the execution of a query, and log it with its (sampled) plan when it was slow
+    """
+    rows = cur.rowcount
+    logging.debug("time query %s: %s", name, duration)
+    if not querylog.record(name, duration, rows):
+        return
+    plan = _explain(cur.connection, explain) if querylog.should_explain(name) else None
+    querylog.log_slow_query(name, duration, rows, query, params, plan)
 
-def get_conn():
-    return psycopg2.connect(DB_URL, connect_timeout=5)
\ No newline at end of file
+def _explain(conn: connection, explain):
+    """
+    Plan of a query (run again with EXPLAIN ANALYZE) on a separate cursor, so that the
+    rows of the cursor of the query are kept. In a transaction a failing EXPLAIN is
+    rolled back to a savepoint, so that the transaction can continue.
+    """
+    savepoint = not conn.autocommit
+    with conn.cursor() as cur:
+        try:
+            if savepoint:
+                cur.execute("SAVEPOINT linkextractor_explain")
+            explain(cur)
+            plan = cur.fetchone()[0]
+            if savepoint:
+                cur.execute("RELEASE SAVEPOINT linkextractor_explain")
+            return plan
+        except psycopg2.Error as e:
+            logging.debug("could not explain slow query: %s", e)
+            if savepoint:
+                cur.execute("ROLLBACK TO SAVEPOINT linkextractor_explain")
+            return None
@@ -0,0 +1,298 @@
+"""
+Compiled, memory-mapped index of `law_alias` and `law_element` that answers
+find_laws() without a round trip to the database.
+
+The index file consists of a header followed by two sorted tables:
+
+- aliases:  lower(alias)                    -> [bwb_id, ...]
+- elements: bwb_id, type, lower(number)     -> [[type, number, bwb_label_id, title], ...]
+
+Only elements of laws that have at least one alias are stored, which mirrors the
+join on `law_alias` in the SQL version of find_laws. The file is opened with mmap,
+so processes that are forked after loading (or that load the same file) share the
+pages instead of each holding a private copy.
+"""
+
+import json
+import logging
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+from time import time
+from typing import Dict, List, Tuple
+
+import psycopg2
+
+from linkextractor.db import get_conn, is_sqlite
+
+_LAW_INDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "laws.index")
+
+# verify the fingerprint of the index against the database when it is loaded
+LAW_INDEX_VERIFY = os.getenv("LINKEXTRACTOR_LAW_INDEX_VERIFY", "1") not in ("0", "false", "no")
+
+MAGIC = b"LXLI"
+# 2: elements ordered by bwb_label_id, fingerprint with checksums
+VERSION = 2
+
+_HEADER = struct.Struct("<4sIIQQ")  # magic, version, fingerprint length, aliases offset, elements offset
+_U32 = struct.Struct("<I")
+_U32x2 = struct.Struct("<II")
+
+# separator between the parts of an element key, does not occur in ids, types or numbers
+_SEP = "\x1f"
+
+def get_data_fingerprint(cur) -> str:
+    """
+    Fingerprint of the contents of `law_alias` and `law_element`, used to detect
+    whether a compiled index is stale. Like watcher.get_alias_fingerprint, the checksums
+    also catch updates that do not change the amount of rows or the highest id.
+    """
+    cur.execute("""
+        SELECT
+            (SELECT COUNT(*) FROM law_alias), (SELECT MAX(id) FROM law_alias),
+            (SELECT COUNT(*) FROM law_element), (SELECT MAX(id) FROM law_element),
+            (SELECT COALESCE(SUM(hashtext(alias || ':' || bwb_id)), 0) FROM law_alias),
+            (SELECT COALESCE(SUM(hashtext(concat_ws(':', bwb_id, type, number, bwb_label_id, title))), 0) FROM law_element)
+    """)
+    return ":".join(str(v) for v in cur.fetchone())
+
+def _pack_table(entries: Dict[bytes, bytes]) -> bytes:
+    keys = sorted(entries)
+    key_offsets = [0]
+    value_offsets = [0]
+    for key in keys:
+        key_offsets.append(key_offsets[-1] + len(key))
+        value_offsets.append(value_offsets[-1] + len(entries[key]))
+
+    return b"".join([
+        _U32.pack(len(keys)),
+        struct.pack(f"<{len(key_offsets)}I", *key_offsets),
+        struct.pack(f"<{len(value_offsets)}I", *value_offsets),
+        b"".join(keys),
+        b"".join(entries[key] for key in keys),
+    ])
+
+def write_law_index(path: str, fingerprint: str, alias_rows, element_rows):
+    """
+    Write an index file from (alias, bwb_id) and (bwb_id, type, number, bwb_label_id, title) rows.
+    The file is written next to its destination and moved in place atomically.
+    """
+    aliases: Dict[str, List[str]] = {}
+    for alias, bwb_id in alias_rows:
+        bwb_ids = aliases.setdefault(str(alias).lower(), [])
+        if bwb_id not in bwb_ids:
+            bwb_ids.append(bwb_id)
+    aliased_bwb_ids = {bwb_id for bwb_ids in aliases.values() for bwb_id in bwb_ids}
+
+    elements: Dict[str, List[list]] = {}
+    for bwb_id, type, number, bwb_label_id, title in element_rows:
+        if bwb_id not in aliased_bwb_ids or number is None:
+            continue
+        key = _SEP.join((bwb_id, type, str(number).lower()))
+        rows = elements.setdefault(key, [])
+        row = [type, number, bwb_label_id, title]
+        if row not in rows:
+            rows.append(row)
+
+    def encode(value) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    # in the order of LAWS_QUERY: by bwb_id (the candidates), then by bwb_label_id
+    for rows in elements.values():
+        rows.sort(key=lambda row: (row[2] is None, row[2] or 0))
+
+    aliases_table = _pack_table({k.encode("utf-8"): encode(sorted(v)) for k, v in aliases.items()})
+    elements_table = _pack_table({k.encode("utf-8"): encode(v) for k, v in elements.items()})
+
+    fingerprint_bytes = fingerprint.encode("utf-8")
+    aliases_offset = _HEADER.size + len(fingerprint_bytes)
+    elements_offset = aliases_offset + len(aliases_table)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(fingerprint_bytes), aliases_offset, elements_offset))
+        f.write(fingerprint_bytes)
+        f.write(aliases_table)
+        f.write(elements_table)
+    os.replace(tmp_path, path)
+
+def build_law_index(path: str | None = None) -> str:
+    """
+    Compile `law_alias` and `law_element` from the database into an index file
+    """
+    if path is None:
+        path = _LAW_INDEX_PATH
+
+    start = time()
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            fingerprint = get_data_fingerprint(cur)
+            cur.execute("SELECT alias, bwb_id FROM law_alias")
+            alias_rows = cur.fetchall()
+
+        # stream law_element through a server-side cursor, it is by far the largest table
+        with conn.cursor(name="linkextractor_law_index") as cur:
+            cur.itersize = 50000
+            cur.execute("""
+                SELECT bwb_id, type, number, bwb_label_id, title
+                FROM law_element
+                WHERE bwb_id IN (SELECT bwb_id FROM law_alias)
+            """)
+            write_law_index(path, fingerprint, alias_rows, cur)
+
+    logging.debug("time building law index: %s", time() - start)
+    return path
+
+class LawIndex:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, fingerprint_len, aliases_offset, elements_offset = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a law index of version {VERSION}")
+
+        self.path = path
+        self.fingerprint = self._mm[_HEADER.size:_HEADER.size + fingerprint_len].decode("utf-8")
+        self._aliases = self._read_table(aliases_offset)
+        self._elements = self._read_table(elements_offset)
+
+    def _read_table(self, offset: int) -> Tuple[int, int, int, int, int]:
+        (n,) = _U32.unpack_from(self._mm, offset)
+        key_offsets = offset + _U32.size
+        value_offsets = key_offsets + (n + 1) * 4
+        (keys_size,) = _U32.unpack_from(self._mm, value_offsets - 4)
+        (values_size,) = _U32.unpack_from(self._mm, value_offsets + n * 4)
+        keys = value_offsets + (n + 1) * 4
+        values = keys + keys_size
+        assert values + values_size <= len(self._mm), "law index is truncated"
+        return n, key_offsets, value_offsets, keys, values
+
+    def _get(self, table, key: str):
+        n, key_offsets, value_offsets, keys, values = table
+        mm = self._mm
+        needle = key.encode("utf-8")
+
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start, end = _U32x2.unpack_from(mm, key_offsets + mid * 4)
+            candidate = mm[keys + start:keys + end]
+            if candidate < needle:
+                lo = mid + 1
+            elif candidate > needle:
+                hi = mid
+            else:
+                start, end = _U32x2.unpack_from(mm, value_offsets + mid * 4)
+                return json.loads(mm[values + start:values + end])
+        return None
+
+    def __len__(self):
+        return self._aliases[0] + self._elements[0]
+
+    def get_alias_bwb_ids(self, alias: str) -> List[str]:
+        return self._get(self._aliases, alias.lower()) or []
+
+    def get_elements(self, bwb_id: str, type: str, number: str) -> List[list]:
+        return self._get(self._elements, _SEP.join((bwb_id, type, number))) or []
+
+    def find_laws(self, fragment_tuples: List[Tuple[str, str]], alias: str | None = None, bwb_id: str | None = None):
+        """
+        Equivalent of utils.find_laws for fragment tuples that are already normalised
+        (lowercased numbers, ordered from broad to narrow).
+        """
+        if alias is not None:
+            candidates = self.get_alias_bwb_ids(alias)
+        else:
+            candidates = [bwb_id]
+
+        narrow_fragment_type, narrow_fragment_number = fragment_tuples[-1]
+
+        results = []
+        for candidate in candidates:
+            # every fragment must exist within the law
+            if not all(self._get(self._elements, _SEP.join((candidate, type, number))) is not None
+                       for type, number in fragment_tuples[:-1]):
+                continue
+            for type, number, bwb_label_id, title in self.get_elements(candidate, narrow_fragment_type, narrow_fragment_number):
+                results.append({
+                    'type': type,
+                    'number': number,
+                    'bwb_id': candidate,
+                    'bwb_label_id': bwb_label_id,
+                    'title': title,
+                })
+        return results
+
+    def close(self):
+        self._mm.close()
+
+_LAW_INDEX_CACHE: LawIndex | None = None
+_LAW_INDEX_LOADED = False
+# held while loading, so concurrent callers wait for the index instead of getting None
+_LAW_INDEX_LOCK = threading.Lock()
+
+def _reset_lock_after_fork():
+    global _LAW_INDEX_LOCK
+    _LAW_INDEX_LOCK = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_lock_after_fork)
+
+def _load_law_index() -> LawIndex | None:
+    path = _LAW_INDEX_PATH
+    if not os.path.exists(path):
+        logging.debug("no law index at %s, resolving laws via the database", path)
+        return None
+
+    start = time()
+    try:
+        index = LawIndex(path)
+    except (ValueError, AssertionError, struct.error) as e:
+        logging.warning("ignoring unreadable law index %s: %s", path, e)
+        return None
+
+    if LAW_INDEX_VERIFY:
+        try:
+            if is_sqlite():
+                from linkextractor.snapshot import get_metadata
+                fingerprint = get_metadata().get("fingerprint")
+            else:
+                with get_conn() as conn:
+                    with conn.cursor() as cur:
+                        fingerprint = get_data_fingerprint(cur)
+            if fingerprint != index.fingerprint:
+                logging.warning("law index %s is stale, resolving laws via the database (rebuild with `linkextractor index`)", path)
+                index.close()
+                return None
+        except (psycopg2.Error, sqlite3.Error, FileNotFoundError) as e:
+            logging.debug("could not verify law index against the database: %s", e)
+
+    logging.debug("time loading law index: %s", time() - start)
+    return index
+
+def get_law_index() -> LawIndex | None:
+    """
+    Returns the compiled law index, or None if it has not been built or is stale, in
+    which case callers should fall back to querying the database.
+    """
+    global _LAW_INDEX_CACHE, _LAW_INDEX_LOADED
+
+    if _LAW_INDEX_LOADED:
+        return _LAW_INDEX_CACHE
+    with _LAW_INDEX_LOCK:
+        if not _LAW_INDEX_LOADED:
+            _LAW_INDEX_CACHE = _load_law_index()
+            _LAW_INDEX_LOADED = True
+        return _LAW_INDEX_CACHE
+
+def reset_law_index():
+    """
+    Forget the loaded index, it will be (re)loaded on the next call to get_law_index()
+    """
+    global _LAW_INDEX_CACHE, _LAW_INDEX_LOADED
+    with _LAW_INDEX_LOCK:
+        _LAW_INDEX_CACHE = None
+        _LAW_INDEX_LOADED = False
@@ -1,10 +1,18 @@
 from linkextractor.analyze.method_2 import analyze_2
 from linkextractor.analyze.prepare import prepare, prepare_specific
 from linkextractor.db import set_db_url
+from linkextractor.law_index import build_law_index
 from linkextractor.search import extract_links
 from linkextractor.utils import get_cases_by_bwb_and_label_id
 from linkextractor.analyze.method_1 import analyze
 from linkextractor.test_queries import test_queries
+from linkextractor.batch import extract_jsonl
+from linkextractor.benchmark import BENCHMARKS, run_benchmark
+from linkextractor.querylog import summarise_slow_queries
+from linkextractor.schema import prepare_database
+from linkextractor.server import serve
+from linkextractor.snapshot import export_snapshot
+from linkextractor.watcher import AliasIndexWatcher, install_notify_trigger, start_alias_watcher
 import sys
 import logging
 
@@ -19,9 +27,27 @@ from time import time
 
 
 script_dir = pathlib.Path(__file__).parent.resolve()
+# paths given on the command line are relative to the directory linkextractor is run from
+invocation_dir = os.getcwd()
 os.chdir(script_dir)
 # end set wrkdir
 
+# options of the subcommands that are paths
+PATH_OPTIONS = ("file", "output", "socket")
+
+def resolve_path(path: str) -> str:
+    """
+    Path relative to the directory linkextractor is run from instead of the working
+    directory (the package directory)
+    """
+    return os.path.join(invocation_dir, os.path.expanduser(path))
+
+def resolve_database(url: str) -> str:
+    # sqlite:///laws.sqlite is relative, see snapshot.get_snapshot_path
+    if url.startswith("sqlite:///") and not url.startswith("sqlite:////"):
+        return "sqlite:///" + resolve_path(url[len("sqlite:///"):])
+    return url
+
 def main():
     # Global parser with args for every parser
     parent_parser = argparse.ArgumentParser(add_help=False)
@@ -51,6 +77,15 @@ def main():
     )
     eval.add_argument("-e", "--exact", help="match exact", action=argparse.BooleanOptionalAction)
     eval.add_argument("-n", "--no-trie", help="do not use trie for finding aliases", action=argparse.BooleanOptionalAction)
+    eval.add_argument("-w", "--windowed", help="only match patterns on windows around indicators and aliases", action=argparse.BooleanOptionalAction)
+    eval.add_argument("--compare", help="compare the windowed scan against the full scan", action=argparse.BooleanOptionalAction)
+    eval.add_argument("-l", "--longest", help="of overlapping matches only keep the longest", action=argparse.BooleanOptionalAction)
+    eval.add_argument("-b", "--batch", help="read JSONL documents ({\"id\": ..., \"text\": ...}) and write JSONL results", action="store_true")
+    eval.add_argument("-f", "--file", help="file to read the JSONL documents from (with --batch, defaults to stdin)", type=str)
+    eval.add_argument("--workers", help="amount of worker processes (with --batch, defaults to the amount of CPUs)", type=int)
+    eval.add_argument("--chunk-size", help="documents per chunk sent to a worker (with --batch)", type=int, default=16)
+    eval.add_argument("--unordered", help="write results as they complete instead of in input order (with --batch)", action="store_true")
+    eval.add_argument("--progress-interval", help="seconds between throughput summaries on stderr (with --batch)", type=float, default=10.0)
     eval.add_argument("text", nargs="?", help="text to parse from", type=str)
 
     parser_test = subparsers.add_parser(
@@ -59,6 +94,70 @@ def main():
         parents=[parent_parser]
     )
 
+    parser_bench = subparsers.add_parser(
+        "bench",
+        help="benchmark parts of the extraction pipeline",
+        parents=[parent_parser]
+    )
+    parser_bench.add_argument("name", choices=sorted(BENCHMARKS), help="benchmark to run")
+
+    parser_index = subparsers.add_parser(
+        "index",
+        help="compile law aliases and elements from db into the law index used for resolving references",
+        parents=[parent_parser]
+    )
+    parser_index.add_argument("-o", "--output", help="path of the index file (defaults to laws.index in the project root)", type=str)
+
+    parser_export = subparsers.add_parser(
+        "export",
+        help="snapshot law aliases and elements from db into a SQLite file, used with -d sqlite:///path",
+        parents=[parent_parser]
+    )
+    parser_export.add_argument("-o", "--output", help="path of the snapshot (defaults to laws.sqlite in the project root)", type=str)
+    parser_export.add_argument("--cases", help="include the amount of cases per law element", action="store_true")
+
+    parser_db = subparsers.add_parser(
+        "db",
+        help="manage the database used for resolving references",
+        parents=[parent_parser]
+    )
+    db_subparsers = parser_db.add_subparsers(dest="db_command", required=True)
+    parser_db_prepare = db_subparsers.add_parser(
+        "prepare",
+        help="create the indexes the lookups need, analyze the tables and show the query costs before and after",
+        parents=[parent_parser]
+    )
+    parser_db_prepare.add_argument("--dry-run", help="only show the statements that would be run", action="store_true")
+    parser_db_slow = db_subparsers.add_parser(
+        "slow-queries",
+        help="summarise the slow-query log per query",
+        parents=[parent_parser]
+    )
+    parser_db_slow.add_argument("-f", "--file", help="path of the log (defaults to LINKEXTRACTOR_SLOW_QUERY_LOG)", type=str)
+    parser_db_slow.add_argument("--show", help="also show the parameters and plan of the slowest queries", type=int, default=0)
+
+    parser_watch = subparsers.add_parser(
+        "watch",
+        help="rebuild the alias index whenever law_alias changes",
+        parents=[parent_parser]
+    )
+    parser_watch.add_argument("-i", "--interval", help="seconds between fingerprint checks", type=float)
+    parser_watch.add_argument("--poll", help="only poll the fingerprint, do not listen for notifications", action="store_true")
+    parser_watch.add_argument("--install-trigger", help="install the trigger on law_alias that notifies the watchers, and exit", action="store_true")
+
+    parser_serve = subparsers.add_parser(
+        "serve",
+        help="serve extraction over local HTTP or a Unix socket, with warm caches and connections",
+        parents=[parent_parser]
+    )
+    parser_serve.add_argument("--host", help="address to listen on", type=str, default="127.0.0.1")
+    parser_serve.add_argument("-p", "--port", help="port to listen on", type=int, default=8080)
+    parser_serve.add_argument("-s", "--socket", help="listen on this Unix socket instead of a port", type=str)
+    parser_serve.add_argument("--workers", help="requests extracted at the same time (defaults to the pool size)", type=int)
+    parser_serve.add_argument("--queue-size", help="requests waiting for a worker before new requests get a 503", type=int)
+    parser_serve.add_argument("-n", "--no-trie", help="do not use trie for finding aliases", action="store_true")
+    parser_serve.add_argument("--watch", help="rebuild the alias index whenever law_alias changes", action="store_true")
+
     parser_analyze = subparsers.add_parser(
         "analyze",
         help="run pipeline for analysis of texts from db",
@@ -78,14 +177,36 @@ def main():
         format="%(levelname)s: %(message)s" 
     )
 
+    for option in PATH_OPTIONS:
+        if getattr(args, option, None) is not None:
+            setattr(args, option, resolve_path(getattr(args, option)))
+
     if args.database is not None:
-        set_db_url(args.database)
+        set_db_url(resolve_database(args.database))
 
     if len(sys.argv)==1:
         parser.print_help()
         sys.exit(0)
 
-    if args.command == "eval":
+    if args.command == "eval" and args.batch:
+        use_trie = not args.no_trie
+        kwargs = {"exact": True} if args.exact else {"windowed": bool(args.windowed), "longest": bool(args.longest)}
+        input_file = open(args.file, encoding="utf-8") if args.file is not None else sys.stdin
+        try:
+            extract_jsonl(
+                input_file, sys.stdout,
+                progress_interval=args.progress_interval,
+                workers=args.workers,
+                chunk_size=args.chunk_size,
+                ordered=not args.unordered,
+                use_trie=use_trie,
+                **kwargs
+            )
+        finally:
+            if input_file is not sys.stdin:
+                input_file.close()
+
+    elif args.command == "eval":
         if args.text is None:
             args.text = sys.stdin.read()
         if args.text is None:
@@ -101,7 +222,7 @@ def main():
         if args.exact:
             results = extract_links(args.text, exact=True, use_trie=use_trie)
         else:
-            results = extract_links(args.text, exact=False, use_trie=use_trie)
+            results = extract_links(args.text, exact=False, use_trie=use_trie, windowed=bool(args.windowed), compare=bool(args.compare), longest=bool(args.longest))
 
         logging.debug("found %s results in %ss", len(results), round(time()-start, 3))
         for result in results:
@@ -111,6 +232,42 @@ def main():
     elif args.command == "test":
         test_queries()
 
+    elif args.command == "bench":
+        run_benchmark(args.name)
+
+    elif args.command == "index":
+        start = time()
+        path = build_law_index(args.output)
+        logging.info("law index written to %s in %ss", path, round(time()-start, 3))
+
+    elif args.command == "export":
+        start = time()
+        path = export_snapshot(args.output, cases=args.cases)
+        logging.info("snapshot written to %s in %ss", path, round(time()-start, 3))
+
+    elif args.command == "db" and args.db_command == "prepare":
+        start = time()
+        prepare_database(dry_run=args.dry_run)
+        logging.info("prepared database in %ss", round(time()-start, 3))
+
+    elif args.command == "db" and args.db_command == "slow-queries":
+        summarise_slow_queries(args.file, show=args.show)
+
+    elif args.command == "watch":
+        if args.install_trigger:
+            install_notify_trigger()
+            logging.info("installed notify trigger on law_alias")
+        else:
+            try:
+                AliasIndexWatcher(args.interval, listen=not args.poll).run()
+            except KeyboardInterrupt:
+                pass
+
+    elif args.command == "serve":
+        if args.watch:
+            start_alias_watcher()
+        serve(args.host, args.port, args.socket, args.workers, args.queue_size, use_trie=not args.no_trie)
+
     elif args.command == "analyze":
         if args.samples is not None and args.prepare is None:
             parser.error("argument -n/--samples requires -p/--prepare")
@@ -0,0 +1,126 @@
+"""
+Per-stage timings and counters of extract_links. Every call fills an ExtractStats (pass
+one to extract_links to read it) and adds it to the counters of this process, which are
+dumped as JSON (get_metrics) or in the Prometheus text format (format_prometheus), e.g.
+by `GET /metrics` of `linkextractor serve`.
+"""
+
+import threading
+from bisect import bisect_left
+from typing import Dict, List
+
+from linkextractor.querylog import BUCKETS, get_query_stats
+
+# stages of extract_links, in order
+STAGES = ("aliases", "compile", "match", "fix_matches", "resolve")
+# counts of extract_links: the alias hits, matches, sub-matches (lookups), queries
+# (psycopg2, see querylog), lookups answered by the laws cache and document size
+COUNTS = ("aliases", "matches", "sub_matches", "queries", "cache_hits", "characters")
+
+class ExtractStats:
+    """
+    Timings (in seconds) per stage and counts of a single extract_links call
+    """
+    __slots__ = ("times", "counts")
+
+    def __init__(self):
+        self.times: Dict[str, float] = dict.fromkeys(STAGES, 0.0)
+        self.counts: Dict[str, int] = dict.fromkeys(COUNTS, 0)
+
+    @property
+    def total(self) -> float:
+        return sum(self.times.values())
+
+    def as_dict(self) -> dict:
+        return {"times": dict(self.times), "total": self.total, "counts": dict(self.counts)}
+
+    def __repr__(self):
+        times = ", ".join(f"{stage} {seconds:.4f}s" for stage, seconds in self.times.items())
+        counts = ", ".join(f"{name} {count}" for name, count in self.counts.items())
+        return f"ExtractStats({times}; {counts})"
+
+class _Totals:
+    def __init__(self):
+        self.documents = 0
+        self.times = dict.fromkeys(STAGES, 0.0)
+        self.counts = dict.fromkeys(COUNTS, 0)
+        self.buckets = [0 for _ in BUCKETS]
+
+_TOTALS = _Totals()
+_TOTALS_LOCK = threading.Lock()
+
+def record(stats: ExtractStats):
+    """
+    Add the stats of an extract_links call to the counters of this process
+    """
+    total = stats.total
+    with _TOTALS_LOCK:
+        _TOTALS.documents += 1
+        for stage, seconds in stats.times.items():
+            _TOTALS.times[stage] += seconds
+        for name, count in stats.counts.items():
+            _TOTALS.counts[name] += count
+        _TOTALS.buckets[bisect_left(BUCKETS, total)] += 1
+
+def get_metrics() -> dict:
+    """
+    Counters of the extract_links calls of this process: the amount of documents, the
+    total seconds per stage, the total counts and a cumulative histogram of the duration
+    """
+    with _TOTALS_LOCK:
+        return {
+            "documents": _TOTALS.documents,
+            "times": dict(_TOTALS.times),
+            "counts": dict(_TOTALS.counts),
+            "buckets": {
+                str(bound): sum(_TOTALS.buckets[:i + 1])
+                for i, bound in enumerate(BUCKETS)
+            },
+        }
+
+def reset_metrics():
+    global _TOTALS
+    with _TOTALS_LOCK:
+        _TOTALS = _Totals()
+
+def _bound(bound: str) -> str:
+    return "+Inf" if bound == "inf" else bound
+
+def format_prometheus() -> str:
+    """
+    The counters of get_metrics and the query histograms of querylog in the Prometheus
+    text exposition format
+    """
+    metrics = get_metrics()
+    lines: List[str] = []
+
+    lines.append("# HELP linkextractor_extract_duration_seconds Duration of extract_links.")
+    lines.append("# TYPE linkextractor_extract_duration_seconds histogram")
+    for bound, count in metrics["buckets"].items():
+        lines.append(f'linkextractor_extract_duration_seconds_bucket{{le="{_bound(bound)}"}} {count}')
+    lines.append(f"linkextractor_extract_duration_seconds_sum {sum(metrics['times'].values())}")
+    lines.append(f"linkextractor_extract_duration_seconds_count {metrics['documents']}")
+
+    lines.append("# HELP linkextractor_extract_stage_seconds_total Time spent per stage of extract_links.")
+    lines.append("# TYPE linkextractor_extract_stage_seconds_total counter")
+    for stage, seconds in metrics["times"].items():
+        lines.append(f'linkextractor_extract_stage_seconds_total{{stage="{stage}"}} {seconds}')
+
+    for name, count in metrics["counts"].items():
+        lines.append(f"# TYPE linkextractor_extract_{name}_total counter")
+        lines.append(f"linkextractor_extract_{name}_total {count}")
+
+    queries = get_query_stats()
+    if len(queries) > 0:
+        lines.append("# HELP linkextractor_query_duration_seconds Duration of the queries per query name.")
+        lines.append("# TYPE linkextractor_query_duration_seconds histogram")
+        for query, stats in queries.items():
+            for bound, count in stats["buckets"].items():
+                lines.append(f'linkextractor_query_duration_seconds_bucket{{query="{query}",le="{_bound(bound)}"}} {count}')
+            lines.append(f'linkextractor_query_duration_seconds_sum{{query="{query}"}} {stats["time_total"]}')
+            lines.append(f'linkextractor_query_duration_seconds_count{{query="{query}"}} {stats["count"]}')
+        lines.append("# TYPE linkextractor_query_rows_total counter")
+        for query, stats in queries.items():
+            lines.append(f'linkextractor_query_rows_total{{query="{query}"}} {stats["rows"]}')
+
+    return "\n".join(lines) + "\n"
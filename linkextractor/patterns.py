@@ -1,7 +1,12 @@
-from typing import Dict, List, Literal, Union
+from typing import Dict, Iterable, List, Literal, Tuple, Union
+import os
 import re
 import logging
 
+from linkextractor.cache import LRUCache
+from linkextractor.spans import SpanIndex, longest_non_overlapping
+from linkextractor.types import AliasHit
+
 def capture(name: str, pattern: str):
     return rf"(?P<{name}>{pattern})"
 
@@ -170,6 +175,206 @@ def get_patterns(titles: str | None = None):
 
     return compiled_patterns
 
+def get_pattern_heads(patterns: List[str], mapping: Dict[str, str]) -> Tuple[re.Pattern | None, List[bool]]:
+    """
+    Compile the alternation of the first atom of each of the (uncompiled) patterns
+    that do not start with the TITLE, and return for each pattern whether it starts
+    with the TITLE instead. A pattern can only match at a position where its first
+    atom matches, so these are the only candidate match positions.
+    """
+    heads = []
+    title_first = []
+    for pattern in patterns:
+        first = placeholder_pattern.search(pattern)
+        assert first is not None and pattern[:first.start()].strip() == "", "pattern should start with an atom"
+        title_first.append(first.group(1) == "TITLE")
+        if first.group(1) == "TITLE":
+            continue
+        head = sub_pattern_placeholders(first.group(0), mapping)
+        # captures are not needed (and their names would clash between heads)
+        heads.append(re.sub(r"\(\?P<\w+>", "(?:", head))
+
+    if len(heads) == 0:
+        return None, title_first
+    return re.compile("|".join(f"(?:{head})" for head in dict.fromkeys(heads)), re.VERBOSE | re.IGNORECASE), title_first
+
+class PatternScanner:
+    """
+    Finds the matches of a list of patterns in a single pass over the text.
+
+    Patterns are only tried at their candidate positions: the start of an alias hit
+    for patterns that start with the TITLE, and the positions where the (cheap) heads
+    of the other patterns match, which are found in one scan over the text. The
+    matches are the same as those of running `pattern.finditer(text)` for each
+    pattern: a match of a pattern is only accepted when it starts at or after the end
+    of the previous match of that pattern.
+    """
+
+    def __init__(self, patterns: List[re.Pattern], heads: re.Pattern | None, title_first: List[bool]):
+        self.patterns = patterns
+        self.heads = heads
+        self.title_first = title_first
+
+    def scan(self, text: str, title_starts: Iterable[int], windows: List[Tuple[int, int]] | None = None) -> List[List[re.Match]]:
+        """
+        Returns the matches of each pattern, in the order of the patterns. title_starts
+        should contain every position where a title (alias) starts in text. With
+        windows, only matches that lie within one of the (ordered, disjoint) windows are
+        returned.
+        """
+        if windows is None:
+            windows = [(0, len(text))]
+
+        title_patterns = [i for i, first in enumerate(self.title_first) if first]
+        head_patterns = [i for i, first in enumerate(self.title_first) if not first]
+
+        title_starts = sorted(title_starts)
+        matches: List[List[re.Match]] = [[] for _ in self.patterns]
+        last_end = [0 for _ in self.patterns]
+        t = 0
+        for lo, hi in windows:
+            candidates = []
+            while t < len(title_starts) and title_starts[t] < hi:
+                if title_starts[t] >= lo:
+                    candidates.append((title_starts[t], True))
+                t += 1
+            if self.heads is not None:
+                search = self.heads.search
+                pos = lo
+                while True:
+                    head = search(text, pos, hi)
+                    if head is None:
+                        break
+                    candidates.append((head.start(), False))
+                    pos = head.start() + 1
+            candidates.sort()
+
+            for start, is_title in candidates:
+                for i in title_patterns if is_title else head_patterns:
+                    if start < last_end[i]:
+                        continue
+                    match = self.patterns[i].match(text, start, hi)
+                    if match is not None:
+                        matches[i].append(match)
+                        last_end[i] = max(match.end(), start + 1)
+
+        return matches
+
+# cheap indicators of a reference (after the indicators in analyze/method_2.py), used
+# together with the alias hits as anchors of the windows that the patterns are run on
+PT_INDICATORS = [
+    r"(?<!\w){LITERAL|ARTICLE}",
+    r"(?<!\w){LITERAL|SUBPARAGRAPH}{WS}\d",
+    r"\d+[:.]\d+",
+]
+
+# characters around an anchor that are included in its window, the longest reference
+# (e.g. an enumeration of articles followed by the title of the law) should fit
+WINDOW_SIZE = int(os.getenv("LINKEXTRACTOR_WINDOW_SIZE", 256))
+
+_PATTERNS_INDICATORS_CACHE: re.Pattern | None = None
+def get_indicators_pattern() -> re.Pattern:
+    global _PATTERNS_INDICATORS_CACHE
+    if _PATTERNS_INDICATORS_CACHE is None:
+        indicators = [sub_pattern_placeholders(indicator, get_atoms()) for indicator in PT_INDICATORS]
+        _PATTERNS_INDICATORS_CACHE = re.compile("|".join(f"(?:{indicator})" for indicator in indicators), re.IGNORECASE)
+    return _PATTERNS_INDICATORS_CACHE
+
+# literal prefixes of the indicators, which are located with str.find (much faster than
+# scanning with the alternation of the indicators) and then verified
+_INDICATOR_PREFIXES = ("art", "lid", "led", ":", ".")
+
+_WORD_CHARS = re.compile(r"\w*")
+
+def find_indicators(text: str) -> List[int]:
+    """
+    Start positions of the indicator tokens in text, ordered
+    """
+    indicators = get_indicators_pattern()
+    norm_text = text.lower()
+    if len(norm_text) != len(text):
+        # lowercasing changed the offsets, scan with the indicators pattern instead
+        return [match.start() for match in indicators.finditer(text)]
+
+    positions = []
+    for prefix in _INDICATOR_PREFIXES:
+        pos = norm_text.find(prefix)
+        while pos != -1:
+            if prefix in ":.":
+                # the separator of e.g. "7:658", the indicator starts at the preceding digits
+                if pos > 0 and text[pos - 1].isdigit() and pos + 1 < len(text) and text[pos + 1].isdigit():
+                    positions.append(pos - 1)
+            elif indicators.match(text, pos):
+                positions.append(pos)
+            pos = norm_text.find(prefix, pos + 1)
+    positions.sort()
+    return positions
+
+def get_windows(text: str, aliases: List[AliasHit], size: int | None = None) -> List[Tuple[int, int]]:
+    """
+    Bounded windows of text around the anchors of possible references: the indicator
+    tokens and the alias hits. Each window spans `size` characters on both sides of an
+    anchor, overlapping windows are merged and the end of a window is moved past the
+    word it falls in, so that it can not cut a title in half. Windows are ordered and
+    in document offsets.
+    """
+    if size is None:
+        size = WINDOW_SIZE
+
+    anchors = [hit.start for hit in aliases]
+    anchors.extend(find_indicators(text))
+    anchors.sort()
+
+    windows: List[Tuple[int, int]] = []
+    for anchor in anchors:
+        lo = max(anchor - size, 0)
+        hi = _WORD_CHARS.match(text, min(anchor + size, len(text))).end()
+        if windows and lo <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], hi))
+        else:
+            windows.append((lo, hi))
+    return windows
+
+def canonical_titles(aliases: List[AliasHit]) -> Tuple[str, ...]:
+    """
+    Canonical (deduplicated, lowercased and ordered) titles of a set of alias hits.
+    Longer titles come first, so that the longest alias is tried first in the alternation.
+    """
+    return tuple(sorted({hit.alias.lower() for hit in aliases}, key=lambda title: (-len(title), title)))
+
+def get_titles_pattern(titles: Tuple[str, ...]) -> str:
+    """
+    Construct the TITLE capture from canonical titles. Like the alias hits, a title may
+    not be part of a larger word.
+    """
+    return r"(?<!\w)" + capture("TITLE", "|".join(re.escape(title) for title in titles)) + r"(?!\w)"
+
+# compiled patterns per set of titles, documents of the same kind mostly share their aliases,
+# 0 to compile them for every text
+PATTERNS_CACHE_SIZE = int(os.getenv("LINKEXTRACTOR_PATTERNS_CACHE_SIZE", 64))
+_PATTERNS_ALIAS_CACHE = LRUCache(maxsize=max(PATTERNS_CACHE_SIZE, 1))
+
+def get_alias_scanner(aliases: List[AliasHit]) -> PatternScanner:
+    """
+    Scanner of the compiled in-text patterns for the aliases found in a text, cached
+    on the canonical set of titles.
+    """
+    titles = canonical_titles(aliases)
+    scanner = _PATTERNS_ALIAS_CACHE.get(titles) if PATTERNS_CACHE_SIZE > 0 else None
+    if scanner is None:
+        titles_pattern = get_titles_pattern(titles)
+        heads, title_first = get_pattern_heads(PT_REFS, {**get_atoms(), "TITLE": titles_pattern})
+        scanner = PatternScanner(get_patterns(titles_pattern), heads, title_first)
+        if PATTERNS_CACHE_SIZE > 0:
+            _PATTERNS_ALIAS_CACHE.put(titles, scanner)
+    return scanner
+
+def get_alias_patterns(aliases: List[AliasHit]) -> List[re.Pattern]:
+    return get_alias_scanner(aliases).patterns
+
+def get_patterns_cache_info() -> Dict[str, int]:
+    return _PATTERNS_ALIAS_CACHE.info()
+
 def fix_matches(matches: list):
     """
     This function describes and executes business logic exceptions to defined
@@ -197,30 +402,49 @@ def fix_matches(matches: list):
 
     return matches
 
-def match_patterns_regex(text: str, aliases: Union[List[tuple], None] = None):
+def match_patterns_regex(text: str, aliases: Union[List[AliasHit], None] = None, single_pass: bool = True,
+                         windows: List[Tuple[int, int]] | None = None, longest: bool = False,
+                         scanner: PatternScanner | None = None):
     """
     If aliases is None: assume that the whole of text is the reference searching for
-    If aliases is not None: assume list of possible aliases and search against that
+    If aliases is not None: assume list of alias hits in text and search against those
     If aliases is not None but empty: attempted to find aliases but no aliases to find against so return []
+
+    With single_pass (default), the in-text patterns are matched with one combined scan
+    over the text instead of one pass per pattern; the results are the same.
+
+    With windows (see get_windows), the in-text patterns are only run on those parts of
+    the text. Spans are document offsets either way.
+
+    With longest, overlapping matches are resolved by keeping the longest match, e.g. a
+    shorter pattern match nested in the literal of a longer one is dropped.
+
+    scanner is the scanner of get_alias_scanner(aliases), if it was already retrieved.
     """
     if aliases is not None and len(aliases) == 0:
         return []
 
-    patterns = None
     if aliases is not None and len(aliases) > 0:
-        pt_titles = capture("TITLE", "|".join(re.escape(str(title)) for title in aliases))
-        patterns = get_patterns(pt_titles)
+        if single_pass:
+            scanner = scanner if scanner is not None else get_alias_scanner(aliases)
+            matches_per_pattern = scanner.scan(text, (hit.start for hit in aliases), windows)
+        elif windows is not None:
+            matches_per_pattern = [
+                [match for lo, hi in windows for match in pattern.finditer(text, lo, hi)]
+                for pattern in get_alias_patterns(aliases)
+            ]
+        else:
+            matches_per_pattern = [list(pattern.finditer(text)) for pattern in get_alias_patterns(aliases)]
     else:
-        # TODO, this version of the patterns can be cached
-        patterns = get_patterns()
+        matches_per_pattern = [list(pattern.finditer(text)) for pattern in get_patterns()]
 
     results = []
+    spans = SpanIndex()
 
-    for i, pattern in enumerate(patterns):
-        # logging.debug("pattern %s: %s", i, pattern.pattern)
-        for match in re.finditer(pattern, text):
+    for i, matches in enumerate(matches_per_pattern):
+        for match in matches:
             span = match.span()
-            if any(r['span']==span for r in results): # ensure single result per span
+            if span in spans: # ensure single result per span
                 continue
             patterns = match.groupdict()
             if not "TITLE" in patterns:
@@ -230,6 +454,10 @@ def match_patterns_regex(text: str, aliases: Union[List[tuple], None] = None):
                 "literal": match.group(0),
                 "patterns": match.groupdict()
             }
+            spans.add(span)
             results.append(result)
 
+    if longest:
+        results = longest_non_overlapping(results, lambda result: result['span'])
+
     return results
@@ -0,0 +1,251 @@
+"""
+Query instrumentation: latency histograms and row counts per query name, and a rotating
+log of slow queries with their SQL, parameters and (sampled) `EXPLAIN (ANALYZE, BUFFERS)`
+plan. Queries are recorded by db.execute() and db.execute_prepared(), and the log is
+summarised with `linkextractor db slow-queries`.
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import random
+import threading
+from bisect import bisect_left
+from statistics import median
+from time import monotonic, time
+from typing import Dict, List
+
+# queries that take at least this many milliseconds are written to the slow-query log, 0 to disable
+SLOW_QUERY_MS = float(os.getenv("LINKEXTRACTOR_SLOW_QUERY_MS", 200))
+# share of the slow queries that are run again with EXPLAIN (ANALYZE, BUFFERS) for their plan
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("LINKEXTRACTOR_SLOW_QUERY_EXPLAIN_RATE", 0.1))
+# seconds between two plans of the same query, so that a slow query does not run twice as often
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("LINKEXTRACTOR_SLOW_QUERY_EXPLAIN_INTERVAL", 60))
+SLOW_QUERY_LOG = os.getenv(
+    "LINKEXTRACTOR_SLOW_QUERY_LOG",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "slow_queries.log")
+)
+# the log is rotated at this size, keeping SLOW_QUERY_LOG_BACKUPS previous logs
+SLOW_QUERY_LOG_BYTES = int(os.getenv("LINKEXTRACTOR_SLOW_QUERY_LOG_BYTES", 10 * 1024 * 1024))
+SLOW_QUERY_LOG_BACKUPS = 3
+# list parameters are logged as their length and first items, and long queries (e.g. with
+# inlined VALUES) and string parameters are cut off at a number of characters
+SLOW_QUERY_LOG_ITEMS = 5
+SLOW_QUERY_LOG_CHARS = 2000
+
+# upper bounds (in seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float("inf"))
+
+class QueryStats:
+    """
+    Latency histogram and row counts of the executions of one query
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.rows = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+        self.buckets = [0 for _ in BUCKETS]
+
+    def add(self, duration: float, rows: int):
+        self.count += 1
+        self.rows += max(rows, 0)
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.buckets[bisect_left(BUCKETS, duration)] += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "rows": self.rows,
+            "rows_avg": self.rows / self.count if self.count else 0.0,
+            "time_total": self.total,
+            "time_avg": self.total / self.count if self.count else 0.0,
+            "time_max": self.max,
+            "slow": self.slow,
+            # cumulative counts per upper bound, like a Prometheus histogram
+            "buckets": {
+                str(bound): sum(self.buckets[:i + 1])
+                for i, bound in enumerate(BUCKETS)
+            },
+        }
+
+_STATS: Dict[str, QueryStats] = {}
+_STATS_LOCK = threading.Lock()
+_LAST_EXPLAIN: Dict[str, float] = {}
+# queries executed by the current thread, for the per-call stats of extract_links
+_LOCAL = threading.local()
+
+def record(name: str, duration: float, rows: int) -> bool:
+    """
+    Record an execution of a query, returns whether it is slow
+    """
+    slow = SLOW_QUERY_MS > 0 and duration * 1000 >= SLOW_QUERY_MS
+    _LOCAL.queries = getattr(_LOCAL, "queries", 0) + 1
+    with _STATS_LOCK:
+        stats = _STATS.get(name)
+        if stats is None:
+            stats = _STATS[name] = QueryStats()
+        stats.add(duration, rows)
+        if slow:
+            stats.slow += 1
+    return slow
+
+def should_explain(name: str) -> bool:
+    """
+    Whether to capture the plan of a slow execution of a query, for a sample of them and
+    at most once per SLOW_QUERY_EXPLAIN_INTERVAL seconds
+    """
+    if random.random() >= SLOW_QUERY_EXPLAIN_RATE:
+        return False
+    now = monotonic()
+    with _STATS_LOCK:
+        if now - _LAST_EXPLAIN.get(name, -SLOW_QUERY_EXPLAIN_INTERVAL) < SLOW_QUERY_EXPLAIN_INTERVAL:
+            return False
+        _LAST_EXPLAIN[name] = now
+    return True
+
+def get_thread_query_count() -> int:
+    """
+    Queries recorded by the current thread so far
+    """
+    return getattr(_LOCAL, "queries", 0)
+
+def get_query_stats() -> Dict[str, dict]:
+    """
+    Statistics of the queries executed by this process, by query name
+    """
+    with _STATS_LOCK:
+        return {name: stats.snapshot() for name, stats in sorted(_STATS.items())}
+
+def reset_query_stats():
+    with _STATS_LOCK:
+        _STATS.clear()
+        _LAST_EXPLAIN.clear()
+
+_LOGGER: logging.Logger | None = None
+_LOGGER_LOCK = threading.Lock()
+
+def _get_logger() -> logging.Logger:
+    global _LOGGER
+    with _LOGGER_LOCK:
+        if _LOGGER is None or _LOGGER.handlers[0].baseFilename != os.path.abspath(SLOW_QUERY_LOG): # pyright: ignore[reportAttributeAccessIssue]
+            logger = logging.getLogger("linkextractor.slow_queries")
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+                handler.close()
+            handler = logging.handlers.RotatingFileHandler(
+                SLOW_QUERY_LOG, maxBytes=SLOW_QUERY_LOG_BYTES, backupCount=SLOW_QUERY_LOG_BACKUPS, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            _LOGGER = logger
+        return _LOGGER
+
+def _truncate(text: str) -> str:
+    if len(text) <= SLOW_QUERY_LOG_CHARS:
+        return text
+    return f"{text[:SLOW_QUERY_LOG_CHARS]}... ({len(text)} characters)"
+
+def _summarise_param(param):
+    if isinstance(param, (list, tuple)) and len(param) > SLOW_QUERY_LOG_ITEMS:
+        return {"length": len(param), "first": [_summarise_param(item) for item in param[:SLOW_QUERY_LOG_ITEMS]]}
+    if isinstance(param, (list, tuple)):
+        return [_summarise_param(item) for item in param]
+    if isinstance(param, str):
+        return _truncate(param)
+    return param
+
+def summarise_params(params):
+    """
+    Parameters of a query as written to the slow-query log, with long lists (such as the
+    n-grams of a text) replaced by their length and first items
+    """
+    if isinstance(params, dict):
+        return {key: _summarise_param(param) for key, param in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [_summarise_param(param) for param in params]
+    return params
+
+def log_slow_query(name: str, duration: float, rows: int, query: str, params, plan=None):
+    """
+    Append a slow query (as a JSON line) to the slow-query log, with its query and
+    parameters summarised
+    """
+    entry = {
+        "time": time(),
+        "pid": os.getpid(),
+        "name": name,
+        "duration": duration,
+        "rows": rows,
+        "query": _truncate(" ".join(query.split())),
+        "params": summarise_params(params),
+        "plan": plan,
+    }
+    try:
+        _get_logger().info(json.dumps(entry, default=str))
+    except OSError as e:
+        logging.warning("could not write to the slow-query log %s: %s", SLOW_QUERY_LOG, e)
+
+def read_slow_queries(path: str | None = None) -> List[dict]:
+    """
+    Entries of the slow-query log and its rotated predecessors, oldest first
+    """
+    path = path if path is not None else SLOW_QUERY_LOG
+    entries = []
+    for i in range(SLOW_QUERY_LOG_BACKUPS, -1, -1):
+        log_path = f"{path}.{i}" if i > 0 else path
+        if not os.path.exists(log_path):
+            continue
+        with open(log_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # a line that was being written while rotating
+                    continue
+    return entries
+
+def _plan_summary(plan) -> str:
+    # top node of the plan, and the blocks that were read instead of found in shared buffers
+    node = plan[0]["Plan"]
+    return f"{node['Node Type']}, {node.get('Shared Read Blocks', 0)} blocks read, {node.get('Shared Hit Blocks', 0)} hit"
+
+def summarise_slow_queries(path: str | None = None, show: int = 0) -> Dict[str, dict]:
+    """
+    Log the amount and latency of the slow queries in the log per query name, and the
+    show slowest queries with their parameters and plan
+    """
+    entries = read_slow_queries(path)
+    summary: Dict[str, dict] = {}
+    for entry in entries:
+        summary.setdefault(entry["name"], {"durations": [], "rows": [], "plans": 0})
+        summary[entry["name"]]["durations"].append(entry["duration"])
+        summary[entry["name"]]["rows"].append(entry["rows"])
+        summary[entry["name"]]["plans"] += entry.get("plan") is not None
+
+    if len(entries) == 0:
+        logging.info("no slow queries in %s", path if path is not None else SLOW_QUERY_LOG)
+        return {}
+
+    logging.info(f" {'query':>24} | {'slow':>6} | {'p50 (ms)':>9} | {'max (ms)':>9} | {'rows avg':>8} | {'plans':>5}")
+    logging.info(f" -------------------------+--------+-----------+-----------+----------+------")
+    for name, item in sorted(summary.items(), key=lambda item: -sum(item[1]["durations"])):
+        item["count"] = len(item["durations"])
+        item["p50"] = median(item["durations"])
+        item["max"] = max(item["durations"])
+        item["rows_avg"] = sum(item["rows"]) / item["count"]
+        logging.info(f" {name:>24} | {item['count']:>6} | {item['p50'] * 1000:>9.1f} | {item['max'] * 1000:>9.1f} | {item['rows_avg']:>8.1f} | {item['plans']:>5}")
+
+    for entry in sorted(entries, key=lambda entry: -entry["duration"])[:show]:
+        logging.info("")
+        logging.info("%s took %.1fms (%s rows) with parameters %s", entry["name"], entry["duration"] * 1000, entry["rows"], entry["params"])
+        logging.info("  %s", entry["query"])
+        if entry.get("plan") is not None:
+            logging.info("  plan: %s", _plan_summary(entry["plan"]))
+    return summary
@@ -0,0 +1,182 @@
+"""
+Provisioning of the indexes that the hot queries in utils.py filter on, run with
+`linkextractor db prepare`. The indexes are expression indexes on the same expressions
+the queries use (e.g. `lower(alias)` and `(type, lower(number))`), so neither the
+tables of the DAG nor the queries have to change.
+"""
+
+import json
+import logging
+import re
+from time import time
+from typing import Dict, List, Tuple
+
+import psycopg2
+
+from linkextractor import db
+from linkextractor.utils import AMOUNT_CASES_QUERY, BWB_IDS_LAWS_QUERY, CASES_QUERY, LAWS_QUERY
+
+# (name, table, columns) of the indexes the hot queries need
+INDEXES: List[Tuple[str, str, str]] = [
+    # find_laws with an alias, find_aliases_in_text and find_matching_aliases
+    ("idx_law_alias_alias", "law_alias", "(lower(alias))"),
+    # find_laws with a bwb_id and the canonical alias of the payloads
+    ("idx_law_alias_bwb_id", "law_alias", "(bwb_id)"),
+    # the fragments of find_laws
+    ("idx_law_element_type_number", "law_element", "(type, lower(number))"),
+    # the law elements of get_cases_by_bwb_and_label_id and get_amount_cases_by_bwb_and_label_ids,
+    # and the candidate laws of find_laws
+    ("idx_law_element_bwb_label_id", "law_element", "(bwb_id, bwb_label_id)"),
+    # the cases of a law element
+    ("idx_case_law_law_id", "case_law", "(law_id)"),
+]
+
+def _normalise_columns(columns: str) -> str:
+    """
+    Columns of an index definition without casts and redundant parentheses, so that the
+    columns of pg_get_indexdef (e.g. "(lower((alias)::text))") compare equal to ours
+    """
+    columns = re.sub(r"::[\w ]+", "", columns)
+    while True:
+        unwrapped = re.sub(r"\((\w+)\)", r"\1", columns)
+        if unwrapped == columns:
+            return columns.replace(" ", "")
+        columns = unwrapped
+
+def get_tables(cur) -> Dict[str, str]:
+    """
+    Tables on the search path with their kind ("r" for tables, "p" for partitioned tables)
+    """
+    cur.execute("""
+        SELECT c.relname, c.relkind
+        FROM pg_class c
+        WHERE c.relkind IN ('r', 'p') AND pg_table_is_visible(c.oid)
+    """)
+    return dict(cur.fetchall())
+
+def get_indexes(cur, table: str) -> List[Tuple[str, str, bool]]:
+    """
+    (name, normalised columns, valid) of the plain btree indexes on a table
+    """
+    cur.execute("""
+        SELECT i.relname, pg_get_indexdef(x.indexrelid), x.indisvalid
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = %s::regclass
+    """, (table,))
+    indexes = []
+    for name, definition, valid in cur.fetchall():
+        _, _, columns = definition.partition(" USING ")
+        if not columns.startswith("btree ") or " WHERE " in columns:
+            continue
+        indexes.append((name, _normalise_columns(columns[len("btree "):]), valid))
+    return indexes
+
+def get_sample_parameters(cur) -> Dict[str, tuple] | None:
+    """
+    Parameters of the hot queries for a law element that has an alias, for EXPLAIN
+    """
+    cur.execute("""
+        SELECT le.bwb_id, le.type, lower(le.number), le.bwb_label_id, la.alias
+        FROM law_element le
+        JOIN law_alias la ON la.bwb_id = le.bwb_id
+        WHERE le.number IS NOT NULL
+        LIMIT 1
+    """)
+    row = cur.fetchone()
+    if row is None:
+        return None
+    bwb_id, type, number, bwb_label_id, alias = row
+    return {
+        "find_laws (alias)": ("find_laws", LAWS_QUERY, ([type], [number], 1, type, number, alias.lower(), None)),
+        "find_laws (bwb_ids)": ("find_laws_bwb_ids", BWB_IDS_LAWS_QUERY, ([type], [number], 1, type, number, [bwb_id])),
+        "get_cases_by_bwb_and_label_id": ("cases", CASES_QUERY, (bwb_id, bwb_label_id)),
+        "get_amount_cases_by_bwb_and_label_ids": ("amount_cases", AMOUNT_CASES_QUERY, ([bwb_id], [bwb_label_id])),
+    }
+
+def explain_costs(cur, queries: Dict[str, tuple]) -> Dict[str, float | None]:
+    """
+    Estimated total cost of each query, None for queries that can not be planned (e.g.
+    because case_law does not exist)
+    """
+    costs = {}
+    for name, (statement, query, params) in queries.items():
+        try:
+            db.execute_prepared(cur, statement, query, params, prefix="EXPLAIN (FORMAT JSON) ")
+            plan = cur.fetchone()[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            costs[name] = plan[0]["Plan"]["Total Cost"]
+        except psycopg2.Error as e:
+            logging.debug("could not explain %s: %s", name, e)
+            costs[name] = None
+    return costs
+
+def prepare_database(dry_run: bool = False) -> Dict[str, object]:
+    """
+    Create the missing indexes of INDEXES (concurrently, except on partitioned tables),
+    ANALYZE the tables and log the EXPLAIN costs of the hot queries before and after.
+    Indexes on the same columns under another name count as present, and invalid
+    indexes left behind by an interrupted concurrent build are rebuilt. With
+    dry_run=True only the statements that would be run are logged.
+    """
+    if db.is_sqlite():
+        raise RuntimeError(f"{db.DB_URL} is a SQLite snapshot, which is indexed when it is exported")
+
+    # CREATE INDEX CONCURRENTLY can not run in a transaction, so not on a pooled connection
+    conn = psycopg2.connect(db.DB_URL, connect_timeout=5, **db.KEEPALIVE_KWARGS)
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            tables = get_tables(cur)
+            statements = []
+            present = {}
+            for name, table, columns in INDEXES:
+                if table not in tables:
+                    logging.info("skipping %s, table %s does not exist", name, table)
+                    continue
+                existing = get_indexes(cur, table)
+                equivalent = [index for index, index_columns, valid in existing if valid and index_columns == _normalise_columns(columns)]
+                if len(equivalent) > 0:
+                    present[name] = equivalent[0]
+                    continue
+                concurrently = " CONCURRENTLY" if tables[table] != "p" else ""
+                if any(index == name for index, _, _ in existing):
+                    # an invalid index left behind by a failed concurrent build
+                    statements.append(f"DROP INDEX{concurrently} IF EXISTS {name}")
+                statements.append(f"CREATE INDEX{concurrently} IF NOT EXISTS {name} ON {table} {columns}")
+
+            for name, index in present.items():
+                logging.info("%s exists as %s", name, index)
+            if dry_run:
+                for statement in statements:
+                    logging.info("would run: %s", statement)
+                return {"statements": statements, "present": present}
+
+            analyze = [f"ANALYZE {table}" for table in ("law_alias", "law_element", "case_law") if table in tables]
+            for statement in analyze:
+                cur.execute(statement)
+            queries = get_sample_parameters(cur) if "law_alias" in tables and "law_element" in tables else None
+            before = explain_costs(cur, queries) if queries is not None else {}
+
+            for statement in statements:
+                start = time()
+                cur.execute(statement)
+                logging.info("%s (%ss)", statement, round(time() - start, 3))
+            if len(statements) > 0:
+                for statement in analyze:
+                    cur.execute(statement)
+            after = explain_costs(cur, queries) if queries is not None else {}
+    finally:
+        conn.close()
+
+    if len(before) > 0:
+        logging.info(f" {'query':>38} | {'cost before':>11} | {'cost after':>11}")
+        logging.info(f" ---------------------------------------+-------------+------------")
+        for name in before:
+            cost_before = f"{before[name]:.2f}" if before[name] is not None else "-"
+            cost_after = f"{after[name]:.2f}" if after[name] is not None else "-"
+            logging.info(f" {name:>38} | {cost_before:>11} | {cost_after:>11}")
+    else:
+        logging.info("no law element with an alias to explain the queries with")
+
+    return {"statements": statements, "present": present, "before": before, "after": after}
@@ -1,37 +1,69 @@
 import re
-from linkextractor.patterns import fix_matches, get_atoms, match_patterns_regex
+from linkextractor import metrics
+from linkextractor.metrics import ExtractStats
+from linkextractor.patterns import fix_matches, get_alias_scanner, get_atoms, get_windows, match_patterns_regex
+from linkextractor.querylog import get_thread_query_count
+from linkextractor.spans import SpanIndex, longest_non_overlapping
 from linkextractor.types import Fragment, Link
-from linkextractor.utils import find_aliases_in_text, find_laws, find_longest_alias_in_substring
+from linkextractor.utils import find_aliases_in_text, resolve_laws
 # from linkextractor.utils import *
 import logging
-from time import time
+from time import perf_counter, time
 
 from copy import deepcopy
 
 
-def extract_links(text, exact=False, loose=False, use_trie=True):
+def compare_windowed_matches(text, aliases, longest=False):
     """
-    exrtact_in_text
-    find and extract link references from a larger text
-
-    strategy:
-    1. extract all aliases found in the text
-    2. 
+    Match the patterns on the windows around the anchors and on the full text, and log
+    the matches that differ. Returns the matches of the full scan.
     """
+    start = time()
+    windows = get_windows(text, aliases)
+    windowed = match_patterns_regex(text, aliases, windows=windows, longest=longest)
+    time_windowed = time() - start
 
-    # TODO: this should be globalised
-    DEBUG = logging.getLogger().getEffectiveLevel() == logging.DEBUG
+    start = time()
+    full = match_patterns_regex(text, aliases, longest=longest)
+    time_full = time() - start
+
+    covered = sum(hi - lo for lo, hi in windows)
+    logging.info("windowed scan: %s windows covering %s of %s characters, %.4fs (full scan %.4fs)",
+                 len(windows), covered, len(text), time_windowed, time_full)
+
+    windowed_spans = {match['span'] for match in windowed}
+    full_spans = {match['span'] for match in full}
+    for match in full:
+        if match['span'] not in windowed_spans:
+            logging.warning("only found by full scan: %s \"%s\"", match['span'], match['literal'])
+    for match in windowed:
+        if match['span'] not in full_spans:
+            logging.warning("only found by windowed scan: %s \"%s\"", match['span'], match['literal'])
+
+    return full
+
+def find_lookups(text, exact=False, loose=False, use_trie=True, windowed=False, compare=False, longest=False,
+                 stats: ExtractStats | None = None):
+    """
+    First (CPU-bound) stage of extract_links: find the matches in text and split them
+    into (sub_match, fragments) lookups, of which the laws are still to be resolved.
+    The timings and counts of these stages are added to stats, if given.
+    """
+    stats = stats if stats is not None else ExtractStats()
+    stats.counts["characters"] = len(text)
 
-    if DEBUG:
+    # the level of the root logger is cached by logging, so this is cheap
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
         disp_text = re.sub(r'\n+|\s+', ' ', text[0:128])+'...' if len(text) > 128 else text
         logging.debug(f"extract links input text: \"{disp_text}\"")
     
     aliases = None
     if not exact:
         # retrieve aliases
-        start = time()
+        start = perf_counter()
         aliases = find_aliases_in_text(text, use_trie)
-        logging.debug("time retrieve aliases: %s", time() - start)
+        stats.times["aliases"] += perf_counter() - start
+        stats.counts["aliases"] = len(aliases)
         if len(aliases) != 0:
             logging.debug("aliases found: %s", len(aliases))
             # for i, alias in enumerate(aliases):
@@ -39,45 +71,60 @@ def extract_links(text, exact=False, loose=False, use_trie=True):
         else:
             logging.debug("no aliases were found in the query")
 
+    # compile the patterns for the aliases (cached per set of aliases)
+    scanner = None
+    if aliases:
+        start = perf_counter()
+        scanner = get_alias_scanner(aliases)
+        stats.times["compile"] += perf_counter() - start
+
     # retrieve matches from text using aliases
-    start = time()
-    matches = match_patterns_regex(text, aliases)
-    logging.debug("time match patterns: %s", time() - start)
+    start = perf_counter()
+    if aliases and compare:
+        matches = compare_windowed_matches(text, aliases, longest)
+    elif aliases and windowed:
+        matches = match_patterns_regex(text, aliases, windows=get_windows(text, aliases), longest=longest, scanner=scanner)
+    else:
+        matches = match_patterns_regex(text, aliases, longest=longest, scanner=scanner)
+    stats.times["match"] += perf_counter() - start
 
     # fix some of the matches that need reformatting for specific casess
+    start = perf_counter()
     matches = fix_matches(matches)
+    stats.times["fix_matches"] += perf_counter() - start
 
     # if loose search is enabled, consider individual aliases in the text as possible matches when if patterns were found.
     # TODO: reinforce specifically for the case of finding whole laws for wich a more elaborate pattern aside from the title 
     # is not available.
-    results = []
     if len(matches) == 0 and loose and aliases:
         logging.debug("no matches found, expanding to loose search")
         if aliases is None:
             logging.debug("exact search, hence retrieving aliases now (after matching)")
-            start = time()
+            start = perf_counter()
             aliases = find_aliases_in_text(text, use_trie)
-            logging.debug("time retrieve aliases: %s", time() - start)
+            stats.times["aliases"] += perf_counter() - start
+            stats.counts["aliases"] = len(aliases)
             
         if len(aliases) == 0:
             logging.debug("no patterns found, so no results can be produced")
             return []
         else:
             logging.debug(f"{len(aliases)} aliases found in query, which all will be used as matches")
+            # the alias hits already carry their span, so there is no need to search the text again
             matches = []
-            for alias in aliases:
-                span = (None, None)
-                span_search = text.find(alias)
-                if span_search > -1:
-                    span = (span_search, span_search+len(alias),)
+            for hit in aliases:
                 matches.append({
-                    "span": span,
+                    "span": (hit.start, hit.end),
+                    "literal": text[hit.start:hit.end],
                     "patterns": {
-                        "TITLE": alias
+                        "TITLE": hit.alias
                     }
                 })
+            if longest:
+                matches = longest_non_overlapping(matches, lambda match: match['span'])
 
     logging.debug("matches found: %s", len(matches))
+    stats.counts["matches"] = len(matches)
 
 
     mapping = {
@@ -88,8 +135,8 @@ def extract_links(text, exact=False, loose=False, use_trie=True):
 
     pattern_conjunction = get_atoms()['LITERAL|CONJUNCTION']
 
-    # process each match to find an appropriately matching law
-    span_record = []
+    # split each match into sub-matches and construct the fragments to find an appropriately matching law for
+    lookups = []
     for i, match in enumerate(matches):
         logging.debug("%s) %s", i, match)
 
@@ -122,37 +169,79 @@ def extract_links(text, exact=False, loose=False, use_trie=True):
                 if v is not None
             } # pyright: ignore[reportAssignmentType]
 
-            # find the related laws
             logging.debug("find laws with: alias: '%s', fragments: %s", sub_match['patterns']['TITLE'], fragments)
-            laws = find_laws(fragments, alias=sub_match['patterns']['TITLE'])
-
-            if len(laws) == 0:
-                longest_alias = find_longest_alias_in_substring(sub_match['patterns']['TITLE'])
-                if longest_alias is not None:
-                    laws = find_laws(fragments, bwb_id=longest_alias['bwb_id'])
-
-            # process each law
-            for law in laws:
-                # ensure unique spans for each span-fragment combination
-                span_lookup = (sub_match['span'], tuple(fragments.items()))
-                if span_lookup in span_record:
-                    continue
-                span_record.append(span_lookup)
-
-                results.append({
-                    'context': {
-                        'span': sub_match['span'],
-                        'literal': sub_match['literal']
-                    },
-                    'resource': {
-                        'title': law['title'],
-                        'bwb_id': law['bwb_id'],
-                        'bwb_label_id': law['bwb_label_id'],
-                    },
-                    'fragment': fragments
-                })
+            lookups.append((sub_match, fragments))
+
+    stats.counts["sub_matches"] = len(lookups)
+    return lookups
+
+def build_links(lookups, resolved, exact=False):
+    """
+    Last stage of extract_links: combine the lookups with their resolved laws into links
+    """
+    results = []
+
+    # process each law
+    span_record = SpanIndex()
+    for (sub_match, fragments), laws in zip(lookups, resolved):
+        for law in laws:
+            # ensure unique spans for each span-fragment combination
+            if not span_record.add(sub_match['span'], tuple(fragments.items())):
+                continue
+
+            results.append({
+                'context': {
+                    'span': sub_match['span'],
+                    'literal': sub_match['literal']
+                },
+                'resource': {
+                    'title': law['title'],
+                    'bwb_id': law['bwb_id'],
+                    'bwb_label_id': law['bwb_label_id'],
+                },
+                'fragment': fragments
+            })
     
     if exact and len(results) > 1:
         logging.warning("more than one result found for exact search")
 
     return results
+
+def extract_links(text, exact=False, loose=False, use_trie=True, batch=True, windowed=False, compare=False, longest=False,
+                  stats: ExtractStats | None = None):
+    """
+    exrtact_in_text
+    find and extract link references from a larger text
+
+    strategy:
+    1. extract all aliases found in the text
+    2. 
+    
+    With batch=True (default), the laws of all matches are resolved together in a
+    few queries instead of one or more queries per match.
+
+    With windowed=True, the patterns are only run on windows of text around indicator
+    tokens (e.g. "artikel") and alias hits, which skips the parts of long documents
+    without references. With compare=True the windowed scan is checked against the
+    full scan, differences are logged and the results of the full scan are used.
+
+    With longest=True, of overlapping matches only the longest is kept, so nested
+    matches do not produce duplicate links.
+
+    The timings per stage and counts of the call are added to the counters of
+    metrics.py, and to stats if an ExtractStats is given.
+    """
+    stats = stats if stats is not None else ExtractStats()
+    queries = get_thread_query_count()
+    lookups = find_lookups(text, exact=exact, loose=loose, use_trie=use_trie, windowed=windowed, compare=compare, longest=longest, stats=stats)
+
+    # find the related laws of all sub-matches
+    start = perf_counter()
+    resolved = resolve_laws([(fragments, sub_match['patterns']['TITLE']) for sub_match, fragments in lookups], batch=batch, stats=stats)
+    stats.times["resolve"] += perf_counter() - start
+    stats.counts["queries"] += get_thread_query_count() - queries
+
+    metrics.record(stats)
+    logging.debug("%s", stats)
+
+    return build_links(lookups, resolved, exact=exact)
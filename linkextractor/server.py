@@ -0,0 +1,261 @@
+"""
+Long-running extraction server (`linkextractor serve`) over local HTTP or a Unix socket,
+which keeps the alias trie, compiled patterns and connection pool warm between requests.
+
+    POST /extract   {"text": "...", "exact": false, "longest": false, "windowed": false}
+                    -> {"links": [...]}
+    GET  /stats     request counts and latency percentiles, connection pool statistics
+    GET  /metrics   timings per stage and counters of the extractions (Prometheus text format)
+    GET  /health    -> {"status": "ok"}
+
+At most `workers` requests are extracted at once and at most `queue_size` more wait for a
+worker; requests beyond that are refused with 503 (and a Retry-After header) instead of
+queueing without bound.
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from time import perf_counter, time
+from typing import Any, Dict, List
+
+from linkextractor import db
+from linkextractor.batch import warm_up
+from linkextractor.metrics import format_prometheus, get_metrics
+from linkextractor.querylog import get_query_stats
+from linkextractor.search import extract_links
+from linkextractor.utils import get_laws_cache_info
+
+# requests that are extracted at the same time, by default one per pooled connection
+SERVE_WORKERS = int(os.getenv("LINKEXTRACTOR_SERVE_WORKERS", db.POOL_MAX_SIZE))
+# requests that wait for a worker before new requests are refused
+SERVE_QUEUE_SIZE = int(os.getenv("LINKEXTRACTOR_SERVE_QUEUE_SIZE", 64))
+# largest accepted request body in bytes
+SERVE_MAX_BODY = int(os.getenv("LINKEXTRACTOR_SERVE_MAX_BODY", 16 << 20))
+# latencies kept for the percentiles
+_LATENCY_WINDOW = 10_000
+
+_EXTRACT_OPTIONS = ("exact", "loose", "longest", "windowed")
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """
+    Nearest-rank percentile (q in [0, 100]) of a sorted list
+    """
+    if len(sorted_values) == 0:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+class RequestStats:
+    """
+    Thread-safe request counters and the latencies of the most recent requests
+    """
+
+    def __init__(self, window: int = _LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=window)
+        self.started = time()
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.links = 0
+
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def end(self, latency: float, links: int = 0, error: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            self.requests += 1
+            self.links += links
+            if error:
+                self.errors += 1
+            else:
+                self._latencies.append(latency)
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                "uptime": time() - self.started,
+                "requests": self.requests,
+                "errors": self.errors,
+                "rejected": self.rejected,
+                "in_flight": self.in_flight,
+                "links": self.links,
+                "latency": {
+                    "samples": len(latencies),
+                    "p50": percentile(latencies, 50),
+                    "p90": percentile(latencies, 90),
+                    "p99": percentile(latencies, 99),
+                    "max": latencies[-1] if latencies else 0.0,
+                },
+            }
+
+class ExtractionHandler(BaseHTTPRequestHandler):
+    server: "ExtractionServerMixin" # pyright: ignore[reportIncompatibleVariableOverride]
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self):
+        # client_address is not a (host, port) tuple on a Unix socket
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+    def _send_json(self, status: int, body: Any, headers: Dict[str, str] | None = None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/stats":
+            stats = self.server.stats.snapshot()
+            stats["workers"] = self.server.workers
+            stats["queue_size"] = self.server.queue_size
+            stats["pool"] = db.get_pool_stats()
+            stats["laws_cache"] = get_laws_cache_info()
+            stats["queries"] = get_query_stats()
+            stats["extract"] = get_metrics()
+            self._send_json(200, stats)
+        elif self.path == "/metrics":
+            data = format_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/extract":
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length < 0:
+                raise ValueError(f"negative Content-Length {length}")
+        except ValueError as e:
+            # the body cannot be skipped without a valid length
+            self.close_connection = True
+            self._send_json(400, {"error": f"invalid request: {e!r}"})
+            return
+        if length > SERVE_MAX_BODY:
+            self.close_connection = True
+            self._send_json(413, {"error": f"body larger than {SERVE_MAX_BODY} bytes"})
+            return
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+            text = request["text"]
+            assert isinstance(text, str), "text should be a string"
+            options = {key: bool(request[key]) for key in _EXTRACT_OPTIONS if key in request}
+        except (ValueError, KeyError, TypeError, AssertionError) as e:
+            self._send_json(400, {"error": f"invalid request: {e!r}"})
+            return
+
+        # backpressure: refuse instead of queueing when all workers and queue slots are taken
+        if not self.server.slots.acquire(blocking=False):
+            self.server.stats.reject()
+            self._send_json(503, {"error": "server busy"}, {"Retry-After": "1"})
+            return
+
+        start = perf_counter()
+        self.server.stats.begin()
+        try:
+            links = self.server.executor.submit(extract_links, text, use_trie=self.server.use_trie, **options).result()
+        except Exception as e:
+            self.server.stats.end(perf_counter() - start, error=True)
+            logging.exception("extraction failed")
+            self._send_json(500, {"error": repr(e)})
+            return
+        finally:
+            self.server.slots.release()
+
+        self.server.stats.end(perf_counter() - start, links=len(links))
+        self._send_json(200, {"links": links})
+
+class ExtractionServerMixin:
+    """
+    State shared by the HTTP and Unix socket servers: the worker pool and the slots for
+    requests that are being extracted or waiting for a worker
+    """
+    daemon_threads = True
+
+    def setup_extraction(self, workers: int, queue_size: int, use_trie: bool):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.use_trie = use_trie
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="linkextractor-serve")
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.stats = RequestStats()
+
+    def server_close(self):
+        super().server_close() # pyright: ignore[reportAttributeAccessIssue]
+        self.executor.shutdown(wait=True)
+
+class ExtractionHTTPServer(ExtractionServerMixin, ThreadingHTTPServer):
+    pass
+
+class ExtractionUnixServer(ExtractionServerMixin, ThreadingMixIn, UnixStreamServer):
+    pass
+
+def make_server(host: str = "127.0.0.1", port: int = 8080, unix_socket: str | None = None,
+                workers: int | None = None, queue_size: int | None = None, use_trie: bool = True):
+    """
+    Create the server on a TCP port, or on a Unix socket when `unix_socket` is given
+    """
+    if unix_socket is not None:
+        if os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+        server = ExtractionUnixServer(unix_socket, ExtractionHandler)
+    else:
+        server = ExtractionHTTPServer((host, port), ExtractionHandler)
+    server.setup_extraction(
+        workers if workers is not None else SERVE_WORKERS,
+        queue_size if queue_size is not None else SERVE_QUEUE_SIZE,
+        use_trie
+    )
+    return server
+
+def serve(host: str = "127.0.0.1", port: int = 8080, unix_socket: str | None = None,
+          workers: int | None = None, queue_size: int | None = None, use_trie: bool = True):
+    """
+    Warm up the caches and the connection pool, then serve until interrupted
+    """
+    start = perf_counter()
+    warm_up(use_trie)
+    logging.debug("time warming up: %s", perf_counter() - start)
+
+    server = make_server(host, port, unix_socket, workers, queue_size, use_trie)
+    address = unix_socket if unix_socket is not None else "http://%s:%s" % server.server_address[:2]
+    logging.info("serving on %s with %s workers", address, server.workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if unix_socket is not None and os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+        db.close_pool()
@@ -0,0 +1,338 @@
+"""
+SQLite snapshot of `law_alias` and `law_element` (and optionally the amount of cases per
+law element), for resolving references fully offline. A snapshot is written with
+`linkextractor export` and used by pointing LINKEXTRACTOR_DB_URL (or `-d`) at it with
+a `sqlite:///path/to/laws.sqlite` url, after which the lookups in utils.py query the
+snapshot instead of Postgres.
+
+The lowercased aliases and numbers are stored in their own (indexed) columns, since the
+lower() of SQLite only folds ASCII characters.
+"""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from time import time
+from typing import Dict, List, Tuple
+
+from linkextractor import db
+from linkextractor.types import Alias, AliasList
+
+# words of an alias, the \w+ of the regexp_matches in utils.get_alias_ngram_limits
+_WORD_PATTERN = re.compile(r"\w+")
+
+_SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "laws.sqlite")
+
+# rows fetched from Postgres and inserted into the snapshot at once
+EXPORT_BATCH_SIZE = 50000
+
+SCHEMA = """
+    CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+    CREATE TABLE law_alias (
+        id INTEGER PRIMARY KEY,
+        alias TEXT NOT NULL,
+        alias_lower TEXT NOT NULL,
+        bwb_id TEXT NOT NULL
+    );
+    CREATE TABLE law_element (
+        id INTEGER PRIMARY KEY,
+        bwb_id TEXT NOT NULL,
+        type TEXT,
+        number TEXT,
+        number_lower TEXT,
+        bwb_label_id,
+        title TEXT
+    );
+    CREATE TABLE case_law_count (
+        bwb_id TEXT NOT NULL,
+        bwb_label_id,
+        amount INTEGER NOT NULL,
+        PRIMARY KEY (bwb_id, bwb_label_id)
+    );
+"""
+
+INDEXES = """
+    CREATE INDEX law_alias_alias_lower ON law_alias (alias_lower, bwb_id);
+    CREATE INDEX law_alias_bwb_id ON law_alias (bwb_id);
+    CREATE INDEX law_element_lookup ON law_element (bwb_id, type, number_lower);
+"""
+
+def get_snapshot_path(url: str | None = None) -> str | None:
+    """
+    Path of the snapshot of a `sqlite:///path` url (by default LINKEXTRACTOR_DB_URL), None
+    for any other url
+    """
+    url = url if url is not None else db.DB_URL
+    if url is None or not db.is_sqlite(url):
+        return None
+    path = url[len("sqlite://"):]
+    # sqlite:///laws.sqlite is relative, sqlite:////data/laws.sqlite absolute
+    return path[1:] if path.startswith("/") else path
+
+def _lower(value):
+    return str(value).lower() if value is not None else None
+
+def export_snapshot(path: str | None = None, cases: bool = False) -> str:
+    """
+    Copy `law_alias` and `law_element` from the Postgres database into a new SQLite
+    snapshot, and with cases=True the amount of cases per (bwb_id, bwb_label_id) from
+    `case_law`. The snapshot is written next to its destination and moved in place
+    atomically.
+    """
+    from linkextractor.law_index import get_data_fingerprint
+
+    if path is None:
+        path = _SNAPSHOT_PATH
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.unlink(tmp_path)
+
+    start = time()
+    snapshot = sqlite3.connect(tmp_path)
+    try:
+        snapshot.executescript("PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF;")
+        snapshot.executescript(SCHEMA)
+
+        with db.get_conn() as conn:
+            with conn.cursor() as cur:
+                # repeatable read, so that the fingerprint matches the rows that are read
+                cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                fingerprint = get_data_fingerprint(cur)
+                cur.execute("SELECT id, alias, bwb_id FROM law_alias")
+                snapshot.executemany(
+                    "INSERT INTO law_alias (id, alias, alias_lower, bwb_id) VALUES (?, ?, ?, ?)",
+                    ((id, alias, _lower(alias), bwb_id) for id, alias, bwb_id in cur)
+                )
+
+            # stream law_element through a server-side cursor, it is by far the largest table
+            with conn.cursor(name="linkextractor_snapshot") as cur:
+                cur.itersize = EXPORT_BATCH_SIZE
+                cur.execute("SELECT id, bwb_id, type, number, bwb_label_id, title FROM law_element")
+                snapshot.executemany(
+                    "INSERT INTO law_element (id, bwb_id, type, number, number_lower, bwb_label_id, title) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    ((id, bwb_id, type, number, _lower(number), bwb_label_id, title) for id, bwb_id, type, number, bwb_label_id, title in cur)
+                )
+
+            if cases:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT l.bwb_id, l.bwb_label_id, COUNT(DISTINCT cl.case_id)
+                        FROM law_element l
+                        JOIN case_law cl ON (cl.law_id = l.id)
+                        GROUP BY l.bwb_id, l.bwb_label_id
+                    """)
+                    snapshot.executemany("INSERT INTO case_law_count (bwb_id, bwb_label_id, amount) VALUES (?, ?, ?)", cur)
+
+        (max_alias_length,) = snapshot.execute("SELECT COALESCE(MAX(LENGTH(alias_lower)), 0) FROM law_alias").fetchone()
+        snapshot.executemany("INSERT INTO metadata (key, value) VALUES (?, ?)", [
+            ("fingerprint", fingerprint),
+            ("max_alias_length", str(max_alias_length)),
+            ("cases", "1" if cases else "0"),
+            ("created", str(time())),
+        ])
+        snapshot.executescript(INDEXES)
+        snapshot.execute("ANALYZE")
+        snapshot.commit()
+    finally:
+        snapshot.close()
+
+    os.replace(tmp_path, path)
+    logging.debug("time exporting snapshot: %s", time() - start)
+    return path
+
+# connection per thread (sqlite3 connections can not be shared between threads) and process
+_LOCAL = threading.local()
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Returns the read-only connection of this thread to the snapshot in LINKEXTRACTOR_DB_URL
+    """
+    path = get_snapshot_path()
+    assert path is not None, "the database url is not a sqlite:/// url"
+
+    key = (os.getpid(), path)
+    conn = getattr(_LOCAL, "conn", None)
+    if conn is not None and getattr(_LOCAL, "key", None) == key:
+        return conn
+
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"no snapshot at {path}, create it with `linkextractor export`")
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    _LOCAL.conn = conn
+    _LOCAL.key = key
+    _LOCAL.max_alias_length = None
+    return conn
+
+def _get_max_alias_length(conn: sqlite3.Connection) -> int:
+    # from the metadata (computed for snapshots exported without it), once per connection
+    if _LOCAL.max_alias_length is None:
+        row = conn.execute("SELECT value FROM metadata WHERE key = 'max_alias_length'").fetchone()
+        if row is None:
+            row = conn.execute("SELECT MAX(LENGTH(alias_lower)) FROM law_alias").fetchone()
+        _LOCAL.max_alias_length = int(row[0] or 0)
+    return _LOCAL.max_alias_length
+
+def get_metadata() -> Dict[str, str]:
+    return dict(get_connection().execute("SELECT key, value FROM metadata").fetchall())
+
+def get_aliases() -> List[str]:
+    return [alias for (alias,) in get_connection().execute("SELECT DISTINCT alias_lower FROM law_alias")]
+
+def get_alias_payload_rows() -> List[Tuple[str, str, str]]:
+    """
+    Rows of utils.ALIAS_PAYLOADS_QUERY: every alias with the bwb_id of its law and the
+    canonical (longest) alias of that law
+    """
+    return get_connection().execute("""
+        WITH canonical AS (
+            SELECT bwb_id, alias, ROW_NUMBER() OVER (PARTITION BY bwb_id ORDER BY LENGTH(alias) DESC, alias) AS length_rank
+            FROM law_alias
+        )
+        SELECT DISTINCT la.alias_lower, la.bwb_id, canonical.alias
+        FROM law_alias la
+        JOIN canonical ON canonical.bwb_id = la.bwb_id AND canonical.length_rank = 1
+    """).fetchall()
+
+def find_laws(fragment_tuples: List[Tuple[str, str]], alias: str | None = None, bwb_id: str | None = None) -> List[dict]:
+    """
+    Snapshot version of utils.find_laws, for fragment tuples from get_fragment_tuples
+    """
+    narrow_fragment_type, narrow_fragment_number = fragment_tuples[-1]
+    candidate = "alias_lower = ?" if alias is not None else "bwb_id = ?"
+
+    start = time()
+    rows = get_connection().execute(f"""
+        WITH fragment (type, number) AS (
+            VALUES {",".join("(?, ?)" for _ in fragment_tuples)}
+        ),
+        candidate AS (
+            SELECT DISTINCT bwb_id FROM law_alias WHERE {candidate}
+        ),
+        qualifying_bwb AS (
+            SELECT le.bwb_id
+            FROM law_element le
+            JOIN candidate c ON c.bwb_id = le.bwb_id
+            JOIN fragment f ON le.type = f.type AND le.number_lower = f.number
+            GROUP BY le.bwb_id
+            HAVING COUNT(DISTINCT le.type || char(31) || le.number_lower) = ?
+        )
+        SELECT DISTINCT
+            le.type, le.number, le.bwb_id, le.bwb_label_id, le.title
+        FROM
+            law_element AS le
+        JOIN
+            qualifying_bwb qb ON le.bwb_id = qb.bwb_id
+        WHERE
+            le.type = ? AND le.number_lower = ?
+        ORDER BY
+            le.bwb_id, le.bwb_label_id IS NULL, le.bwb_label_id
+    """, (
+        *(value for fragment in fragment_tuples for value in fragment),
+        alias.lower() if alias is not None else bwb_id,
+        len(fragment_tuples),
+        narrow_fragment_type,
+        narrow_fragment_number
+    )).fetchall()
+    logging.debug("time query find_laws (snapshot): %s", time() - start)
+
+    return [
+        {
+            'type': row[0],
+            'number': row[1],
+            'bwb_id': row[2],
+            'bwb_label_id': row[3],
+            'title': row[4],
+        } for row in rows
+    ]
+
+def find_longest_alias_in_substring(input_text: str) -> Alias | None:
+    """
+    Snapshot version of utils.find_longest_alias_in_substring: the longest alias that
+    input_text starts with, looked up as an index lookup of every prefix of input_text
+    """
+    conn = get_connection()
+    max_length = _get_max_alias_length(conn)
+    text = input_text.lower()
+    prefixes = [text[:i] for i in range(1, min(len(text), max_length) + 1)]
+    if len(prefixes) == 0:
+        return None
+
+    row = conn.execute(f"""
+        SELECT alias, bwb_id
+        FROM law_alias
+        WHERE alias_lower IN ({",".join("?" for _ in prefixes)})
+        ORDER BY LENGTH(alias_lower) DESC
+        LIMIT 1
+    """, prefixes).fetchone()
+    if row is None:
+        return None
+    return {
+        'alias': row[0],
+        'bwb_id': row[1]
+    }
+
+def find_matching_aliases(pattern: str) -> AliasList:
+    """
+    Snapshot version of utils.find_matching_aliases, for an (escaped) LIKE pattern
+    """
+    rows = get_connection().execute(r"""
+        WITH ranked_aliases AS (
+            SELECT
+                a.alias,
+                a.bwb_id,
+                ROW_NUMBER() OVER (PARTITION BY a.bwb_id ORDER BY LENGTH(a.alias) DESC) AS length_rank
+            FROM law_alias a
+            WHERE a.bwb_id IN (
+                SELECT DISTINCT bwb_id
+                FROM law_alias
+                WHERE alias_lower LIKE ? ESCAPE '\'
+            )
+        )
+        SELECT alias, bwb_id
+        FROM ranked_aliases
+        WHERE length_rank = 1
+    """, (pattern.lower(),)).fetchall()
+    return [{
+        'alias': row[0],
+        'bwb_id': row[1]
+    } for row in rows]
+
+def find_aliases(ngrams: List[str]) -> List[str]:
+    """
+    The (lowercased) aliases among the word n-grams of utils.get_ngrams
+    """
+    return [alias for (alias,) in get_connection().execute(
+        "SELECT DISTINCT alias_lower FROM law_alias WHERE alias_lower IN (SELECT value FROM json_each(?))",
+        (json.dumps(ngrams),)
+    )]
+
+def get_alias_ngram_limits() -> Tuple[int, int]:
+    """
+    Snapshot version of utils.get_alias_ngram_limits
+    """
+    max_tokens = max_length = 0
+    for alias in get_aliases():
+        max_tokens = max(max_tokens, len(_WORD_PATTERN.findall(alias)))
+        max_length = max(max_length, len(alias))
+    return max_tokens, max_length
+
+def get_amount_cases(ids_list: List[Tuple]) -> Dict[Tuple, int]:
+    """
+    Snapshot version of utils.get_amount_cases_by_bwb_and_label_ids, only available in
+    snapshots that were exported with the case counts
+    """
+    if get_metadata().get("cases") != "1":
+        raise ValueError("the snapshot has no case counts, export it with `linkextractor export --cases`")
+    conn = get_connection()
+    id_lookup = {}
+    for bwb_id, bwb_label_id in ids_list:
+        row = conn.execute(
+            "SELECT amount FROM case_law_count WHERE bwb_id = ? AND bwb_label_id = ?",
+            (bwb_id, bwb_label_id)
+        ).fetchone()
+        if row is not None:
+            id_lookup[(bwb_id, bwb_label_id)] = row[0]
+    return id_lookup
@@ -0,0 +1,82 @@
+"""
+Index of the spans of matches in a text, for deduplicating matches and resolving
+overlapping matches without comparing every match against every other match.
+"""
+
+from bisect import bisect_left
+from typing import Callable, Hashable, Iterable, List, Set, Tuple, TypeVar
+
+Span = Tuple[int, int]
+T = TypeVar("T")
+
+class SpanIndex:
+    """
+    Set of spans (optionally combined with a key, e.g. the fragments of a match) that
+    are ordered by start, so that duplicates are found with a hash lookup and overlaps
+    with a binary search.
+    """
+
+    def __init__(self, spans: Iterable[Span] = ()):
+        self._keys: Set[Tuple[Span, Hashable]] = set()
+        self._spans: List[Span] = []
+        # longest span in the index, bounds how far back an overlapping span can start
+        self._max_length = 0
+        for span in spans:
+            self.add(span)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, span: Span):
+        return (tuple(span), None) in self._keys
+
+    def contains(self, span: Span, key: Hashable = None) -> bool:
+        return (tuple(span), key) in self._keys
+
+    def add(self, span: Span, key: Hashable = None) -> bool:
+        """
+        Add a span (with key), returns False if it was already in the index
+        """
+        span = tuple(span)
+        if (span, key) in self._keys:
+            return False
+        self._keys.add((span, key))
+        i = bisect_left(self._spans, span)
+        if i == len(self._spans) or self._spans[i] != span:
+            self._spans.insert(i, span)
+            self._max_length = max(self._max_length, span[1] - span[0])
+        return True
+
+    def overlaps(self, span: Span) -> bool:
+        """
+        True if span overlaps with any span in the index
+        """
+        start, end = span
+        # only spans that start in [start - max_length, end) can overlap
+        i = bisect_left(self._spans, (start - self._max_length, start - self._max_length))
+        while i < len(self._spans) and self._spans[i][0] < end:
+            other_start, other_end = self._spans[i]
+            if other_end > start:
+                return True
+            i += 1
+        return False
+
+    def spans(self) -> List[Span]:
+        return list(self._spans)
+
+def longest_non_overlapping(items: List[T], span: Callable[[T], Span]) -> List[T]:
+    """
+    Resolve overlapping items: the longest item wins and every item that overlaps with an
+    item that won is dropped, in one sweep over the items ordered by length. Items of the
+    same length are preferred in their original order. The result keeps the original order.
+    """
+    order = sorted(range(len(items)), key=lambda i: (span(items[i])[0] - span(items[i])[1], i))
+    index = SpanIndex()
+    keep = []
+    for i in order:
+        item_span = span(items[i])
+        if index.overlaps(item_span):
+            continue
+        index.add(item_span)
+        keep.append(i)
+    return [items[i] for i in sorted(keep)]
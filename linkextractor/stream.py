@@ -0,0 +1,96 @@
+"""
+Extraction of links from texts that are too large to handle as a whole, by reading them
+in chunks with an overlap window between consecutive chunks.
+"""
+
+import logging
+import os
+from typing import Iterable, Iterator, TextIO, Union
+
+from linkextractor.search import extract_links
+
+# characters read from the stream per chunk
+STREAM_CHUNK_SIZE = int(os.getenv("LINKEXTRACTOR_STREAM_CHUNK_SIZE", 1 << 20))
+# characters at the end of a chunk that are scanned again with the next chunk, references
+# up to this length are found exactly as in the whole text
+STREAM_OVERLAP = int(os.getenv("LINKEXTRACTOR_STREAM_OVERLAP", 4096))
+# characters kept before the point where the next chunk is scanned from, for look-behinds
+# and word boundaries
+_CONTEXT = 64
+
+def _read_chunks(stream: Union[str, TextIO, Iterable[str]], chunk_size: int) -> Iterator[str]:
+    if isinstance(stream, str):
+        for offset in range(0, len(stream), chunk_size):
+            yield stream[offset:offset+chunk_size]
+    elif hasattr(stream, "read"):
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        yield from stream
+
+def extract_links_stream(
+    stream: Union[str, TextIO, Iterable[str]],
+    chunk_size: int | None = None,
+    overlap: int | None = None,
+    **kwargs
+) -> Iterator[dict]:
+    """
+    Extract the links of a text that is read from a (text mode) file, an iterable of
+    strings or a string, in chunks of `chunk_size` characters. Only a chunk and the
+    `overlap` characters after it are held in memory at once.
+
+    Each chunk is scanned together with the overlap, but only links that start within the
+    chunk are yielded; the overlap is scanned again as part of the next chunk. Links are
+    yielded per chunk (ordered by their start) as soon as the chunk is scanned, with spans
+    that are offsets in the whole text. For references shorter than the overlap, the
+    links are the same as those of extract_links on the whole text. Other keyword
+    arguments are passed on to extract_links.
+    """
+    if chunk_size is None:
+        chunk_size = STREAM_CHUNK_SIZE
+    if overlap is None:
+        overlap = STREAM_OVERLAP
+    assert 0 < overlap < chunk_size, "overlap should be smaller than the chunk size"
+    assert not kwargs.get("exact", False), "exact search is not supported on streams"
+
+    chunks = _read_chunks(stream, chunk_size)
+    buffer = ""
+    # offset of the buffer in the whole text, and the offset up to which links are yielded
+    base = 0
+    emitted_until = 0
+    final = False
+
+    while not final:
+        while len(buffer) < chunk_size + overlap:
+            chunk = next(chunks, None)
+            if chunk is None:
+                final = True
+                break
+            buffer += chunk
+        if len(buffer) == 0:
+            return
+
+        safe_end = len(buffer) if final else len(buffer) - overlap
+        restart = safe_end
+        links = extract_links(buffer, **kwargs)
+        logging.debug("stream chunk at %s (%s characters): %s links", base, len(buffer), len(links))
+
+        for link in sorted(links, key=lambda link: link['context']['span']):
+            start, end = link['context']['span']
+            if start < emitted_until - base or start >= safe_end:
+                continue
+            if end > safe_end:
+                # scan the next chunk from the start of this reference, so that the
+                # references after it are matched as in the whole text
+                restart = min(restart, start)
+            link['context']['span'] = (start + base, end + base)
+            yield link
+
+        # references longer than the overlap are not followed further back than this
+        cut = max(restart - _CONTEXT, safe_end - overlap, 0)
+        emitted_until = base + safe_end
+        base += cut
+        buffer = buffer[cut:]
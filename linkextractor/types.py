@@ -1,4 +1,4 @@
-from typing import List, NotRequired, TypedDict
+from typing import Any, List, NamedTuple, NotRequired, TypedDict
 
 class Resource(TypedDict):
     title: str
@@ -21,4 +21,23 @@ class Alias(TypedDict):
     bwb_id: str
     alias: str
 
-AliasList = List[Alias]
\ No newline at end of file
+AliasList = List[Alias]
+
+class AliasHit(NamedTuple):
+    """
+    Occurrence of an alias in a text, text[start:end] equals alias (case-insensitively)
+    """
+    start: int
+    end: int
+    alias: str
+
+AliasHitList = List[AliasHit]
+
+class BatchResult(TypedDict):
+    """
+    Result of a single document of a batch, error is set (and links empty) if extracting
+    the links of the document failed
+    """
+    id: Any
+    links: LinkList
+    error: str | None
@@ -1,14 +1,124 @@
 import logging
-from typing import Dict, Tuple, Union, List
+from typing import Dict, FrozenSet, Iterable, Tuple, Union, List
 import re
-from linkextractor.db import get_conn
-from linkextractor.types import Alias, AliasList, Fragment
+from psycopg2.extensions import encodings
+from linkextractor.automaton import AliasAutomaton
+from linkextractor import db, snapshot
+from linkextractor.cache import LRUCache
+from linkextractor.db import get_conn, is_sqlite
+from linkextractor.law_index import get_law_index
+from linkextractor.metrics import ExtractStats
+from linkextractor.types import Alias, AliasHit, AliasHitList, AliasList, Fragment
 from time import time
 import os
 
 _TRIE_CACHE = None
 _TRIE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "aliases.trie")
 
+# open the trie file with mmap instead of reading it into the heap of the process, so
+# that all processes that use it share the same pages
+TRIE_MMAP = os.getenv("LINKEXTRACTOR_TRIE_MMAP", "1") not in ("0", "false", "no")
+
+def _open_trie(path: str):
+    import marisa_trie
+    if TRIE_MMAP:
+        return marisa_trie.Trie().mmap(path)
+    return marisa_trie.Trie().load(path)
+
+ALIASES_QUERY = "SELECT DISTINCT lower(alias) FROM law_alias"
+
+# every alias with the bwb_id of its law and the canonical (longest) alias of that law
+ALIAS_PAYLOADS_QUERY = """
+    SELECT DISTINCT lower(la.alias), la.bwb_id, canonical.alias
+    FROM law_alias la
+    JOIN (
+        SELECT DISTINCT ON (bwb_id) bwb_id, alias
+        FROM law_alias
+        ORDER BY bwb_id, LENGTH(alias) DESC, alias
+    ) canonical ON canonical.bwb_id = la.bwb_id
+"""
+
+# aliases among the word n-grams of a text, see get_ngrams
+NGRAM_ALIASES_QUERY = "SELECT DISTINCT lower(alias) FROM law_alias WHERE lower(alias) = ANY($1::text[])"
+
+# longest alias that a text starts with, evaluated against every row of law_alias
+LONGEST_ALIAS_QUERY = """
+    SELECT alias, bwb_id
+    FROM law_alias
+    WHERE $1::text ILIKE alias || '%'
+    ORDER BY LENGTH(alias) DESC
+    LIMIT 1
+"""
+
+# law elements of the narrowest fragment ($4, $5) in the candidate laws that contain all
+# ($3) fragments ($1, $2). The fragments are passed as arrays, so that their amount does
+# not change the statement; the candidates are filled in by LAWS_QUERY and
+# BWB_IDS_LAWS_QUERY.
+_LAWS_QUERY = """
+    WITH fragment (type, number) AS (
+        SELECT * FROM unnest($1::text[], $2::text[])
+    ),
+    candidate (bwb_id) AS (
+        {candidate}
+    ),
+    qualifying_bwb AS (
+        SELECT le.bwb_id
+        FROM law_element le
+        JOIN candidate c ON c.bwb_id = le.bwb_id
+        JOIN fragment f ON le.type = f.type AND lower(le.number) = f.number
+        GROUP BY le.bwb_id
+        HAVING COUNT(DISTINCT (le.type, lower(le.number))) = $3::int
+    )
+    SELECT
+        le.type, le.number, le.bwb_id, le.bwb_label_id, le.title
+    FROM
+        law_element AS le
+    JOIN
+        qualifying_bwb qb ON le.bwb_id = qb.bwb_id
+    WHERE
+        le.type = $4::text AND lower(le.number) = $5::text
+    GROUP BY
+        le.type, le.number, le.bwb_id, le.bwb_label_id, le.title
+    ORDER BY
+        le.bwb_id, le.bwb_label_id
+"""
+
+# the candidates are the laws of an alias ($6) or a bwb_id ($7), looked up in law_alias:
+# like the law index and the snapshot, only laws that have an alias are candidates
+LAWS_QUERY = _LAWS_QUERY.format(candidate="""
+        SELECT bwb_id FROM law_alias WHERE lower(alias) = $6::text
+        UNION
+        SELECT bwb_id FROM law_alias WHERE bwb_id = $7::text
+""")
+
+# the candidates are a list of bwb_ids ($6) of laws that have an alias, e.g. from the
+# alias payloads, so law_alias is not queried
+BWB_IDS_LAWS_QUERY = _LAWS_QUERY.format(candidate="SELECT unnest($6::text[])")
+
+# cases (ecli_id and sources) that refer to a law element
+CASES_QUERY = """
+    SELECT c.ecli_id, STRING_AGG(distinct cl.source, ',')
+    FROM law_element l
+    JOIN case_law cl ON (cl.law_id = l.id)
+    JOIN legal_case c ON (cl.case_id = c.id)
+    WHERE
+        l.bwb_id = $1::text AND
+        l.bwb_label_id = $2::int
+    GROUP BY c.id
+    LIMIT 5000
+"""
+
+# amount of cases that refer to each of a list of law elements, as arrays of bwb_ids and
+# bwb_label_ids
+AMOUNT_CASES_QUERY = """
+    SELECT l.bwb_id, l.bwb_label_id, COUNT(DISTINCT cl.case_id)
+    FROM law_element l
+    JOIN case_law cl ON (cl.law_id = l.id)
+    WHERE
+        (l.bwb_id, l.bwb_label_id) IN (SELECT * FROM unnest($1::text[], $2::int[]))
+    GROUP BY l.bwb_id, l.bwb_label_id
+"""
+
 def get_trie():
     global _TRIE_CACHE
     import marisa_trie
@@ -21,79 +131,389 @@ def get_trie():
         if os.path.exists(path):
             # Load existing trie file
             start = time()
-            trie = marisa_trie.Trie().load(path)
+            trie = _open_trie(path)
             _TRIE_CACHE = trie
             logging.debug("time loading trie file: %s", time() - start)
         else:
             # Else: build from DB
             start = time()
-            with get_conn() as conn:
-                with conn.cursor() as cur:
-                    cur.execute("SELECT DISTINCT lower(alias) FROM law_alias")
-                    aliases = []
-                    for (alias,) in cur.fetchall():
-                        norm = str(alias).lower()
-                        aliases.append(norm)
+            if is_sqlite():
+                aliases = snapshot.get_aliases()
+            else:
+                with get_conn() as conn:
+                    with conn.cursor() as cur:
+                        cur.execute(ALIASES_QUERY)
+                        aliases = []
+                        for (alias,) in cur.fetchall():
+                            norm = str(alias).lower()
+                            aliases.append(norm)
 
             # Build trie
             trie = marisa_trie.Trie(aliases)
             trie.save(path)
             logging.debug("time building and saving trie file: %s", time() - start)
-            _TRIE_CACHE = trie
+            # continue with the saved file, so that it is mapped like a loaded trie
+            _TRIE_CACHE = _open_trie(path)
 
     assert _TRIE_CACHE is not None, "_TRIE_CACHE could not be generaetd"
     return _TRIE_CACHE
 
-def find_aliases_in_text(text, use_trie=False):
+_AUTOMATON_CACHE: AliasAutomaton | None = None
+
+def get_automaton() -> AliasAutomaton:
+    """
+    Returns the Aho-Corasick automaton of all aliases in the trie, which is built once
+    per process
+    """
+    global _AUTOMATON_CACHE
+
+    if _AUTOMATON_CACHE is None:
+        trie = get_trie()
+        start = time()
+        _AUTOMATON_CACHE = AliasAutomaton(trie.keys())
+        logging.debug("time building alias automaton: %s", time() - start)
+
+    return _AUTOMATON_CACHE
+
+_PAYLOADS_CACHE = None
+_PAYLOADS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "aliases.payloads.trie")
+
+# resolve aliases to their laws with the payloads trie instead of joining law_alias
+ALIAS_PAYLOADS = os.getenv("LINKEXTRACTOR_ALIAS_PAYLOADS", "1") not in ("0", "false", "no")
+
+# separator between the bwb_id and canonical alias in a payload
+_PAYLOAD_SEP = "\x1f"
+
+def write_alias_payloads(path: str, rows: Iterable[Tuple[str, str, str]]):
+    """
+    Write the payloads trie from (alias, bwb_id, canonical alias) rows
+    """
+    import marisa_trie
+    payloads = [
+        (str(alias).lower(), f"{bwb_id}{_PAYLOAD_SEP}{canonical_alias}".encode("utf-8"))
+        for alias, bwb_id, canonical_alias in rows
+    ]
+    marisa_trie.BytesTrie(payloads).save(path)
+
+def get_alias_payloads():
+    """
+    Returns the trie that maps each lower(alias) to its payloads: one value per law that
+    the alias belongs to, holding the bwb_id of the law and its canonical (longest)
+    alias. Loaded from, or built into, a file next to the alias trie.
+    """
+    global _PAYLOADS_CACHE
+
+    if _PAYLOADS_CACHE is not None:
+        return _PAYLOADS_CACHE
+
+    path = _PAYLOADS_PATH
+    if not os.path.exists(path):
+        start = time()
+        if is_sqlite():
+            write_alias_payloads(path, snapshot.get_alias_payload_rows())
+        else:
+            with get_conn() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(ALIAS_PAYLOADS_QUERY)
+                    write_alias_payloads(path, cur.fetchall())
+
+        logging.debug("time building and saving alias payloads file: %s", time() - start)
+
+    start = time()
+    _PAYLOADS_CACHE = _open_payloads(path)
+    logging.debug("time loading alias payloads file: %s", time() - start)
+    return _PAYLOADS_CACHE
+
+def _open_payloads(path: str):
+    import marisa_trie
+    if TRIE_MMAP:
+        return marisa_trie.BytesTrie().mmap(path)
+    return marisa_trie.BytesTrie().load(path)
+
+def get_alias_laws(alias: str) -> AliasList:
+    """
+    Returns the laws of an alias (case-insensitively), each as its bwb_id with the
+    canonical alias of that law
+    """
+    laws: AliasList = []
+    for payload in get_alias_payloads().get(alias.lower(), []):
+        bwb_id, canonical_alias = payload.decode("utf-8").split(_PAYLOAD_SEP, 1)
+        laws.append({'alias': canonical_alias, 'bwb_id': bwb_id})
+    return sorted(laws, key=lambda law: law['bwb_id'])
+
+def get_alias_bwb_ids(alias: str) -> List[str]:
+    return [law['bwb_id'] for law in get_alias_laws(alias)]
+
+# the payloads that _ALIASED_BWB_IDS was collected from, with its bwb_ids
+_ALIASED_BWB_IDS: Tuple[object, FrozenSet[str]] | None = None
+
+def get_aliased_bwb_ids() -> FrozenSet[str]:
+    """
+    The bwb_ids of all laws in the payloads, i.e. the laws that have an alias. Collected
+    once per loaded payloads trie.
+    """
+    global _ALIASED_BWB_IDS
+
+    payloads = get_alias_payloads()
+    if _ALIASED_BWB_IDS is None or _ALIASED_BWB_IDS[0] is not payloads:
+        start = time()
+        bwb_ids = frozenset(payload.decode("utf-8").split(_PAYLOAD_SEP, 1)[0] for _, payload in payloads.items())
+        _ALIASED_BWB_IDS = (payloads, bwb_ids)
+        logging.debug("time collecting bwb_ids of alias payloads: %s", time() - start)
+    return _ALIASED_BWB_IDS[1]
+
+def swap_alias_index(trie, payloads, automaton: AliasAutomaton):
+    """
+    Replace the loaded trie, payloads and automaton at once. Extractions that are in
+    progress keep using the objects they already hold, new calls get the new ones. The
+    n-gram limits are forgotten, a new alias can be longer than the old ones.
+    """
+    global _TRIE_CACHE, _AUTOMATON_CACHE, _PAYLOADS_CACHE, _ALIAS_NGRAM_LIMITS
+    # the payloads go first, so that a newly detected alias always has its laws
+    _PAYLOADS_CACHE = payloads
+    _TRIE_CACHE = trie
+    _AUTOMATON_CACHE = automaton
+    _ALIAS_NGRAM_LIMITS = None
+    invalidate_laws_cache()
+
+def reset_trie():
+    """
+    Forget the loaded trie, automaton, payloads and n-gram limits, they will be (re)loaded
+    on the next call to get_trie(), get_automaton(), get_alias_payloads() and
+    get_alias_ngram_limits()
+    """
+    global _TRIE_CACHE, _AUTOMATON_CACHE, _PAYLOADS_CACHE, _ALIAS_NGRAM_LIMITS
+    _TRIE_CACHE = None
+    _AUTOMATON_CACHE = None
+    _PAYLOADS_CACHE = None
+    _ALIAS_NGRAM_LIMITS = None
+    invalidate_laws_cache()
+
+# laws of resolved (fragments, title) lookups, including lookups that resolved to no law
+LAWS_CACHE_SIZE = int(os.getenv("LINKEXTRACTOR_LAWS_CACHE_SIZE", 4096))
+# seconds after which a cached lookup is resolved again, 0 to keep them until invalidated
+LAWS_CACHE_TTL = float(os.getenv("LINKEXTRACTOR_LAWS_CACHE_TTL", 3600))
+_LAWS_CACHE = LRUCache(maxsize=max(LAWS_CACHE_SIZE, 1), ttl=LAWS_CACHE_TTL or None)
+# version of the alias index, cached lookups of an older version are never hit again
+_ALIAS_INDEX_VERSION = 0
+
+def invalidate_laws_cache():
+    """
+    Forget the cached lookups, called whenever the alias index is swapped or reset
+    """
+    global _ALIAS_INDEX_VERSION
+    _ALIAS_INDEX_VERSION += 1
+    _LAWS_CACHE.clear()
+
+def get_laws_cache_info() -> Dict[str, int]:
+    return {**_LAWS_CACHE.info(), "version": _ALIAS_INDEX_VERSION}
+
+def laws_cache_key(fragments: Fragment, title: str) -> tuple:
+    # the version is part of the key, so that a lookup that was resolved while the
+    # index was swapped does not end up in the cache of the new version
+    return (_ALIAS_INDEX_VERSION, db.DB_URL, title.lower(), tuple(get_fragment_tuples(fragments)))
+
+def get_cached_laws(key: tuple) -> List[dict] | None:
+    if LAWS_CACHE_SIZE <= 0:
+        return None
+    laws = _LAWS_CACHE.get(key)
+    return [dict(law) for law in laws] if laws is not None else None
+
+def cache_laws(key: tuple, laws: List[dict]):
+    if LAWS_CACHE_SIZE > 0:
+        _LAWS_CACHE.put(key, tuple(dict(law) for law in laws))
+
+def normalize_text(text: str) -> str:
+    """
+    Lowercase text while keeping the offsets of the characters intact
+    """
+    norm_text = text.lower()
+    if len(norm_text) != len(text):
+        # some characters (e.g. "İ") lowercase to more than one character
+        norm_text = "".join(ch if len(ch.lower()) != 1 else ch.lower() for ch in text)
+    return norm_text
+
+def _find_aliases_trie_prefixes(text):
+    """
+    Previous implementation of the trie path of find_aliases_in_text, which queries
+    the trie for every suffix of the text. Kept for benchmarking against the automaton.
+    """
+    trie = get_trie()
+    norm_text = text.lower()
+    results = []
+    for i in range(len(norm_text)):
+        # Find longest alias that matches text[i:]
+        matches = trie.prefixes(norm_text[i:])
+        if matches:
+            # take longest match
+            alias = max(matches, key=len)
+            results.append(alias)
+    return results
+
+def longest_hits(hits: Iterable[AliasHit]) -> AliasHitList:
+    """
+    Deduplicate hits to the longest hit at each start position, ordered by start
+    """
+    longest: Dict[int, AliasHit] = {}
+    for hit in hits:
+        if hit.start not in longest or hit.end > longest[hit.start].end:
+            longest[hit.start] = hit
+    return [longest[start] for start in sorted(longest)]
+
+def find_aliases_in_text(text, use_trie=False) -> AliasHitList:
+    """
+    Find the aliases occurring in text, as hits with the span of each occurrence. Only
+    occurrences that are not part of a larger word are returned (so "LI" is not found
+    in "Burgerlijk"), and only the longest alias at each start position.
+    """
     # prefer Trie
     if use_trie:
-        trie = get_trie()
-        norm_text = text.lower()
-        results = []
-        for i in range(len(norm_text)):
-            # Find longest alias that matches text[i:]
-            matches = trie.prefixes(norm_text[i:])
-            if matches:
-                # take longest match
-                alias = max(matches, key=len)
-                # offset_start = i
-                # offset_end = i + len(alias)
-                results.append(alias)
-        return results
+        # scan the text once with the automaton, taking the longest alias at each position
+        automaton = get_automaton()
+        norm_text = normalize_text(text)
+        return [
+            AliasHit(start, end, norm_text[start:end])
+            for start, end in automaton.longest_matches(norm_text, word_boundaries=True)
+        ]
+
+    # without the trie, look up the word n-grams of the text that can be an alias
+    max_tokens, max_length = get_alias_ngram_limits()
+    ngrams = get_ngrams(text, max_tokens, max_length)
+    if len(ngrams) == 0:
+        return []
+
+    start = time()
+    if is_sqlite():
+        aliases = snapshot.find_aliases(list(ngrams))
+    else:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                db.execute_prepared(cur, "ngram_aliases", NGRAM_ALIASES_QUERY, (list(ngrams),))
+                aliases = [alias for (alias,) in cur.fetchall()]
+    logging.debug("time query aliases of %s n-grams: %s", len(ngrams), time() - start)
+
+    return longest_hits(
+        AliasHit(start, end, alias)
+        for alias in aliases
+        for start, end in ngrams.get(alias, ())
+    )
 
-    # performs WHERE ? LIKE column, instead of WHERE column LIKE ?
-    with get_conn() as conn:
-        with conn.cursor() as cur:
+# a word, with the punctuation in front of it (e.g. "(BES)" in "Uitv.besl. (BES)" or "a,(BES)")
+_NGRAM_WORD_PATTERN = re.compile(r"(?:[^\w\s]+)?(\w+)")
+# punctuation directly after a word, which can be the end of an alias (e.g. "Uitv.besl.")
+_PUNCTUATION_PATTERN = re.compile(r"[^\w\s]+")
+_WORD_CHARACTER_PATTERN = re.compile(r"\w")
 
-            # (wildcard) escaping of input not necessary since the input is the
-            # column in the where clause, not the value
-            # input_text_escaped = re.sub(r'([_%])', r'\\\1', input_text)
+def get_ngrams(text: str, max_tokens: int, max_length: int) -> Dict[str, List[Tuple[int, int]]]:
+    """
+    Word n-grams of up to max_tokens words and max_length characters of the normalised
+    text, with the spans at which they occur. An n-gram starts at a word or within the
+    punctuation in front of it, as long as no word character precedes, and ends at the
+    end of a word or within the punctuation right after it, as long as no word character
+    follows, so each n-gram is a candidate hit of find_aliases_in_text.
+    """
+    norm_text = normalize_text(text)
+    words = list(_NGRAM_WORD_PATTERN.finditer(norm_text))
+
+    ngrams: Dict[str, List[Tuple[int, int]]] = {}
+    for i, word in enumerate(words):
+        for start in range(word.start(), word.start(1) + 1):
+            # the punctuation right after a word, e.g. the "." of "BW.(BES)", is no start
+            if start > 0 and _WORD_CHARACTER_PATTERN.match(norm_text, start - 1):
+                continue
+            for following in words[i:i+max_tokens]:
+                end = following.end()
+                if end - start > max_length:
+                    break
+                ngrams.setdefault(norm_text[start:end], []).append((start, end))
+
+                punctuation = _PUNCTUATION_PATTERN.match(norm_text, end)
+                if punctuation is None:
+                    continue
+                # the whole run of punctuation only when it is not followed by a word
+                last = punctuation.end() - 1 if _WORD_CHARACTER_PATTERN.match(norm_text, punctuation.end()) else punctuation.end()
+                for punctuation_end in range(end + 1, min(last, start + max_length) + 1):
+                    ngrams.setdefault(norm_text[start:punctuation_end], []).append((start, punctuation_end))
+    return ngrams
+
+_ALIAS_NGRAM_LIMITS: Tuple[int, int] | None = None
+
+def get_alias_ngram_limits() -> Tuple[int, int]:
+    """
+    Most words and characters of any alias, which bound the n-grams that are looked up
+    """
+    global _ALIAS_NGRAM_LIMITS
 
+    if _ALIAS_NGRAM_LIMITS is None:
+        if is_sqlite():
+            _ALIAS_NGRAM_LIMITS = snapshot.get_alias_ngram_limits()
+        else:
+            with get_conn() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(r"""
+                        SELECT
+                            MAX((SELECT COUNT(*) FROM regexp_matches(alias, '\w+', 'g'))),
+                            MAX(LENGTH(alias))
+                        FROM law_alias
+                    """)
+                    max_tokens, max_length = cur.fetchone()
+            _ALIAS_NGRAM_LIMITS = (max_tokens or 0, max_length or 0)
+    return _ALIAS_NGRAM_LIMITS
+
+def _find_aliases_like_query(text) -> AliasHitList:
+    """
+    The previous database-side detection, which evaluates the LIKE against every row of
+    law_alias and stops at 50 aliases, kept for `linkextractor bench alias-db`
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
             cur.execute('''
                 SELECT DISTINCT alias FROM law_alias
                 WHERE lower(%s) LIKE '%%' || lower(alias) || '%%'
                 LIMIT 50;
             ''', (text,))
-            
-            results = []
+
+            hits = []
             for (alias,) in cur.fetchall():
-                if re.search(rf"\b{re.escape(alias)}\b", text, flags=re.IGNORECASE):
-                    results.append(alias)
+                for match in re.finditer(rf"(?<!\w){re.escape(alias)}(?!\w)", text, flags=re.IGNORECASE):
+                    hits.append(AliasHit(match.start(), match.end(), alias))
 
-            return results
+            return longest_hits(hits)
+
+def _has_alias_index() -> bool:
+    # whether the laws of an alias are known without querying the database
+    return ALIAS_PAYLOADS or get_law_index() is not None
+
+def _longest_alias_prefix(input_text: str) -> Alias | None:
+    """
+    Longest alias that input_text starts with (and that has a law), from the prefixes
+    of the normalised text in the trie and the laws of the alias in the payloads or
+    the law index
+    """
+    law_index = None if ALIAS_PAYLOADS else get_law_index()
+    for alias in sorted(get_trie().prefixes(normalize_text(input_text)), key=len, reverse=True):
+        bwb_ids = law_index.get_alias_bwb_ids(alias) if law_index is not None else get_alias_bwb_ids(alias)
+        if len(bwb_ids) > 0:
+            return {
+                'alias': alias,
+                'bwb_id': bwb_ids[0]
+            }
+    return None
 
 def find_longest_alias_in_substring(input_text) -> Alias | None:
     # functions similar to find_aliases_in_text, but only does right wildcard and returns single result
     # (used for exact search)
+    if _has_alias_index():
+        return _longest_alias_prefix(input_text)
+    if is_sqlite():
+        return snapshot.find_longest_alias_in_substring(input_text)
+    return _longest_alias_query(input_text)
+
+def _longest_alias_query(input_text: str) -> Alias | None:
+    # the pattern is evaluated against every row of law_alias, only used without an alias index
     with get_conn() as conn:
         with conn.cursor() as cur:
-            cur.execute('''
-                SELECT alias, bwb_id
-                FROM law_alias
-                WHERE %s ILIKE alias || '%%'
-                ORDER BY LENGTH(alias) DESC
-                LIMIT 1;
-            ''', (input_text,))
+            db.execute_prepared(cur, "longest_alias", LONGEST_ALIAS_QUERY, (input_text,))
 
             row = cur.fetchone()
             if not row:
@@ -105,16 +525,24 @@ def find_longest_alias_in_substring(input_text) -> Alias | None:
             }
 
 def find_matching_aliases(name, wildcard=None) -> AliasList:
+    if wildcard is None and ALIAS_PAYLOADS:
+        # the payloads hold the longest alias of each law of the alias
+        return get_alias_laws(name)
+
+    name_escaped = re.sub(r'([_%])', r'\\\1', name)
+    if wildcard is not None:
+        if 'l' in wildcard:
+            name_escaped = '%'+name_escaped
+        if 'r' in wildcard:
+            name_escaped = name_escaped+'%'
+
+    if is_sqlite():
+        return snapshot.find_matching_aliases(name_escaped)
+
     with get_conn() as conn:
         with conn.cursor() as cur:
-            name_escaped = re.sub(r'([_%])', r'\\\1', name)
-            if wildcard is not None:
-                if 'l' in wildcard:
-                    name_escaped = '%'+name_escaped
-                if 'r' in wildcard:
-                    name_escaped = name_escaped+'%'
 
-            cur.execute('''
+            db.execute(cur, "matching_aliases", '''
                 WITH ranked_aliases AS (
                     SELECT
                         a.id,
@@ -138,130 +566,336 @@ def find_matching_aliases(name, wildcard=None) -> AliasList:
                 'bwb_id': row[1]
             } for row in cur.fetchall()]
 
+# order fragments based on specificity, ordered from broad (top) to narrow
+FRAGMENT_TYPE_ORDER = (
+    'wet',
+    'boek',
+    'deel',
+    'titeldeel',
+    'hoofdstuk',
+    'artikel',
+    'paragraaf',
+    # 'subparagraaf', # granularity of lid/subparagraph is not available in db so ommited
+    'afdeling'
+)
+
+def get_fragment_tuples(fragments: Fragment) -> List[Tuple[str, str]]:
+    """
+    Normalise fragments to (type, lower(number)) tuples of the types that are
+    available in the db, ordered from broad to narrow.
+    """
+    order_map = {law_type: index for index, law_type in enumerate(FRAGMENT_TYPE_ORDER)}
+    fragment_tuples: List[Tuple[str, str]] = [
+        (type, str(number).lower()) for type, number in fragments.items()
+        if type in order_map
+    ]
+    return sorted(fragment_tuples, key=lambda frag: order_map[frag[0]])
+
 def find_laws(fragments: Fragment | None = None, alias: str | None = None, bwb_id: str | None = None):
 
     # assert alias is not None and len(alias.strip()) != 0, "alias should not be empty"
     assert (alias is not None and len(alias.strip()) != 0) ^ (bwb_id is not None), "alias should not be empty"
     assert fragments is not None and len(fragments) != 0, "list of fragments should not be empty"
 
-    # order fragments based on specificity, ordered from broad (top) to narrow
-    type_order = (
-        'wet',
-        'boek',
-        'deel',
-        'titeldeel',
-        'hoofdstuk',
-        'artikel',
-        'paragraaf',
-        # 'subparagraaf', # granularity of lid/subparagraph is not available in db so ommited
-        'afdeling'
-    )
+    fragment_tuples = get_fragment_tuples(fragments)
 
-    fragment_tuples: List[Tuple[str, str]] = [
-        (type, str(number).lower()) for type, number in fragments.items()
-        if type in type_order
-    ]
-    order_map = {law_type: index for index, law_type in enumerate(type_order)}
-    fragment_tuples = sorted(fragment_tuples, key=lambda frag: order_map[frag[0]])
-    
+    # answer from the compiled index when it is available
+    law_index = get_law_index()
+    if law_index is not None:
+        return law_index.find_laws(fragment_tuples, alias=alias, bwb_id=bwb_id)
+
+    if is_sqlite():
+        return snapshot.find_laws(fragment_tuples, alias=alias, bwb_id=bwb_id)
+
+    statement = laws_statement(fragment_tuples, alias=alias, bwb_id=bwb_id)
+    if statement is None:
+        return []
+    return _find_laws_query(*statement)
+
+def laws_statement(fragment_tuples: List[Tuple[str, str]], alias: str | None = None, bwb_id: str | None = None) -> Tuple[str, str, tuple] | None:
+    """
+    Name, query and parameters of the prepared statement that resolves the fragment
+    tuples in the laws of alias or bwb_id on Postgres, or None when there is no
+    candidate law. With ALIAS_PAYLOADS the candidates are known from the payloads.
+    """
+    if not ALIAS_PAYLOADS:
+        return "find_laws", LAWS_QUERY, (*_laws_params(fragment_tuples), alias.lower() if alias is not None else None, bwb_id)
+
+    if alias is not None:
+        bwb_ids = get_alias_bwb_ids(alias)
+    else:
+        # only laws that have an alias, like LAWS_QUERY
+        bwb_ids = [bwb_id] if bwb_id in get_aliased_bwb_ids() else []
+    if len(bwb_ids) == 0:
+        return None
+    return "find_laws_bwb_ids", BWB_IDS_LAWS_QUERY, (*_laws_params(fragment_tuples), bwb_ids)
+
+def _laws_params(fragment_tuples: List[Tuple[str, str]]) -> tuple:
     # determine most narrow fragment
     narrow_fragment_type, narrow_fragment_number = fragment_tuples[-1]
+    return (
+        [fragment_type for fragment_type, _ in fragment_tuples],
+        [fragment_number for _, fragment_number in fragment_tuples],
+        len(fragment_tuples),
+        narrow_fragment_type,
+        narrow_fragment_number
+    )
+
+def _find_laws_query(name: str, query: str, params: tuple) -> List[dict]:
+    """
+    Law elements of a statement of laws_statement
+    """
+    logging.debug("params find_laws: %s", params)
 
     with get_conn() as conn:
         with conn.cursor() as cur:
+            db.execute_prepared(cur, name, query, params)
+            logging.debug("results query find_laws: %s", cur.rowcount)
 
-            # if we have an alias
-            if alias is not None and bwb_id is None:
-                params = (
-                    tuple(fragment_tuples),
-                    alias.lower(),
-                    len(fragment_tuples),
-                    narrow_fragment_type,
-                    narrow_fragment_number
-                )
-                
-                logging.debug("params alias: %s", params)
+            return [
+                {
+                    'type': law_row[0],
+                    'number': law_row[1],
+                    'bwb_id': law_row[2],
+                    'bwb_label_id': law_row[3],
+                    'title': law_row[4],
+                } for law_row in cur.fetchall()
+            ]
 
-                laws_query = f"""
-                    WITH qualifying_bwb AS (
-                        SELECT le.bwb_id
-                        FROM (
-                            SELECT bwb_id, bwb_label_id, type, number
-                            FROM law_element
-                            WHERE
-                            (type, lower(number)) in %s
-                        ) le
-                        JOIN law_alias la ON le.bwb_id = la.bwb_id
-                        WHERE lower(la.alias) = %s
-                        GROUP BY le.bwb_id
-                        HAVING COUNT(DISTINCT (type, lower(number))) = %s
-                    )
-                    SELECT
-                        le.type, le.number, le.bwb_id, le.bwb_label_id, le.title
-                    FROM
-                        public.law_element AS le
-                    JOIN
-                        qualifying_bwb qb ON le.bwb_id = qb.bwb_id 
-                    WHERE
-                        le.type = %s AND lower(le.number) = %s
-                    GROUP BY 
-                        le.type, le.number, le.bwb_id, le.bwb_label_id, le.title;
-                """
+# maximum amount of lookups sent to the database in a single batch query
+BATCH_SIZE = 500
 
-            # if a specific bwb_id is provided instead of an alias (in the case of substring-search alias)
-            elif alias is None and bwb_id is not None:
-                params = (
-                    # bwb_id,
-                    tuple(fragment_tuples),
-                    bwb_id,
-                    len(fragment_tuples),
-                    narrow_fragment_type,
-                    narrow_fragment_number
-                )
-                
-                logging.debug("params bwb: %s", params)
+def _values_list(cur, template: str, rows: List[tuple]) -> str:
+    """
+    Render rows as the (escaped) items of a VALUES list
+    """
+    encoding = encodings[cur.connection.encoding]
+    return ",".join(cur.mogrify(template, row).decode(encoding) for row in rows)
+
+def find_laws_batch(lookups: List[Tuple[Fragment, str | None, str | None]]) -> List[List[dict]]:
+    """
+    Batch version of find_laws. Takes a list of (fragments, alias, bwb_id) lookups and
+    returns the list of laws of each lookup, in the same order, resolving all lookups
+    in one query per BATCH_SIZE lookups.
+    """
+
+    requests = []
+    for fragments, alias, bwb_id in lookups:
+        assert (alias is not None and len(alias.strip()) != 0) ^ (bwb_id is not None), "alias should not be empty"
+        assert fragments is not None and len(fragments) != 0, "list of fragments should not be empty"
+        requests.append((get_fragment_tuples(fragments), alias, bwb_id))
+
+    results: List[List[dict]] = [[] for _ in requests]
+    if len(requests) == 0:
+        return results
+
+    law_index = get_law_index()
+    if law_index is not None:
+        for i, (fragment_tuples, alias, bwb_id) in enumerate(requests):
+            results[i] = law_index.find_laws(fragment_tuples, alias=alias, bwb_id=bwb_id)
+        return results
 
+    if is_sqlite():
+        # no round trips to batch
+        for i, (fragment_tuples, alias, bwb_id) in enumerate(requests):
+            results[i] = snapshot.find_laws(fragment_tuples, alias=alias, bwb_id=bwb_id)
+        return results
+
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            for offset in range(0, len(requests), BATCH_SIZE):
+                chunk = requests[offset:offset+BATCH_SIZE]
+
+                request_rows = []
+                fragment_rows = []
+                for idx, (fragment_tuples, alias, bwb_id) in enumerate(chunk, start=offset):
+                    narrow_fragment_type, narrow_fragment_number = fragment_tuples[-1]
+                    request_rows.append((
+                        idx,
+                        alias.lower() if alias is not None else None,
+                        bwb_id,
+                        len(fragment_tuples),
+                        narrow_fragment_type,
+                        narrow_fragment_number
+                    ))
+                    fragment_rows.extend((idx, type, number) for type, number in fragment_tuples)
+
+                if ALIAS_PAYLOADS:
+                    # the candidate laws are known from the payloads of the aliases
+                    candidate_rows = []
+                    for idx, (fragment_tuples, alias, bwb_id) in enumerate(chunk, start=offset):
+                        if alias is not None:
+                            bwb_ids = get_alias_bwb_ids(alias)
+                        else:
+                            # only laws that have an alias, like find_laws
+                            bwb_ids = [bwb_id] if bwb_id in get_aliased_bwb_ids() else []
+                        candidate_rows.extend((idx, candidate) for candidate in bwb_ids)
+                    if len(candidate_rows) == 0:
+                        continue
+                    candidate_cte = f"""candidate (idx, bwb_id) AS (
+                        VALUES {_values_list(cur, "(%s::int, %s::text)", candidate_rows)}
+                    )"""
+                else:
+                    candidate_cte = """candidate AS (
+                        SELECT r.idx, la.bwb_id
+                        FROM request r
+                        JOIN law_alias la ON lower(la.alias) = r.alias
+                        UNION
+                        SELECT r.idx, la.bwb_id
+                        FROM request r
+                        JOIN law_alias la ON la.bwb_id = r.bwb_id
+                    )"""
+
+                # the values are inlined, so the query must not contain parameter placeholders
                 laws_query = f"""
-                    WITH qualifying_bwb AS (
-                        SELECT le.bwb_id
-                        FROM (
-                            SELECT bwb_id, bwb_label_id, type, number
-                            FROM law_element
-                            WHERE
-                                (type, lower(number)) in %s
-                        ) le
-                        JOIN law_alias la ON le.bwb_id = la.bwb_id
-                        WHERE la.bwb_id = %s
-                        GROUP BY le.bwb_id
-                        HAVING COUNT(DISTINCT (type, lower(number))) = %s
+                    WITH request (idx, alias, bwb_id, n_fragments, narrow_type, narrow_number) AS (
+                        VALUES {_values_list(cur, "(%s::int, %s::text, %s::text, %s::int, %s::text, %s::text)", request_rows)}
+                    ),
+                    request_fragment (idx, type, number) AS (
+                        VALUES {_values_list(cur, "(%s::int, %s::text, %s::text)", fragment_rows)}
+                    ),
+                    {candidate_cte},
+                    qualifying_bwb AS (
+                        SELECT c.idx, c.bwb_id
+                        FROM candidate c
+                        JOIN request r ON r.idx = c.idx
+                        JOIN request_fragment rf ON rf.idx = c.idx
+                        JOIN law_element le ON
+                            le.bwb_id = c.bwb_id AND
+                            le.type = rf.type AND
+                            lower(le.number) = rf.number
+                        GROUP BY c.idx, c.bwb_id, r.n_fragments
+                        HAVING COUNT(DISTINCT (le.type, lower(le.number))) = r.n_fragments
                     )
                     SELECT
-                        le.type, le.number, le.bwb_id, le.bwb_label_id, le.title
+                        qb.idx, le.type, le.number, le.bwb_id, le.bwb_label_id, le.title
                     FROM
-                        public.law_element AS le
+                        qualifying_bwb qb
+                    JOIN
+                        request r ON r.idx = qb.idx
                     JOIN
-                        qualifying_bwb qb ON le.bwb_id = qb.bwb_id 
+                        law_element AS le ON le.bwb_id = qb.bwb_id
                     WHERE
-                        le.type = %s AND lower(le.number) = %s
-                    GROUP BY 
-                        le.type, le.number, le.bwb_id, le.bwb_label_id, le.title;
+                        le.type = r.narrow_type AND lower(le.number) = r.narrow_number
+                    GROUP BY
+                        qb.idx, le.type, le.number, le.bwb_id, le.bwb_label_id, le.title
+                    -- the same order as find_laws
+                    ORDER BY
+                        qb.idx, le.bwb_id, le.bwb_label_id;
                 """
 
-            start = time()
-            cur.execute(laws_query, params)
-            logging.debug("time query find_laws: %s", time() - start)
-            logging.debug("results query find_laws: %s", cur.rowcount)
-            # logging.debug("query find_laws: %s", laws_query)
+                db.execute(cur, "find_laws_batch", laws_query)
 
-            return [
-                {
-                    'type': law_row[0],
-                    'number': law_row[1],
-                    'bwb_id': law_row[2],
-                    'bwb_label_id': law_row[3],
-                    'title': law_row[4],
-                } for law_row in cur.fetchall()
-            ]
+                for law_row in cur.fetchall():
+                    results[law_row[0]].append({
+                        'type': law_row[1],
+                        'number': law_row[2],
+                        'bwb_id': law_row[3],
+                        'bwb_label_id': law_row[4],
+                        'title': law_row[5],
+                    })
+
+    return results
+
+def find_longest_aliases_in_substrings(input_texts: List[str]) -> List[Alias | None]:
+    """
+    Batch version of find_longest_alias_in_substring
+    """
+    results: List[Alias | None] = [None for _ in input_texts]
+    if len(input_texts) == 0:
+        return results
+
+    if _has_alias_index():
+        return [_longest_alias_prefix(input_text) for input_text in input_texts]
+    if is_sqlite():
+        return [snapshot.find_longest_alias_in_substring(input_text) for input_text in input_texts]
+    return _longest_aliases_query(input_texts)
+
+def _longest_aliases_query(input_texts: List[str]) -> List[Alias | None]:
+    results: List[Alias | None] = [None for _ in input_texts]
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            for offset in range(0, len(input_texts), BATCH_SIZE):
+                rows = list(enumerate(input_texts[offset:offset+BATCH_SIZE], start=offset))
+                db.execute(cur, "longest_aliases", f"""
+                    SELECT DISTINCT ON (t.idx) t.idx, la.alias, la.bwb_id
+                    FROM (
+                        VALUES {_values_list(cur, "(%s::int, %s::text)", rows)}
+                    ) t (idx, input_text)
+                    JOIN law_alias la ON t.input_text ILIKE la.alias || '%'
+                    ORDER BY t.idx, LENGTH(la.alias) DESC;
+                """)
+                for idx, alias, bwb_id in cur.fetchall():
+                    results[idx] = {
+                        'alias': alias,
+                        'bwb_id': bwb_id
+                    }
+
+    return results
+
+def resolve_laws(lookups: List[Tuple[Fragment, str]], batch: bool = True, stats: ExtractStats | None = None) -> List[List[dict]]:
+    """
+    Resolve a list of (fragments, title) lookups to laws, in the same order. Titles that
+    do not resolve as an alias are retried with the law of the longest alias that the
+    title starts with. With batch=True, all lookups of a document take a few queries in
+    total instead of one or more queries per lookup.
+
+    Resolved lookups are cached (see LAWS_CACHE_SIZE), lookups without laws as well, so
+    that neither the query nor the fallback is repeated for them. The lookups answered by
+    the cache are counted in stats, if given.
+    """
+    keys = [laws_cache_key(fragments, title) for fragments, title in lookups]
+    results: List[List[dict] | None] = [get_cached_laws(key) for key in keys]
+    if stats is not None:
+        stats.counts["cache_hits"] += sum(laws is not None for laws in results)
+
+    # resolve every lookup that is not cached once, also when it occurs more than once
+    pending: Dict[tuple, int] = {}
+    for i, laws in enumerate(results):
+        if laws is None:
+            pending.setdefault(keys[i], i)
+    if len(pending) > 0:
+        resolved = _resolve_laws([lookups[i] for i in pending.values()], batch)
+        for key, laws in zip(pending, resolved):
+            cache_laws(key, laws)
+        resolved_by_key = dict(zip(pending, resolved))
+        for i, laws in enumerate(results):
+            if laws is None:
+                results[i] = [dict(law) for law in resolved_by_key[keys[i]]]
+
+    return results # pyright: ignore[reportReturnType]
+
+def _resolve_laws(lookups: List[Tuple[Fragment, str]], batch: bool) -> List[List[dict]]:
+    if not batch:
+        results = []
+        for fragments, title in lookups:
+            laws = find_laws(fragments, alias=title)
+            if len(laws) == 0:
+                longest_alias = find_longest_alias_in_substring(title)
+                if longest_alias is not None:
+                    laws = find_laws(fragments, bwb_id=longest_alias['bwb_id'])
+            results.append(laws)
+        return results
+
+    results = find_laws_batch([(fragments, title, None) for fragments, title in lookups])
+
+    # fallback for titles that are not an alias themselves
+    missing = [i for i, laws in enumerate(results) if len(laws) == 0]
+    if len(missing) == 0:
+        return results
+
+    titles = list(dict.fromkeys(lookups[i][1] for i in missing))
+    longest_aliases = dict(zip(titles, find_longest_aliases_in_substrings(titles)))
+
+    retry = [i for i in missing if longest_aliases[lookups[i][1]] is not None]
+    retried = find_laws_batch([
+        (lookups[i][0], None, longest_aliases[lookups[i][1]]['bwb_id']) # pyright: ignore[reportOptionalSubscript]
+        for i in retry
+    ])
+    for i, laws in zip(retry, retried):
+        results[i] = laws
+
+    return results
 
 def get_cases_by_bwb_and_label_id(bwb_id, bwb_label_id):
     """
@@ -273,17 +907,7 @@ def get_cases_by_bwb_and_label_id(bwb_id, bwb_label_id):
 
     with get_conn() as conn:
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT c.ecli_id, STRING_AGG(distinct cl.source, ',')
-                FROM law_element l
-                JOIN case_law cl ON (cl.law_id = l.id)
-                JOIN legal_case c ON (cl.case_id = c.id)
-                WHERE
-                    l.bwb_id = %s AND
-                    l.bwb_label_id = %s
-                GROUP BY c.id
-                LIMIT 5000
-            """, (bwb_id, bwb_label_id,))
+            db.execute_prepared(cur, "cases", CASES_QUERY, (bwb_id, bwb_label_id,))
 
             return [[row[0], row[1].split(",")] for row in cur.fetchall()]
 
@@ -296,17 +920,15 @@ def get_amount_cases_by_bwb_and_label_ids(ids_list: List[Tuple]):
     if len(ids_list) == 0:
         return {}
 
+    if is_sqlite():
+        return snapshot.get_amount_cases(ids_list)
+
     with get_conn() as conn:
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT l.bwb_id, l.bwb_label_id, COUNT(DISTINCT cl.case_id)
-                FROM law_element l
-                JOIN case_law cl ON (cl.law_id = l.id)
-                WHERE
-                    (l.bwb_id, l.bwb_label_id) IN
-                    %s
-                GROUP BY l.bwb_id, l.bwb_label_id
-            """, (tuple(ids_list),))
+            db.execute_prepared(cur, "amount_cases", AMOUNT_CASES_QUERY, (
+                [bwb_id for bwb_id, _ in ids_list],
+                [bwb_label_id for _, bwb_label_id in ids_list],
+            ))
             
             results = cur.fetchall()
 
@@ -0,0 +1,233 @@
+"""
+Hot reload of the alias index (trie, payloads and automaton) when `law_alias` changes.
+
+A watcher thread compares a cheap fingerprint of `law_alias` against the fingerprint
+of the loaded index, either every `interval` seconds or when a notification arrives on
+a Postgres channel (see install_notify_trigger). When they differ, the index files are
+rebuilt (or, if another process already did so, reloaded) and swapped into the running
+process without blocking extractions that are in progress.
+"""
+
+import logging
+import os
+import select
+import threading
+from time import monotonic, time
+
+import psycopg2
+from psycopg2.extensions import quote_ident
+
+from linkextractor import db, utils
+from linkextractor.automaton import AliasAutomaton
+from linkextractor.law_index import reset_law_index
+
+ALIASES_CHANNEL = os.getenv("LINKEXTRACTOR_ALIASES_CHANNEL", "linkextractor_aliases")
+# seconds between fingerprint checks (also when listening, in case a notification is missed)
+WATCH_INTERVAL = float(os.getenv("LINKEXTRACTOR_WATCH_INTERVAL", 60))
+
+def get_alias_fingerprint(cur) -> str:
+    """
+    Cheap fingerprint of the contents of `law_alias`, the checksum also catches updates
+    that do not change the amount of rows or the highest id
+    """
+    cur.execute("""
+        SELECT COUNT(*), MAX(id), COALESCE(SUM(hashtext(alias || ':' || bwb_id)), 0)
+        FROM law_alias
+    """)
+    return ":".join(str(v) for v in cur.fetchone())
+
+def _fingerprint_path() -> str:
+    return f"{utils._TRIE_PATH}.fingerprint"
+
+def read_index_fingerprint() -> str | None:
+    """
+    Fingerprint of `law_alias` at the time the index files were last built by the watcher
+    """
+    try:
+        with open(_fingerprint_path()) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+def _replace(path: str, write):
+    # write to a temporary file next to the destination and move it in place atomically
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+def load_alias_index():
+    """
+    Load the index files and swap them in. The automaton is built before the swap, so
+    that extractions never wait on it.
+    """
+    start = time()
+    trie = utils._open_trie(utils._TRIE_PATH)
+    payloads = utils._open_payloads(utils._PAYLOADS_PATH)
+    automaton = AliasAutomaton(trie.keys())
+    utils.swap_alias_index(trie, payloads, automaton)
+    # the law index contains the aliases as well, have it verified again
+    reset_law_index()
+    logging.debug("time loading alias index: %s", time() - start)
+
+def rebuild_alias_index() -> str:
+    """
+    Rebuild the trie and payloads files from `law_alias`, swap them in and return the
+    fingerprint of the contents they were built from
+    """
+    import marisa_trie
+
+    start = time()
+    with db.get_conn() as conn:
+        with conn.cursor() as cur:
+            # repeatable read, so that the fingerprint matches the rows that are read
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            fingerprint = get_alias_fingerprint(cur)
+            cur.execute(utils.ALIASES_QUERY)
+            aliases = [str(alias).lower() for (alias,) in cur.fetchall()]
+            cur.execute(utils.ALIAS_PAYLOADS_QUERY)
+            payload_rows = cur.fetchall()
+
+    _replace(utils._TRIE_PATH, marisa_trie.Trie(aliases).save)
+    _replace(utils._PAYLOADS_PATH, lambda path: utils.write_alias_payloads(path, payload_rows))
+
+    def write_fingerprint(path):
+        with open(path, "w") as f:
+            f.write(fingerprint)
+    _replace(_fingerprint_path(), write_fingerprint)
+
+    load_alias_index()
+    logging.info("rebuilt alias index of %s aliases in %.2fs", len(aliases), time() - start)
+    return fingerprint
+
+def install_notify_trigger(channel: str = ALIASES_CHANNEL):
+    """
+    Install a statement-level trigger on `law_alias` that notifies the watchers on the
+    channel after every change. Alternatively, the process that refreshes `law_alias`
+    can send `NOTIFY <channel>` itself.
+    """
+    with db.get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                CREATE OR REPLACE FUNCTION linkextractor_notify_aliases() RETURNS trigger AS $$
+                BEGIN
+                    PERFORM pg_notify(TG_ARGV[0], TG_OP);
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+
+                DROP TRIGGER IF EXISTS linkextractor_notify_aliases ON law_alias;
+                CREATE TRIGGER linkextractor_notify_aliases
+                    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON law_alias
+                    FOR EACH STATEMENT EXECUTE FUNCTION linkextractor_notify_aliases(%s);
+            """, (channel,))
+
+class AliasIndexWatcher(threading.Thread):
+    """
+    Background thread that keeps the alias index of this process in sync with `law_alias`.
+    With listen, it waits for notifications on the channel and checks the fingerprint
+    every `interval` seconds in between; otherwise it only polls the fingerprint.
+    """
+
+    def __init__(self, interval: float | None = None, channel: str | None = ALIASES_CHANNEL, listen: bool = True):
+        super().__init__(name="linkextractor-alias-watcher", daemon=True)
+        self.interval = interval if interval is not None else WATCH_INTERVAL
+        self.channel = channel
+        self.listen = listen and channel is not None
+        # fingerprint of the loaded index, unknown until the first check if never built by a watcher
+        self.fingerprint = read_index_fingerprint()
+        self.checks = 0
+        self.reloads = 0
+        self.reloaded = threading.Event()
+        self._stop_event = threading.Event()
+
+    def check(self) -> bool:
+        """
+        Compare the fingerprint of `law_alias` against the loaded index and reload or rebuild
+        the index if they differ. Returns whether the index was swapped.
+        """
+        self.checks += 1
+        with db.get_conn() as conn:
+            with conn.cursor() as cur:
+                fingerprint = get_alias_fingerprint(cur)
+        if fingerprint == self.fingerprint:
+            return False
+
+        if read_index_fingerprint() == fingerprint:
+            # another process already rebuilt the files
+            logging.info("alias index files changed, reloading")
+            load_alias_index()
+        else:
+            logging.info("law_alias changed, rebuilding alias index")
+            fingerprint = rebuild_alias_index()
+
+        self.fingerprint = fingerprint
+        self.reloads += 1
+        self.reloaded.set()
+        return True
+
+    def _listen(self):
+        conn = psycopg2.connect(db.DB_URL, connect_timeout=5, **db.KEEPALIVE_KWARGS)
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {quote_ident(self.channel, cur)}")
+            self.check()
+            last_check = monotonic()
+
+            while not self._stop_event.is_set():
+                # wake up regularly to notice stop()
+                readable, _, _ = select.select([conn], [], [], min(self.interval, 1.0))
+                if readable:
+                    conn.poll()
+                if conn.notifies:
+                    conn.notifies.clear()
+                elif monotonic() - last_check < self.interval:
+                    continue
+                self.check()
+                last_check = monotonic()
+        finally:
+            conn.close()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                if self.listen:
+                    self._listen()
+                else:
+                    self.check()
+                    self._stop_event.wait(self.interval)
+            except (psycopg2.Error, OSError) as e:
+                # the database may be unavailable or restarting, keep the current index and retry
+                logging.warning("alias index watcher: %s", e)
+                self._stop_event.wait(self.interval)
+
+    def stop(self, timeout: float | None = None):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+_WATCHER: AliasIndexWatcher | None = None
+
+def start_alias_watcher(interval: float | None = None, listen: bool = True) -> AliasIndexWatcher:
+    """
+    Start the watcher of this process (if it is not running already)
+    """
+    global _WATCHER
+    if _WATCHER is None or not _WATCHER.is_alive():
+        _WATCHER = AliasIndexWatcher(interval, listen=listen)
+        _WATCHER.start()
+    return _WATCHER
+
+def stop_alias_watcher():
+    global _WATCHER
+    if _WATCHER is not None:
+        _WATCHER.stop()
+        _WATCHER = None
+
+def _reset_after_fork():
+    # the thread of the watcher does not exist in a forked child
+    global _WATCHER
+    _WATCHER = None
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
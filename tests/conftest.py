@@ -0,0 +1,98 @@
+import os
+import uuid
+
+import psycopg2
+import pytest
+from psycopg2.extensions import make_dsn
+
+from linkextractor import db, law_index, utils
+
+@pytest.fixture
+def pg_dsn():
+    """
+    DSN of a fresh schema in the local Postgres instance (LINKEXTRACTOR_TEST_DB_URL, or
+    LINKEXTRACTOR_DB_URL), in which the tables of the test can be created. Skips the test
+    if there is no database to connect to.
+    """
+    dsn = os.getenv("LINKEXTRACTOR_TEST_DB_URL") or os.getenv("LINKEXTRACTOR_DB_URL") or ""
+    try:
+        conn = psycopg2.connect(dsn, connect_timeout=2)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"no postgres available: {e}")
+
+    schema = f"linkextractor_test_{uuid.uuid4().hex[:8]}"
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA {schema}")
+    try:
+        yield make_dsn(dsn, options=f"-c search_path={schema}")
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA {schema} CASCADE")
+        conn.close()
+
+# the tables of the law database, as far as linkextractor reads them
+LAW_TABLES = """
+    CREATE TABLE law_alias (id serial PRIMARY KEY, alias text NOT NULL, bwb_id text NOT NULL);
+    CREATE TABLE law_element (id serial PRIMARY KEY, bwb_id text, type text, number text, bwb_label_id int, title text);
+    CREATE TABLE legal_case (id serial PRIMARY KEY, ecli_id text);
+    CREATE TABLE case_law (law_id int, case_id int, source text);
+"""
+
+class LawDatabase:
+    """
+    The law tables in the schema of a test, see the law_db fixture. Statements run on a
+    connection of their own, outside the pool of the code under test.
+    """
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+
+    def execute(self, query: str, params=None):
+        conn = psycopg2.connect(self.dsn)
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(query, params)
+        finally:
+            conn.close()
+
+    def insert(self, aliases=(), elements=(), case_law=()):
+        """
+        Insert (alias, bwb_id), (bwb_id, type, number, bwb_label_id[, title]) and
+        (law_id, case_id[, source]) rows
+        """
+        conn = psycopg2.connect(self.dsn)
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.executemany("INSERT INTO law_alias (alias, bwb_id) VALUES (%s, %s)", aliases)
+                    cur.executemany(
+                        "INSERT INTO law_element (bwb_id, type, number, bwb_label_id, title) VALUES (%s, %s, %s, %s, %s)",
+                        [(*row, None)[:5] for row in elements]
+                    )
+                    cur.executemany("INSERT INTO case_law (law_id, case_id, source) VALUES (%s, %s, %s)", [(*row, None)[:3] for row in case_law])
+        finally:
+            conn.close()
+
+@pytest.fixture
+def law_db(pg_dsn, tmp_path, monkeypatch):
+    """
+    Empty law tables in a fresh schema, which the database url points to. The alias trie
+    and payloads are built in tmp_path, and there is no law index, so laws are resolved
+    from the database.
+    """
+    LawDatabase(pg_dsn).execute(LAW_TABLES)
+
+    monkeypatch.setattr(utils, "_TRIE_PATH", str(tmp_path / "aliases.trie"))
+    monkeypatch.setattr(utils, "_PAYLOADS_PATH", str(tmp_path / "aliases.payloads.trie"))
+    monkeypatch.setattr(law_index, "_LAW_INDEX_PATH", str(tmp_path / "missing.lawindex"))
+    utils.reset_trie()
+    law_index.reset_law_index()
+    db.set_db_url(pg_dsn)
+    try:
+        yield LawDatabase(pg_dsn)
+    finally:
+        utils.reset_trie()
+        law_index.reset_law_index()
+        db.close_pool()
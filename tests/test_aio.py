@@ -0,0 +1,140 @@
+import asyncio
+import threading
+
+import pytest
+
+from linkextractor import aio, db, law_index, utils
+
+pytest.importorskip("asyncpg")
+
+ALIASES = [("BW", "BWBR0005290"), ("Burgerlijk Wetboek", "BWBR0005290"), ("Awb", "BWBR0005537")]
+ELEMENTS = [
+    ("BWBR0005290", "boek", "7", 100, "Boek 7"),
+    ("BWBR0005290", "artikel", "658", 101, "Artikel 658"),
+    ("BWBR0005537", "artikel", "3:2", 301, "Artikel 3:2"),
+]
+
+def test_extract_links_async_matches_sync(law_db):
+    law_db.insert(aliases=ALIASES, elements=ELEMENTS)
+    text = "Zie artikel 7:658 BW, artikel 3:2 Awb en artikel 658 van Boek 7 van het Burgerlijk Wetboek."
+
+    async def run():
+        try:
+            return await aio.extract_links_async(text, concurrency=2)
+        finally:
+            await aio.close_async_pool()
+
+    links = asyncio.run(run())
+
+    resolved = [(link['context']['literal'], link['resource']['bwb_label_id']) for link in links]
+    assert ('artikel 7:658 BW', 101) in resolved
+    assert ('artikel 3:2 Awb', 301) in resolved
+    assert any(label == 101 and 'Burgerlijk Wetboek' in literal for literal, label in resolved), \
+        "titles that are not an alias should fall back to the longest alias they start with"
+
+def test_cancel_releases_connections(law_db, monkeypatch):
+    law_db.insert(aliases=ALIASES, elements=ELEMENTS)
+    # the cancelled lookups hold every connection of the pool
+    monkeypatch.setattr(db, "POOL_MAX_SIZE", 2)
+    started = asyncio.Event()
+
+    async def slow_find_laws(fragments, alias=None, bwb_id=None):
+        pool = await aio.get_async_pool()
+        async with pool.acquire() as conn:
+            started.set()
+            await conn.execute("SELECT pg_sleep(10)")
+        return []
+
+    monkeypatch.setattr(aio, "find_laws_async", slow_find_laws)
+
+    async def run():
+        try:
+            task = asyncio.create_task(aio.resolve_laws_async([({'artikel': str(i)}, 'BW') for i in range(4)], concurrency=2))
+            await asyncio.wait_for(started.wait(), 5)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            pool = await aio.get_async_pool()
+            # the connections are released (and their queries cancelled) instead of
+            # sleeping on until the queries finish
+            assert await asyncio.wait_for(pool.fetchval("SELECT 1"), 5) == 1, \
+                "cancelled lookups should release their connection"
+        finally:
+            await aio.close_async_pool()
+
+    asyncio.run(asyncio.wait_for(run(), 15))
+
+def test_connect_kwargs():
+    kwargs = aio._connect_kwargs("host=db.example port=5433 dbname=laws sslmode=verify-full sslrootcert=/etc/ca.pem options='-c search_path=laws'")
+    assert "sslmode=verify-full" in kwargs["dsn"] and "sslrootcert=%2Fetc%2Fca.pem" in kwargs["dsn"], "ssl settings should be passed on"
+    assert kwargs["server_settings"] == {"search_path": "laws"}
+    with pytest.raises(ValueError):
+        aio._connect_kwargs("host=db.example keepalives=1")
+
+def test_find_laws_async_matches_sync(law_db, monkeypatch):
+    law_db.insert(aliases=ALIASES, elements=ELEMENTS + [("BWBR9999999", "artikel", "1", 900, "Wet zonder alias")])
+
+    loaded_in = []
+    get_law_index = law_index.get_law_index
+
+    def recording_get_law_index():
+        loaded_in.append(threading.current_thread())
+        return get_law_index()
+
+    monkeypatch.setattr(aio, "get_law_index", recording_get_law_index)
+
+    lookups = [({'boek': '7', 'artikel': '658'}, "BW", None), ({'artikel': '3:2'}, None, "BWBR0005537"), ({'artikel': '1'}, None, "BWBR9999999")]
+
+    async def run():
+        try:
+            return [await aio.find_laws_async(fragments, alias=alias, bwb_id=bwb_id) for fragments, alias, bwb_id in lookups]
+        finally:
+            await aio.close_async_pool()
+
+    for payloads in (False, True):
+        monkeypatch.setattr(utils, "ALIAS_PAYLOADS", payloads)
+        law_index.reset_law_index()
+        actual = asyncio.run(run())
+        assert actual == [utils.find_laws(fragments, alias=alias, bwb_id=bwb_id) for fragments, alias, bwb_id in lookups]
+
+    assert loaded_in[0] is not threading.main_thread(), "the law index should not be loaded on the event loop"
+
+def test_pool_per_event_loop(law_db):
+    law_db.insert(aliases=ALIASES, elements=ELEMENTS)
+
+    async def run(close: bool):
+        try:
+            laws = await aio.find_laws_async({'artikel': '3:2'}, alias="Awb")
+            return await aio.get_async_pool(), [law['bwb_label_id'] for law in laws]
+        finally:
+            if close:
+                await aio.close_async_pool()
+
+    # the pool of the first loop is left open, the second loop can not use it
+    first_pool, first = asyncio.run(run(close=False))
+    second_pool, second = asyncio.run(run(close=True))
+    assert first == second == [301]
+    assert second_pool is not first_pool, "each event loop should get a pool of its own"
+    assert aio._ASYNC_POOLS == {} and aio._ASYNC_POOL_LOCKS == {}, "the pool of a closed loop should be forgotten"
+
+def test_extract_links_async_loads_off_loop(law_db, monkeypatch):
+    law_db.insert(aliases=ALIASES, elements=ELEMENTS)
+    built_in = []
+    automaton = utils.AliasAutomaton
+
+    def recording_automaton(aliases):
+        built_in.append(threading.current_thread())
+        return automaton(aliases)
+
+    monkeypatch.setattr(utils, "AliasAutomaton", recording_automaton)
+
+    async def run():
+        try:
+            return await aio.extract_links_async("Zie artikel 7:658 BW.")
+        finally:
+            await aio.close_async_pool()
+
+    links = asyncio.run(run())
+    assert [link['resource']['bwb_label_id'] for link in links] == [101]
+    assert len(built_in) == 1 and built_in[0] is not threading.main_thread(), \
+        "the trie and automaton should be built off the event loop"
@@ -0,0 +1,40 @@
+import marisa_trie
+
+from linkextractor import utils
+
+payload_rows = [
+    ("bw", "BWBR0005290", "Burgerlijk Wetboek Boek 7"),
+    ("burgerlijk wetboek", "BWBR0005290", "Burgerlijk Wetboek Boek 7"),
+    ("bw", "BWBR0005288", "Burgerlijk Wetboek Boek 5"),
+    ("awb", "BWBR0005537", "Algemene wet bestuursrecht"),
+]
+
+def use_payloads(tmp_path, monkeypatch):
+    trie_path = str(tmp_path / "aliases.trie")
+    payloads_path = str(tmp_path / "aliases.payloads.trie")
+    marisa_trie.Trie({alias for alias, _, _ in payload_rows}).save(trie_path)
+    utils.write_alias_payloads(payloads_path, payload_rows)
+
+    monkeypatch.setattr(utils, "_TRIE_PATH", trie_path)
+    monkeypatch.setattr(utils, "_PAYLOADS_PATH", payloads_path)
+    utils.reset_trie()
+
+def test_alias_laws(tmp_path, monkeypatch):
+    use_payloads(tmp_path, monkeypatch)
+
+    assert utils.get_alias_bwb_ids("BW") == ["BWBR0005288", "BWBR0005290"]
+    assert utils.find_matching_aliases("Awb") == [{'alias': "Algemene wet bestuursrecht", 'bwb_id': "BWBR0005537"}]
+    assert utils.get_alias_laws("onbekend") == []
+
+    utils.reset_trie()
+
+def test_longest_alias_in_substring(tmp_path, monkeypatch):
+    use_payloads(tmp_path, monkeypatch)
+
+    assert utils.find_longest_alias_in_substring("Burgerlijk Wetboek Boek 7") == {'alias': "burgerlijk wetboek", 'bwb_id': "BWBR0005290"}
+    assert utils.find_longest_aliases_in_substrings(["Awb (hoor en wederhoor)", "geen wet"]) == [
+        {'alias': "awb", 'bwb_id': "BWBR0005537"},
+        None
+    ]
+
+    utils.reset_trie()
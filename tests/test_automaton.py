@@ -0,0 +1,31 @@
+from linkextractor.automaton import AliasAutomaton
+
+aliases = ["bw", "burgerlijk wetboek", "wetboek", "awb", "w", "wet op het financieel toezicht", "wet"]
+
+def longest_prefixes(text):
+    # reference implementation: longest alias that is a prefix of each suffix
+    results = []
+    for i in range(len(text)):
+        matches = [alias for alias in aliases if text.startswith(alias, i)]
+        if matches:
+            results.append((i, i + len(max(matches, key=len))))
+    return results
+
+def test_longest_matches():
+    automaton = AliasAutomaton(aliases)
+    text = "artikel 7:658 burgerlijk wetboek en de wet op het financieel toezicht, niet de awb of bw."
+
+    assert automaton.longest_matches(text) == longest_prefixes(text)
+
+def test_all_matches():
+    automaton = AliasAutomaton(aliases)
+
+    assert sorted(automaton.iter_matches("wetboek")) == [(0, 1), (0, 3), (0, 7)]
+    assert list(automaton.iter_matches("niets gevonden")) == []
+
+def test_word_boundaries():
+    automaton = AliasAutomaton(["li", "bw", "burgerlijk wetboek"])
+    text = "art. 1 lid 1 van het burgerlijk wetboek (bw)"
+
+    matches = automaton.longest_matches(text, word_boundaries=True)
+    assert [text[start:end] for start, end in matches] == ["burgerlijk wetboek", "bw"], "li in lid should not be found"
@@ -0,0 +1,85 @@
+import gc
+import io
+import json
+import multiprocessing
+import os
+
+import pytest
+
+from linkextractor import batch, db
+
+def fake_extract_links(text, **kwargs):
+    if "kapot" in text:
+        raise ValueError("kapotte tekst")
+    return [{"resource": {"title": text, "bwb_id": "BWBR0000000"}}]
+
+def test_extract_links_many_in_process(monkeypatch):
+    monkeypatch.setattr(batch, "extract_links", fake_extract_links)
+
+    texts = ["artikel 1 BW", ("ecli-2", "kapot"), ("ecli-3", "artikel 3 BW")]
+    stats = {}
+    results = list(batch.extract_links_many(texts, workers=0, chunk_size=2, stats=stats))
+
+    assert [result["id"] for result in results] == [0, "ecli-2", "ecli-3"], "results should be in input order"
+    assert results[0]["error"] is None and len(results[0]["links"]) == 1
+    assert results[1]["error"] == "ValueError: kapotte tekst", "a failing document should not stop the batch"
+    assert results[2]["links"][0]["resource"]["title"] == "artikel 3 BW"
+
+    assert sum(s["documents"] for s in stats.values()) == 3
+    assert sum(s["errors"] for s in stats.values()) == 1
+
+def test_extract_jsonl(monkeypatch):
+    monkeypatch.setattr(batch, "extract_links", fake_extract_links)
+
+    input_file = io.StringIO("\n".join([
+        json.dumps({"id": "ecli-1", "text": "artikel 1 BW"}),
+        "geen json",
+        json.dumps({"text": "artikel 2 BW"}),
+    ]))
+    output_file = io.StringIO()
+
+    assert batch.extract_jsonl(input_file, output_file, workers=0) == 2
+    results = [json.loads(line) for line in output_file.getvalue().splitlines()]
+
+    assert [result["id"] for result in results] == ["ecli-1", 3], "lines that are not a document should be skipped"
+    assert results[1]["links"][0]["resource"]["title"] == "artikel 2 BW"
+
+def dying_extract_links(text, **kwargs):
+    if "sterf" in text:
+        # the worker dies without raising, e.g. killed by the OOM killer
+        os._exit(1)
+    return fake_extract_links(text, **kwargs)
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork", reason="the workers only see the monkeypatches when forked")
+def test_extract_links_many_dead_worker(monkeypatch):
+    monkeypatch.setattr(batch, "extract_links", dying_extract_links)
+    monkeypatch.setattr(batch, "_load_read_only", lambda use_trie=True: None)
+    monkeypatch.setattr(batch, "warm_up", lambda use_trie=True: None)
+
+    texts = [("ecli-0", "sterf")] + [(f"ecli-{i}", f"artikel {i} BW") for i in range(1, 12)]
+    results = list(batch.extract_links_many(texts, workers=2, chunk_size=1))
+
+    assert [result["id"] for result in results] == [id for id, _ in texts], "every document should have a result"
+    assert results[0]["error"] is not None and "BrokenProcessPool" in results[0]["error"]
+    assert all(result["error"] is None for result in results[-4:]), "the batch should continue on a new pool"
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork", reason="the workers only see the monkeypatches when forked")
+def test_extract_links_many_forked(monkeypatch):
+    closed = []
+
+    class CallerPool:
+        pid = os.getpid()
+
+        def closeall(self):
+            closed.append(True)
+
+    monkeypatch.setattr(batch, "extract_links", fake_extract_links)
+    monkeypatch.setattr(batch, "_load_read_only", lambda use_trie=True: None)
+    monkeypatch.setattr(batch, "warm_up", lambda use_trie=True: None)
+    monkeypatch.setattr(db, "_POOL", CallerPool())
+
+    results = list(batch.extract_links_many([f"artikel {i} BW" for i in range(8)], workers=2, chunk_size=2))
+
+    assert [result["error"] for result in results] == [None] * 8
+    assert closed == [], "the connection pool of the caller should be left open"
+    assert gc.get_freeze_count() == 0, "the objects of the caller should not stay frozen"
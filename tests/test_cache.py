@@ -0,0 +1,65 @@
+from linkextractor import cache, utils
+from linkextractor.cache import LRUCache
+
+def test_lru_eviction():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert "b" not in cache, "least recently used entry should be evicted"
+    assert cache.get("b", "missing") == "missing"
+    assert cache.info() == {"hits": 1, "misses": 1, "evictions": 1, "size": 2, "maxsize": 2}
+
+def test_lru_falsy_values():
+    cache = LRUCache(maxsize=2)
+    cache.put("empty", [])
+
+    assert cache.get("empty") == [], "falsy values should be cached"
+    assert cache.hits == 1
+
+def test_lru_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache, "monotonic", lambda: now[0])
+    lru = LRUCache(maxsize=2, ttl=10)
+    lru.put("a", 1)
+
+    now[0] += 9
+    assert lru.get("a") == 1
+    now[0] += 1
+    assert lru.get("a") is None, "entries should expire after the ttl"
+    assert lru.info()["expirations"] == 1 and len(lru) == 0
+
+def test_resolve_laws_cache(monkeypatch):
+    calls = {"find_laws_batch": 0, "fallback": 0}
+    law = {'type': 'artikel', 'number': '658', 'bwb_id': 'BWBR0005290', 'bwb_label_id': 101, 'title': 'Artikel 658'}
+
+    def find_laws_batch(lookups):
+        calls["find_laws_batch"] += len(lookups)
+        return [[dict(law)] if alias.lower() == "bw" else [] for _, alias, _ in lookups]
+
+    def find_longest_aliases_in_substrings(titles):
+        calls["fallback"] += len(titles)
+        return [None for _ in titles]
+
+    monkeypatch.setattr(utils, "find_laws_batch", find_laws_batch)
+    monkeypatch.setattr(utils, "find_longest_aliases_in_substrings", find_longest_aliases_in_substrings)
+    utils.invalidate_laws_cache()
+
+    lookups = [({'artikel': '658'}, 'BW'), ({'artikel': '658'}, 'bw'), ({'artikel': '1'}, 'Onbekend')]
+    first = utils.resolve_laws(lookups)
+    assert [len(laws) for laws in first] == [1, 1, 0]
+    assert calls == {"find_laws_batch": 2, "fallback": 1}, "duplicate lookups should be resolved once"
+
+    first[0][0]['title'] = "changed"
+    second = utils.resolve_laws(lookups)
+    assert second[0][0]['title'] == "Artikel 658", "cached laws should not be shared with callers"
+    assert calls == {"find_laws_batch": 2, "fallback": 1}, "hits and misses should both be cached"
+
+    version = utils.get_laws_cache_info()["version"]
+    utils.invalidate_laws_cache()
+    assert utils.get_laws_cache_info()["version"] == version + 1
+    utils.resolve_laws(lookups)
+    assert calls == {"find_laws_batch": 4, "fallback": 2}, "invalidation should drop the cached lookups"
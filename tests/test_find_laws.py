@@ -0,0 +1,58 @@
+from linkextractor import utils
+
+ALIASES = [("BW", "BWBR0005290"), ("BW", "BWBR0005288"), ("Awb", "BWBR0005537")]
+ELEMENTS = [
+    ("BWBR0005290", "boek", "7", 100), ("BWBR0005290", "artikel", "658", 101), ("BWBR0005290", "artikel", "611", 102),
+    ("BWBR0005290", "artikel", "1", 103),
+    ("BWBR0005288", "boek", "5", 200), ("BWBR0005288", "artikel", "1", 201),
+    ("BWBR0005537", "artikel", "3:2", 301), ("BWBR0005537", "artikel", "4:8", 302),
+    ("BWBR9999999", "artikel", "1", 900),
+]
+
+def test_bwb_id_without_alias(law_db, monkeypatch):
+    law_db.insert(aliases=ALIASES, elements=ELEMENTS)
+    for payloads in (False, True):
+        monkeypatch.setattr(utils, "ALIAS_PAYLOADS", payloads)
+        assert [law["bwb_label_id"] for law in utils.find_laws({'artikel': '1'}, bwb_id="BWBR0005288")] == [201]
+        # like the law index and the snapshot (see tests/test_law_index.py)
+        assert utils.find_laws({'artikel': '1'}, bwb_id="BWBR9999999") == [], "laws without alias should not resolve"
+        assert utils.find_laws_batch([({'artikel': '1'}, None, "BWBR9999999")]) == [[]]
+
+def test_find_laws_batch(law_db, monkeypatch):
+    law_db.insert(aliases=ALIASES, elements=ELEMENTS)
+    # more lookups than fit in a single batch query
+    monkeypatch.setattr(utils, "BATCH_SIZE", 4)
+
+    lookups = [
+        ({'boek': '7', 'artikel': '658'}, "BW", None),
+        ({'artikel': '1'}, "bw", None),
+        ({'artikel': '3:2'}, None, "BWBR0005537"),
+        ({'artikel': '1'}, "Onbekend", None),
+        ({'boek': '5', 'artikel': '658'}, "BW", None),
+        ({'artikel': '1'}, None, "BWBR0005288"),
+        ({'artikel': '1'}, None, "BWBR9999999"),
+        ({'boek': '7', 'artikel': '658'}, "BW", None),
+        ({'artikel': '4:8'}, "AWB", None),
+        ({'artikel': '1'}, "bw", None),
+    ]
+    for payloads in (False, True):
+        monkeypatch.setattr(utils, "ALIAS_PAYLOADS", payloads)
+        expected = [utils.find_laws(fragments, alias=alias, bwb_id=bwb_id) for fragments, alias, bwb_id in lookups]
+        assert [len(laws) for laws in expected] == [1, 2, 1, 0, 0, 1, 0, 1, 1, 2]
+        assert utils.find_laws_batch(lookups) == expected, "the batch should resolve every lookup like find_laws"
+
+def test_payloads_without_law_alias(law_db, monkeypatch):
+    law_db.insert(aliases=ALIASES, elements=ELEMENTS)
+    monkeypatch.setattr(utils, "ALIAS_PAYLOADS", True)
+    utils.get_alias_payloads()
+    # the candidates come from the payloads, the queries must not need law_alias
+    law_db.execute("ALTER TABLE law_alias RENAME TO law_alias_moved")
+
+    assert [law["bwb_label_id"] for law in utils.find_laws({'artikel': '1'}, alias="bw")] == [201, 103]
+    assert [law["bwb_label_id"] for law in utils.find_laws({'artikel': '1'}, bwb_id="BWBR0005288")] == [201]
+    assert utils.find_laws({'artikel': '1'}, bwb_id="BWBR9999999") == [], "laws without alias should not resolve"
+    assert [len(laws) for laws in utils.find_laws_batch([
+        ({'artikel': '1'}, "bw", None),
+        ({'artikel': '3:2'}, None, "BWBR0005537"),
+        ({'artikel': '1'}, None, "BWBR9999999"),
+    ])] == [2, 1, 0]
@@ -0,0 +1,142 @@
+import threading
+import time
+
+import marisa_trie
+
+from linkextractor import db, law_index, snapshot, utils
+from linkextractor.law_index import LawIndex, write_law_index
+
+alias_rows = [
+    ("BW", "BWBR0005290"),
+    ("Burgerlijk Wetboek", "BWBR0005290"),
+    ("BW", "BWBR0005288"),
+    ("Awb", "BWBR0005537"),
+]
+
+element_rows = [
+    ("BWBR0005290", "boek", "7", 100, "Burgerlijk Wetboek Boek 7"),
+    ("BWBR0005290", "artikel", "658", 101, "Burgerlijk Wetboek Boek 7, Artikel 658"),
+    ("BWBR0005288", "boek", "5", 200, "Burgerlijk Wetboek Boek 5"),
+    ("BWBR0005288", "artikel", "1", 201, "Burgerlijk Wetboek Boek 5, Artikel 1"),
+    ("BWBR0005537", "artikel", "4:8", 300, "Algemene wet bestuursrecht, Artikel 4:8"),
+    # law without alias, should not be resolvable
+    ("BWBR9999999", "artikel", "1", 900, "Wet zonder alias, Artikel 1"),
+]
+
+def make_index(tmp_path):
+    path = str(tmp_path / "laws.index")
+    write_law_index(path, "fingerprint", alias_rows, element_rows)
+    return LawIndex(path)
+
+def test_alias(tmp_path):
+    index = make_index(tmp_path)
+
+    assert index.fingerprint == "fingerprint"
+    assert sorted(index.get_alias_bwb_ids("bw")) == ["BWBR0005288", "BWBR0005290"]
+
+    laws = index.find_laws([("boek", "7"), ("artikel", "658")], alias="BW")
+    assert len(laws) == 1, "only book 7 has article 658"
+    assert laws[0]["bwb_id"] == "BWBR0005290"
+    assert laws[0]["bwb_label_id"] == 101
+    assert laws[0]["number"] == "658"
+
+    assert index.find_laws([("boek", "5"), ("artikel", "658")], alias="BW") == [], "all fragments should exist"
+    assert index.find_laws([("artikel", "4:8")], alias="awb")[0]["bwb_id"] == "BWBR0005537"
+    assert index.find_laws([("artikel", "1")], alias="unknown") == []
+
+def test_bwb_id(tmp_path):
+    index = make_index(tmp_path)
+
+    laws = index.find_laws([("artikel", "1")], bwb_id="BWBR0005288")
+    assert [law["bwb_label_id"] for law in laws] == [201]
+
+    assert index.find_laws([("artikel", "1")], bwb_id="BWBR9999999") == [], "laws without alias should not resolve"
+
+def test_longest_alias_from_law_index(tmp_path, monkeypatch):
+    # without payloads, the fallback is answered from the trie and the law index
+    trie_path = str(tmp_path / "aliases.trie")
+    marisa_trie.Trie({alias.lower() for alias, _ in alias_rows}).save(trie_path)
+    make_index(tmp_path).close()
+
+    monkeypatch.setattr(utils, "_TRIE_PATH", trie_path)
+    monkeypatch.setattr(utils, "ALIAS_PAYLOADS", False)
+    monkeypatch.setattr(law_index, "_LAW_INDEX_PATH", str(tmp_path / "laws.index"))
+    monkeypatch.setattr(law_index, "LAW_INDEX_VERIFY", False)
+    utils.reset_trie()
+    law_index.reset_law_index()
+    try:
+        assert utils.find_longest_alias_in_substring("Burgerlijk Wetboek Boek 7") == {'alias': "burgerlijk wetboek", 'bwb_id': "BWBR0005290"}
+        assert utils.find_longest_aliases_in_substrings(["Awb (hoor en wederhoor)", "geen wet"]) == [
+            {'alias': "awb", 'bwb_id': "BWBR0005537"},
+            None
+        ]
+    finally:
+        utils.reset_trie()
+        law_index.reset_law_index()
+
+def test_get_law_index_concurrently(tmp_path, monkeypatch):
+    make_index(tmp_path).close()
+
+    class SlowLawIndex(LawIndex):
+        def __init__(self, path):
+            time.sleep(0.2)
+            super().__init__(path)
+
+    monkeypatch.setattr(law_index, "LawIndex", SlowLawIndex)
+    monkeypatch.setattr(law_index, "_LAW_INDEX_PATH", str(tmp_path / "laws.index"))
+    monkeypatch.setattr(law_index, "LAW_INDEX_VERIFY", False)
+    law_index.reset_law_index()
+    try:
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(law_index.get_law_index())) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results[0] is not None, "callers should wait for the index that is being loaded"
+        assert all(index is results[0] for index in results), "the index should be loaded once"
+    finally:
+        law_index.reset_law_index()
+
+def test_same_order_as_database(law_db, tmp_path, monkeypatch):
+    # several laws per alias and several elements per fragment, inserted out of order
+    law_db.insert(
+        aliases=[("BW", "BWBR0005290"), ("BW", "BWBR0005288"), ("Awb", "BWBR0005537")],
+        elements=[
+            ("BWBR0005290", "artikel", "1", 103, "Boek 7, Artikel 1"),
+            ("BWBR0005290", "artikel", "1", 102, "Boek 6, Artikel 1"),
+            ("BWBR0005288", "artikel", "1", 201, "Boek 5, Artikel 1"),
+            ("BWBR0005290", "boek", "7", 100, "Boek 7"),
+            ("BWBR0005537", "artikel", "1", 300, "Artikel 1"),
+        ],
+    )
+    lookups = [({'artikel': '1'}, "BW", None), ({'artikel': '1'}, None, "BWBR0005290"), ({'artikel': '1'}, "awb", None)]
+
+    monkeypatch.setattr(utils, "ALIAS_PAYLOADS", False)
+    expected = [utils.find_laws(fragments, alias=alias, bwb_id=bwb_id) for fragments, alias, bwb_id in lookups]
+    assert [[law['bwb_label_id'] for law in laws] for laws in expected] == [[201, 102, 103], [102, 103], [300]]
+
+    snapshot_path = snapshot.export_snapshot(str(tmp_path / "laws.sqlite"))
+    monkeypatch.setattr(law_index, "_LAW_INDEX_PATH", law_index.build_law_index(str(tmp_path / "laws.index")))
+    law_index.reset_law_index()
+    assert law_index.get_law_index() is not None
+    assert [utils.find_laws(fragments, alias=alias, bwb_id=bwb_id) for fragments, alias, bwb_id in lookups] == expected, \
+        "the law index should return the laws in the order of the database"
+
+    law_index.reset_law_index()
+    monkeypatch.setattr(law_index, "_LAW_INDEX_PATH", str(tmp_path / "missing.lawindex"))
+    monkeypatch.setattr(db, "DB_URL", f"sqlite:///{snapshot_path}")
+    assert [utils.find_laws(fragments, alias=alias, bwb_id=bwb_id) for fragments, alias, bwb_id in lookups] == expected, \
+        "the snapshot should return the laws in the order of the database"
+
+def test_stale_after_update(law_db, tmp_path, monkeypatch):
+    law_db.insert(aliases=alias_rows, elements=element_rows)
+    monkeypatch.setattr(law_index, "_LAW_INDEX_PATH", law_index.build_law_index(str(tmp_path / "laws.index")))
+    law_index.reset_law_index()
+    assert law_index.get_law_index() is not None
+
+    # the same amount of rows and the same highest id
+    law_db.execute("UPDATE law_element SET title = 'Gewijzigd' WHERE bwb_label_id = 101")
+    law_index.reset_law_index()
+    assert law_index.get_law_index() is None, "an index of updated rows should be stale"
@@ -0,0 +1,41 @@
+from linkextractor import metrics, search, utils
+from linkextractor.metrics import ExtractStats
+from linkextractor.types import AliasHit
+
+def test_extract_stats(monkeypatch):
+    law = {'type': 'artikel', 'number': '658', 'bwb_id': 'BWBR0005290', 'bwb_label_id': 101, 'title': 'Artikel 658'}
+
+    def find_aliases_in_text(text, use_trie=True):
+        return [AliasHit(i, i + 2, "BW") for i in range(len(text)) if text.startswith("BW", i)]
+
+    monkeypatch.setattr(search, "find_aliases_in_text", find_aliases_in_text)
+    monkeypatch.setattr(utils, "find_laws_batch", lambda lookups: [[dict(law)] for _ in lookups])
+    utils.invalidate_laws_cache()
+    metrics.reset_metrics()
+
+    text = "Zie artikel 7:658 BW en de artikelen 7:658 en 7:611 BW."
+    stats = ExtractStats()
+    links = search.extract_links(text, stats=stats)
+    assert len(links) > 0
+    assert stats.counts["characters"] == len(text)
+    assert stats.counts["aliases"] == 2
+    assert stats.counts["sub_matches"] > stats.counts["matches"] > 0, "the articles of a match should be counted as sub-matches"
+    assert stats.counts["cache_hits"] == 0
+    assert all(seconds >= 0 for seconds in stats.times.values()) and stats.times["match"] > 0
+
+    second = ExtractStats()
+    search.extract_links(text, stats=second)
+    assert second.counts["cache_hits"] == second.counts["sub_matches"], "the lookups of the second call should be cached"
+
+    search.extract_links(text)
+    totals = metrics.get_metrics()
+    assert totals["documents"] == 3, "calls without stats should be counted as well"
+    assert totals["counts"]["characters"] == 3 * len(text)
+    assert totals["buckets"]["inf"] == 3
+
+    prometheus = metrics.format_prometheus()
+    assert 'linkextractor_extract_duration_seconds_bucket{le="+Inf"} 3' in prometheus
+    assert f"linkextractor_extract_characters_total {3 * len(text)}" in prometheus
+    assert 'linkextractor_extract_stage_seconds_total{stage="resolve"}' in prometheus
+    utils.invalidate_laws_cache()
+    metrics.reset_metrics()
@@ -0,0 +1,25 @@
+from linkextractor import utils
+
+def test_ngrams():
+    ngrams = utils.get_ngrams("Zie de Uitv.besl. (BES), BW.x", max_tokens=2, max_length=15)
+
+    assert ngrams["uitv.besl."] == [(7, 17)], "an n-gram can end in the punctuation after a word"
+    assert ngrams["(bes)"] == [(18, 23)], "an n-gram can start with the punctuation in front of a word"
+    assert "uitv." not in ngrams and "bw." not in ngrams, "punctuation followed by a word is not the end of an n-gram"
+    assert ".x" not in ngrams, "punctuation after a word is not the start of an n-gram"
+    assert "zie de uitv" not in ngrams, "n-grams have at most max_tokens words"
+    assert "de uitv.besl. (bes)" not in ngrams, "n-grams have at most max_length characters"
+
+    ngrams = utils.get_ngrams("a,(bes)", max_tokens=2, max_length=15)
+    assert ngrams["(bes)"] == [(2, 7)], "an n-gram can start with the punctuation after other punctuation"
+    assert ",(bes)" not in ngrams, "punctuation after a word is not the start of an n-gram"
+
+def test_find_aliases_with_ngrams(law_db):
+    aliases = ["BW", "Burgerlijk Wetboek", "Awb", "Uitv.besl. (BES)", "(Wet BES)"] + [f"Wet nummer {i}" for i in range(100)]
+    law_db.insert(aliases=[(alias, f"BWBR{i:07}") for i, alias in enumerate(aliases)])
+
+    text = "Artikel 7:658 BW, de Awb en de Uitv.besl. (BES), maar niet ABW, art. 1,(Wet BES). " + " ".join(f"Wet nummer {i}." for i in range(100))
+    hits = utils.find_aliases_in_text(text, use_trie=False)
+
+    assert len(hits) == 104, "every alias in the text should be found, not only the first 50"
+    assert hits == utils.find_aliases_in_text(text, use_trie=True), "the n-grams should find the same hits as the automaton"
@@ -0,0 +1,64 @@
+from linkextractor import patterns
+from linkextractor.automaton import AliasAutomaton
+from linkextractor.cache import LRUCache
+from linkextractor.patterns import get_alias_scanner, get_windows, match_patterns_regex
+from linkextractor.types import AliasHit
+
+aliases = ["bw", "li", "awb", "wft", "burgerlijk wetboek", "wetboek van strafrecht", "algemene wet bestuursrecht"]
+
+text = (
+    "De rechtbank oordeelt dat artikel 7:658 van het BW van toepassing is, net als "
+    "Burgerlijk Wetboek Boek 7, Artikel 611. Art. 1 lid 1 Wft en artt. 3:2 en 4:8 Awb, "
+    "gelet op de artikelen 10, 14a en 22c van het Wetboek van Strafrecht. Vgl. artikel 8 BW."
+)
+
+def get_hits(text):
+    automaton = AliasAutomaton(aliases)
+    norm_text = text.lower()
+    return [AliasHit(start, end, norm_text[start:end]) for start, end in automaton.longest_matches(norm_text, word_boundaries=True)]
+
+def test_single_pass_equivalent():
+    hits = get_hits(text)
+
+    single_pass = match_patterns_regex(text, hits, single_pass=True)
+    per_pattern = match_patterns_regex(text, hits, single_pass=False)
+
+    assert single_pass == per_pattern, "single pass should find the same matches in the same order"
+    assert len(single_pass) > 0
+
+def test_title_word_boundaries():
+    hits = get_hits("Art. 1 lid 1 Wft")
+    matches = match_patterns_regex("Art. 1 lid 1 Wft", hits)
+
+    assert [match['patterns']['TITLE'] for match in matches] == ["Wft"], "li in lid should not be a title"
+
+def test_windowed_equivalent():
+    filler = "De rechtbank overweegt als volgt over de feiten en omstandigheden van dit geval. " * 40
+    long_text = filler + text + filler + "Zie ook artikel 3:2 Awb. " + filler
+    hits = get_hits(long_text)
+
+    windows = get_windows(long_text, hits)
+    assert sum(hi - lo for lo, hi in windows) < len(long_text) / 2, "filler without anchors should be skipped"
+    assert all(a[1] < b[0] for a, b in zip(windows, windows[1:])), "windows should be ordered and merged"
+
+    full = match_patterns_regex(long_text, hits)
+    assert match_patterns_regex(long_text, hits, windows=windows) == full
+    assert match_patterns_regex(long_text, hits, single_pass=False, windows=windows) == full
+
+def test_longest_resolves_nested():
+    nested_text = "Zie artikel 7:658 van het Burgerlijk Wetboek Boek 7, artikel 611 en art. 1 Wft."
+    hits = get_hits(nested_text)
+
+    assert len(match_patterns_regex(nested_text, hits)) == 3
+    matches = match_patterns_regex(nested_text, hits, longest=True)
+
+    assert [match['literal'] for match in matches] == ["artikel 7:658 van het Burgerlijk Wetboek", "art. 1 Wft"], \
+        "the overlapping (shorter) match should be dropped"
+
+def test_patterns_cache_disabled(monkeypatch):
+    monkeypatch.setattr(patterns, "PATTERNS_CACHE_SIZE", 0)
+    monkeypatch.setattr(patterns, "_PATTERNS_ALIAS_CACHE", LRUCache(maxsize=1))
+    hits = get_hits(text)
+
+    assert get_alias_scanner(hits) is not get_alias_scanner(hits), "every text should compile its patterns"
+    assert patterns.get_patterns_cache_info()["size"] == 0
@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+
+import psycopg2
+import pytest
+from psycopg2.pool import PoolError
+
+from linkextractor import db
+from linkextractor.db import ConnectionPool
+
+def backend_pid(conn) -> int:
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_backend_pid()")
+        pid = cur.fetchone()[0]
+    conn.rollback()
+    return pid
+
+def terminate(pg_dsn, pid: int):
+    conn = psycopg2.connect(pg_dsn)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_terminate_backend(%s)", (pid,))
+    conn.close()
+    # the backend exits asynchronously
+    time.sleep(0.1)
+
+def test_get_conn(pg_dsn, monkeypatch):
+    monkeypatch.setattr(db, "POOL_MIN_SIZE", 0)
+    monkeypatch.setattr(db, "POOL_MAX_SIZE", 2)
+    db.set_db_url(pg_dsn)
+    try:
+        with db.get_conn() as conn:
+            first = conn
+            with conn.cursor() as cur:
+                cur.execute("CREATE TABLE pooled (value int)")
+            assert db.get_pool_stats()["in_use"] == 1
+
+        stats = db.get_pool_stats()
+        assert stats["in_use"] == 0 and stats["idle"] == 1 and stats["connects"] == 1
+
+        with pytest.raises(ZeroDivisionError):
+            with db.get_conn() as conn:
+                assert conn is first, "a returned connection should be reused"
+                with conn.cursor() as cur:
+                    cur.execute("INSERT INTO pooled VALUES (1)")
+                1 / 0
+
+        with db.get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT COUNT(*) FROM pooled")
+                assert cur.fetchone()[0] == 0, "the transaction of a failed block should be rolled back"
+        assert db.get_pool_stats()["discarded"] == 0, "an error in the block should not discard the connection"
+    finally:
+        db.close_pool()
+
+def test_wait_and_timeout(pg_dsn):
+    pool = ConnectionPool(pg_dsn, min_size=0, max_size=1, timeout=0.5)
+    try:
+        conn = pool.getconn()
+        threading.Timer(0.1, pool.putconn, (conn,)).start()
+        assert pool.getconn() is conn, "a waiting caller should get the returned connection"
+        assert pool.stats()["waits"] == 1
+
+        start = time.monotonic()
+        with pytest.raises(PoolError):
+            pool.getconn()
+        assert time.monotonic() - start >= 0.5
+        assert pool.stats()["timeouts"] == 1
+        pool.putconn(conn)
+    finally:
+        pool.closeall()
+
+def test_discard_on_return(pg_dsn):
+    pool = ConnectionPool(pg_dsn, min_size=0, max_size=2, healthcheck_after=60)
+    try:
+        conn = pool.getconn()
+        conn.close()
+        pool.putconn(conn)
+        assert pool.stats()["size"] == 0 and pool.stats()["discarded"] == 1, "a closed connection should not be reused"
+
+        conn = pool.getconn()
+        pool.putconn(conn, discard=True)
+        assert pool.stats()["size"] == 0 and pool.stats()["discarded"] == 2
+
+        # a connection in a failed transaction is rolled back and reused
+        conn = pool.getconn()
+        with pytest.raises(psycopg2.Error):
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1 / 0")
+        pool.putconn(conn)
+        assert pool.stats()["idle"] == 1
+        assert pool.getconn() is conn
+        pool.putconn(conn)
+    finally:
+        pool.closeall()
+
+def test_counters_from_threads(pg_dsn):
+    pool = ConnectionPool(pg_dsn, min_size=0, max_size=4, healthcheck_after=60)
+
+    def borrow():
+        for _ in range(10):
+            pool.putconn(pool.getconn(), discard=True)
+
+    try:
+        threads = [threading.Thread(target=borrow) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = pool.stats()
+        assert stats["connects"] == stats["discarded"] == stats["borrows"] == 40
+    finally:
+        pool.closeall()
+
+def test_get_conn_discards_broken_connection(pg_dsn, monkeypatch):
+    monkeypatch.setattr(db, "POOL_MIN_SIZE", 0)
+    monkeypatch.setattr(db, "POOL_HEALTHCHECK_AFTER", 60)
+    db.set_db_url(pg_dsn)
+    try:
+        with db.get_conn() as conn:
+            pid = backend_pid(conn)
+        terminate(pg_dsn, pid)
+
+        with pytest.raises(psycopg2.OperationalError):
+            with db.get_conn() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+        assert db.get_pool_stats()["size"] == 0, "a broken connection should be discarded"
+
+        with db.get_conn() as conn:
+            assert backend_pid(conn) != pid
+    finally:
+        db.close_pool()
+
+def test_healthcheck(pg_dsn):
+    pool = ConnectionPool(pg_dsn, min_size=1, max_size=1, healthcheck_after=0)
+    try:
+        conn = pool.getconn()
+        pid = backend_pid(conn)
+        pool.putconn(conn)
+        terminate(pg_dsn, pid)
+
+        conn = pool.getconn()
+        assert backend_pid(conn) != pid, "a dead idle connection should be replaced"
+        stats = pool.stats()
+        assert stats["discarded"] == 1 and stats["connects"] == 2
+        pool.putconn(conn)
+    finally:
+        pool.closeall()
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_reset_after_fork(pg_dsn, monkeypatch):
+    monkeypatch.setattr(db, "POOL_MIN_SIZE", 1)
+    db.set_db_url(pg_dsn)
+    try:
+        with db.get_conn() as conn:
+            parent_pid = backend_pid(conn)
+
+        read, write = os.pipe()
+        child = os.fork()
+        if child == 0:
+            try:
+                # the inherited pool must not be used, nor closed
+                pool = db.get_pool()
+                with db.get_conn() as conn:
+                    pid = backend_pid(conn)
+                ok = pool.pid == os.getpid() and pid != parent_pid
+            except BaseException:
+                ok = False
+            os.write(write, b"1" if ok else b"0")
+            os._exit(0)
+
+        os.close(write)
+        result = os.read(read, 1)
+        os.close(read)
+        os.waitpid(child, 0)
+        assert result == b"1", "the child should connect with its own pool"
+
+        with db.get_conn() as conn:
+            assert backend_pid(conn) == parent_pid, "the connection of the parent should survive the child"
+    finally:
+        db.close_pool()
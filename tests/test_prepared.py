@@ -0,0 +1,67 @@
+from linkextractor import db, utils
+
+def test_prepared_statements(law_db, monkeypatch):
+    law_db.insert(
+        aliases=[("BW", "BWBR0005290"), ("Awb", "BWBR0005537")],
+        elements=[("BWBR0005290", "boek", "7", 100), ("BWBR0005290", "artikel", "658", 101), ("BWBR0005537", "artikel", "3:2", 301)],
+        case_law=[(2, 1), (2, 2), (3, 3)],
+    )
+    monkeypatch.setattr(utils, "ALIAS_PAYLOADS", False)
+    # a single connection, so that every lookup uses the same session
+    monkeypatch.setattr(db, "POOL_MIN_SIZE", 0)
+    monkeypatch.setattr(db, "POOL_MAX_SIZE", 1)
+
+    def lookups():
+        return (
+            [law['bwb_label_id'] for law in utils.find_laws({'boek': '7', 'artikel': '658'}, alias='bw')],
+            [law['bwb_label_id'] for law in utils.find_laws({'artikel': '3:2'}, bwb_id='BWBR0005537')],
+            utils.find_laws({'artikel': '658'}, alias='awb'),
+            utils.get_amount_cases_by_bwb_and_label_ids([('BWBR0005290', 101), ('BWBR0005537', 301)]),
+        )
+
+    expected = ([101], [301], [], {('BWBR0005290', 101): 2, ('BWBR0005537', 301): 1})
+    monkeypatch.setattr(db, "PREPARED_STATEMENTS", False)
+    assert lookups() == expected
+
+    monkeypatch.setattr(db, "PREPARED_STATEMENTS", True)
+    assert lookups() == expected
+    with db.get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT name FROM pg_prepared_statements")
+            assert {name for (name,) in cur.fetchall()} == {"linkextractor_find_laws", "linkextractor_amount_cases"}
+            # e.g. a pooler that resets the session in between
+            cur.execute("DEALLOCATE ALL")
+
+    assert lookups() == expected, "lost prepared statements should be prepared again"
+
+    # a new connection prepares the statements again
+    db.close_pool()
+    assert lookups() == expected
+
+def test_reprepare_in_transaction(law_db, monkeypatch):
+    law_db.insert(aliases=[("BW", "BWBR0005290")], elements=[("BWBR0005290", "artikel", "658", 101)], case_law=[(1, 1)])
+    monkeypatch.setattr(utils, "ALIAS_PAYLOADS", False)
+    monkeypatch.setattr(db, "PREPARED_STATEMENTS", True)
+    name, query, params = utils.laws_statement([("artikel", "658")], alias="bw")
+
+    with db.get_conn() as conn:
+        with conn.cursor() as cur:
+            db.execute_prepared(cur, name, query, params)
+            db.execute_prepared(cur, "amount_cases", utils.AMOUNT_CASES_QUERY, (["BWBR0005290"], [101]))
+            conn.commit()
+            cur.execute("SELECT prepare_time FROM pg_prepared_statements WHERE name = 'linkextractor_amount_cases'")
+            (prepared_at,) = cur.fetchone()
+            cur.execute(f"DEALLOCATE linkextractor_{name}")
+
+            # work of the caller in the same transaction
+            cur.execute("CREATE TEMPORARY TABLE caller (id int)")
+            cur.execute("INSERT INTO caller VALUES (1)")
+            db.execute_prepared(cur, name, query, params)
+            assert [row[3] for row in cur.fetchall()] == [101], "the rows of the EXECUTE should be kept"
+
+            cur.execute("SELECT id FROM caller")
+            assert cur.fetchall() == [(1,)], "the transaction of the caller should continue"
+            cur.execute("SELECT name, prepare_time FROM pg_prepared_statements")
+            statements = dict(cur.fetchall())
+            assert statements["linkextractor_amount_cases"] == prepared_at, "other statements should not be prepared again"
+            assert f"linkextractor_{name}" in statements
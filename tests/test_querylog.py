@@ -0,0 +1,65 @@
+import json
+
+from linkextractor import db, querylog, utils
+
+def test_histogram():
+    querylog.reset_query_stats()
+    for duration in (0.0005, 0.003, 0.003, 0.2, 10):
+        querylog.record("find_laws", duration, 2)
+
+    stats = querylog.get_query_stats()["find_laws"]
+    assert stats["count"] == 5 and stats["rows"] == 10
+    assert stats["time_max"] == 10
+    assert stats["buckets"]["0.001"] == 1 and stats["buckets"]["0.005"] == 3 and stats["buckets"]["0.25"] == 4
+    assert stats["buckets"]["inf"] == 5, "buckets should be cumulative"
+    querylog.reset_query_stats()
+
+def test_slow_query_log(law_db, tmp_path, monkeypatch):
+    law_db.insert(aliases=[("BW", "BWBR0005290")], elements=[("BWBR0005290", "artikel", "658", 101)])
+
+    path = str(tmp_path / "slow_queries.log")
+    monkeypatch.setattr(querylog, "SLOW_QUERY_LOG", path)
+    # every query is slow, and the plan of every one of them is captured
+    monkeypatch.setattr(querylog, "SLOW_QUERY_MS", 1e-9)
+    monkeypatch.setattr(querylog, "SLOW_QUERY_EXPLAIN_RATE", 1.0)
+    monkeypatch.setattr(querylog, "SLOW_QUERY_EXPLAIN_INTERVAL", 0)
+    monkeypatch.setattr(utils, "ALIAS_PAYLOADS", False)
+    querylog.reset_query_stats()
+    try:
+        laws = utils.find_laws({'artikel': '658'}, alias='bw')
+        assert [law['bwb_label_id'] for law in laws] == [101], "capturing the plan should keep the rows of the query"
+
+        # a plan that can not be captured does not abort the transaction of the query
+        with monkeypatch.context() as patch:
+            patch.setattr(db, "_EXPLAIN", "EXPLAIN (NO_SUCH_OPTION) ")
+            with db.get_conn() as conn:
+                with conn.cursor() as cur:
+                    db.execute(cur, "count_laws", "SELECT COUNT(*) FROM law_element WHERE bwb_id = %s", ("BWBR0005290",))
+                    assert cur.fetchone() == (1,)
+                    cur.execute("SELECT 1")
+
+        assert querylog.get_query_stats()["find_laws"]["count"] == 1
+
+        with open(path, encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f]
+        assert [entry["name"] for entry in entries] == ["find_laws", "count_laws"]
+        assert entries[0]["params"][5] == "bw"
+        assert entries[0]["plan"][0]["Plan"]["Node Type"] is not None
+        assert entries[1]["plan"] is None
+
+        summary = querylog.summarise_slow_queries(path, show=1)
+        assert summary["find_laws"]["count"] == 1 and summary["find_laws"]["plans"] == 1
+    finally:
+        querylog.reset_query_stats()
+
+def test_slow_query_log_summarises(tmp_path, monkeypatch):
+    path = str(tmp_path / "slow_queries.log")
+    monkeypatch.setattr(querylog, "SLOW_QUERY_LOG", path)
+    ngrams = [f"ngram {i}" for i in range(100)]
+    query = "SELECT * FROM (VALUES " + ", ".join(f"({i}, 'alias {i}')" for i in range(1000)) + ") AS candidate"
+
+    querylog.log_slow_query("ngram_aliases", 0.5, 3, query, (ngrams, "bw", ["a", "b"]))
+    (entry,) = querylog.read_slow_queries(path)
+    assert entry["params"] == [{"length": 100, "first": ngrams[:5]}, "bw", ["a", "b"]]
+    assert len(entry["query"]) < querylog.SLOW_QUERY_LOG_CHARS + 30
+    assert entry["query"].endswith(f"... ({len(query)} characters)")
@@ -0,0 +1,17 @@
+from linkextractor import schema
+
+def test_prepare_database(law_db):
+    # an index of the DAG on the same expression, under another name
+    law_db.execute("CREATE INDEX law_alias_lower_alias ON law_alias (lower(alias))")
+    law_db.insert(aliases=[("BW", "BWBR0005290")], elements=[("BWBR0005290", "artikel", "658", 101)], case_law=[(1, 1, "x")])
+
+    dry_run = schema.prepare_database(dry_run=True)
+    assert dry_run["present"] == {"idx_law_alias_alias": "law_alias_lower_alias"}, "indexes on the same expression should be reused"
+    assert len(dry_run["statements"]) == len(schema.INDEXES) - 1
+    assert all("CONCURRENTLY" in statement for statement in dry_run["statements"])
+
+    prepared = schema.prepare_database()
+    assert prepared["statements"] == dry_run["statements"]
+    assert prepared["after"]["get_amount_cases_by_bwb_and_label_ids"] is not None
+
+    assert schema.prepare_database()["statements"] == [], "preparing again should not create any index"
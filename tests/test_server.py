@@ -0,0 +1,126 @@
+import http.client
+import json
+import socket
+import threading
+
+from linkextractor import server
+
+def fake_extract_links(text, use_trie=True, exact=False, **kwargs):
+    return [{"context": {"literal": text, "span": (0, len(text))}, "exact": exact}]
+
+def request(conn, method, path, body=None):
+    conn.request(method, path, body=json.dumps(body) if body is not None else None)
+    response = conn.getresponse()
+    return response.status, json.loads(response.read())
+
+def start(extraction_server):
+    thread = threading.Thread(target=extraction_server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+def test_percentile_nearest_rank():
+    assert server.percentile([], 50) == 0.0
+    assert server.percentile([1.0], 99) == 1.0
+    assert server.percentile([1.0, 2.0], 50) == 1.0
+    assert server.percentile([1.0, 2.0, 3.0], 50) == 2.0
+    assert server.percentile([1.0, 2.0, 3.0, 4.0, 5.0], 50) == 3.0
+    assert server.percentile([1.0, 2.0, 3.0, 4.0, 5.0], 90) == 5.0
+    assert server.percentile([1.0, 2.0, 3.0, 4.0, 5.0], 0) == 1.0
+
+def test_extract_and_stats(monkeypatch):
+    monkeypatch.setattr(server, "extract_links", fake_extract_links)
+    extraction_server = server.make_server(port=0, workers=2, queue_size=2)
+    start(extraction_server)
+    try:
+        conn = http.client.HTTPConnection(*extraction_server.server_address[:2])
+        for _ in range(5):
+            status, body = request(conn, "POST", "/extract", {"text": "artikel 1 BW", "exact": True})
+            assert status == 200
+            assert body["links"][0]["exact"], "options should be passed on to extract_links"
+        assert request(conn, "POST", "/extract", {"txt": "artikel 1 BW"})[0] == 400
+
+        status, stats = request(conn, "GET", "/stats")
+        assert status == 200
+        assert stats["requests"] == 5 and stats["in_flight"] == 0
+        assert stats["latency"]["samples"] == 5
+        assert 0 < stats["latency"]["p50"] <= stats["latency"]["p99"] <= stats["latency"]["max"]
+        assert "extract" in stats
+
+        conn.request("GET", "/metrics")
+        response = conn.getresponse()
+        assert response.status == 200
+        assert "linkextractor_extract_duration_seconds_count" in response.read().decode("utf-8")
+    finally:
+        extraction_server.shutdown()
+        extraction_server.server_close()
+
+def test_invalid_content_length(monkeypatch):
+    monkeypatch.setattr(server, "extract_links", fake_extract_links)
+    extraction_server = server.make_server(port=0, workers=1, queue_size=1)
+    start(extraction_server)
+    try:
+        for length in ["twaalf", "-1"]:
+            conn = http.client.HTTPConnection(*extraction_server.server_address[:2], timeout=5)
+            conn.putrequest("POST", "/extract")
+            conn.putheader("Content-Length", length)
+            conn.endheaders(b'{"text": "artikel 1 BW"}')
+            response = conn.getresponse()
+            assert response.status == 400, f"Content-Length {length} should be refused"
+            conn.close()
+    finally:
+        extraction_server.shutdown()
+        extraction_server.server_close()
+
+def test_backpressure(monkeypatch):
+    release = threading.Event()
+
+    def blocking_extract_links(text, **kwargs):
+        release.wait(10)
+        return []
+
+    monkeypatch.setattr(server, "extract_links", blocking_extract_links)
+    extraction_server = server.make_server(port=0, workers=1, queue_size=1)
+    start(extraction_server)
+    address = extraction_server.server_address[:2]
+    try:
+        # one request in the worker and one queued take all slots
+        results = []
+        clients = [
+            threading.Thread(target=lambda: results.append(request(http.client.HTTPConnection(*address), "POST", "/extract", {"text": "a"})))
+            for _ in range(2)
+        ]
+        for client in clients:
+            client.start()
+        for _ in range(100):
+            if extraction_server.stats.snapshot()["in_flight"] == 2:
+                break
+            threading.Event().wait(0.05)
+
+        status, body = request(http.client.HTTPConnection(*address), "POST", "/extract", {"text": "a"})
+        assert status == 503, "requests beyond the workers and queue should be refused"
+
+        release.set()
+        for client in clients:
+            client.join(10)
+        assert [status for status, _ in results] == [200, 200]
+        assert extraction_server.stats.snapshot()["rejected"] == 1
+    finally:
+        release.set()
+        extraction_server.shutdown()
+        extraction_server.server_close()
+
+def test_unix_socket(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "extract_links", fake_extract_links)
+    path = str(tmp_path / "linkextractor.sock")
+    extraction_server = server.make_server(unix_socket=path, workers=1, queue_size=0)
+    start(extraction_server)
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(path)
+        conn = http.client.HTTPConnection("localhost")
+        conn.sock = sock
+        status, body = request(conn, "POST", "/extract", {"text": "artikel 1 BW"})
+        assert status == 200 and body["links"][0]["context"]["literal"] == "artikel 1 BW"
+    finally:
+        extraction_server.shutdown()
+        extraction_server.server_close()
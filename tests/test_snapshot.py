@@ -0,0 +1,72 @@
+import sqlite3
+
+import pytest
+
+from linkextractor import db, law_index, snapshot, utils
+from linkextractor.search import extract_links
+
+ALIASES = [(1, "BW", "BWBR0005290"), (2, "Burgerlijk Wetboek", "BWBR0005290"), (3, "Awb", "BWBR0005537")]
+ELEMENTS = [
+    (1, "BWBR0005290", "boek", "7", 100, "Boek 7"),
+    (2, "BWBR0005290", "artikel", "658", 101, "Artikel 658"),
+    (3, "BWBR0005537", "artikel", "3:2", 301, "Artikel 3:2"),
+]
+
+def use_snapshot(path, tmp_path, monkeypatch, payloads):
+    monkeypatch.setattr(utils, "_TRIE_PATH", str(tmp_path / "aliases.trie"))
+    monkeypatch.setattr(utils, "_PAYLOADS_PATH", str(tmp_path / "aliases.payloads.trie"))
+    monkeypatch.setattr(utils, "ALIAS_PAYLOADS", payloads)
+    monkeypatch.setattr(law_index, "_LAW_INDEX_PATH", str(tmp_path / "missing.lawindex"))
+    monkeypatch.setattr(db, "DB_URL", f"sqlite:///{path}")
+
+@pytest.mark.parametrize("payloads", [False, True])
+def test_resolve_from_snapshot(tmp_path, monkeypatch, payloads):
+    path = str(tmp_path / "laws.sqlite")
+    conn = sqlite3.connect(path)
+    conn.executescript(snapshot.SCHEMA)
+    conn.executemany("INSERT INTO law_alias VALUES (?, ?, lower(?), ?)", [(id, alias, alias, bwb_id) for id, alias, bwb_id in ALIASES])
+    conn.executemany("INSERT INTO law_element VALUES (?, ?, ?, ?, lower(?), ?, ?)", [(id, bwb_id, type, number, number, label, title) for id, bwb_id, type, number, label, title in ELEMENTS])
+    conn.executescript(snapshot.INDEXES)
+    conn.commit()
+    conn.close()
+
+    use_snapshot(path, tmp_path, monkeypatch, payloads)
+    try:
+        assert [law['bwb_label_id'] for law in utils.find_laws({'boek': '7', 'artikel': '658'}, alias='bw')] == [101]
+        assert utils.find_laws({'artikel': '658'}, alias='awb') == []
+        assert utils.find_longest_alias_in_substring("Burgerlijk Wetboek Boek 7") == {'alias': 'burgerlijk wetboek' if payloads else 'Burgerlijk Wetboek', 'bwb_id': 'BWBR0005290'}
+        assert utils.find_matching_aliases("bw") == [{'alias': 'Burgerlijk Wetboek', 'bwb_id': 'BWBR0005290'}]
+        assert sorted(utils.get_trie().keys()) == ["awb", "burgerlijk wetboek", "bw"]
+
+        links = [(link['context']['literal'], link['resource']['bwb_label_id']) for link in extract_links("Zie artikel 7:658 BW en artikel 3:2 Awb.")]
+        assert links == [('artikel 7:658 BW', 101), ('artikel 3:2 Awb', 301)]
+
+        with pytest.raises(RuntimeError):
+            utils.get_cases_by_bwb_and_label_id('BWBR0005290', 101)
+    finally:
+        utils.reset_trie()
+
+def test_export(law_db, tmp_path, monkeypatch):
+    law_db.insert(
+        aliases=[(alias, bwb_id) for _, alias, bwb_id in ALIASES],
+        elements=[(bwb_id, type, number, label, title) for _, bwb_id, type, number, label, title in ELEMENTS],
+        case_law=[(2, 1), (2, 2), (3, 3)],
+    )
+    path = snapshot.export_snapshot(str(tmp_path / "laws.sqlite"), cases=True)
+    db.close_pool()
+
+    use_snapshot(path, tmp_path, monkeypatch, payloads=False)
+    assert snapshot.get_metadata()["fingerprint"].startswith("3:3:3:3:"), "the amounts and highest ids, then the checksums"
+    assert [law['bwb_label_id'] for law in utils.find_laws({'artikel': '3:2'}, alias='Awb')] == [301]
+    assert utils.get_amount_cases_by_bwb_and_label_ids([('BWBR0005290', 101), ('BWBR0005537', 301)]) == {
+        ('BWBR0005290', 101): 2,
+        ('BWBR0005537', 301): 1,
+    }
+    assert snapshot.get_metadata()["max_alias_length"] == "18"
+
+    queries = []
+    snapshot.get_connection().set_trace_callback(queries.append)
+    for _ in range(2):
+        assert utils.find_longest_alias_in_substring("Burgerlijk Wetboek Boek 7") == {'alias': 'Burgerlijk Wetboek', 'bwb_id': 'BWBR0005290'}
+    assert sum("max_alias_length" in query for query in queries) == 1, "read once per connection"
+    assert not any("MAX(" in query for query in queries)
@@ -0,0 +1,40 @@
+import random
+
+from linkextractor.spans import SpanIndex, longest_non_overlapping
+
+def test_span_index():
+    index = SpanIndex([(10, 20), (30, 35)])
+
+    assert (10, 20) in index
+    assert (10, 21) not in index
+    assert not index.add((10, 20)), "duplicate span should not be added"
+    assert index.add((10, 20), key=(("artikel", "1"),)), "same span with another key is not a duplicate"
+    assert index.overlaps((15, 40))
+    assert index.overlaps((0, 11))
+    assert not index.overlaps((20, 30)), "spans that only touch do not overlap"
+    assert not index.overlaps((35, 100))
+
+def test_span_index_overlaps_equivalent():
+    random.seed(0)
+    for _ in range(200):
+        spans = []
+        for _ in range(random.randint(0, 30)):
+            start = random.randint(0, 200)
+            spans.append((start, start + random.randint(1, 40)))
+        index = SpanIndex(spans)
+
+        start = random.randint(0, 200)
+        span = (start, start + random.randint(1, 40))
+        assert index.overlaps(span) == any(s < span[1] and span[0] < e for s, e in spans)
+
+def test_longest_non_overlapping():
+    matches = [
+        {"span": (0, 12), "literal": "artikel 5 BW"},
+        {"span": (20, 52), "literal": "artikel 3:2 Algemene wet bestuursrecht"},
+        {"span": (41, 52), "literal": "bestuursrecht"},
+        {"span": (8, 12), "literal": "5 BW"},
+    ]
+
+    resolved = longest_non_overlapping(matches, lambda match: match["span"])
+
+    assert [match["span"] for match in resolved] == [(0, 12), (20, 52)], "nested matches should collapse into the longest"
@@ -0,0 +1,47 @@
+import io
+import random
+
+import marisa_trie
+
+from linkextractor import search, utils
+from linkextractor.stream import extract_links_stream
+
+aliases = ["bw", "awb", "wft", "burgerlijk wetboek", "wetboek van strafrecht", "algemene wet bestuursrecht"]
+
+sentences = [
+    "De rechtbank oordeelt dat artikel 7:658 van het BW van toepassing is.",
+    "Burgerlijk Wetboek Boek 7, Artikel 611 is eveneens relevant.",
+    "Gelet op de artikelen 10, 14a en 22c van het Wetboek van Strafrecht.",
+    "Zie ook art. 1 lid 1 Wft en artt. 3:2 en 4:8 Awb.",
+    "De feiten en omstandigheden van dit geval zijn als volgt.",
+    "Het hof verwerpt het beroep.",
+]
+
+def fake_resolve_laws(lookups, batch=True, stats=None):
+    return [[{'title': title, 'bwb_id': title.lower(), 'bwb_label_id': 1}] for _, title in lookups]
+
+def use_aliases(tmp_path, monkeypatch):
+    trie_path = str(tmp_path / "aliases.trie")
+    marisa_trie.Trie(aliases).save(trie_path)
+    monkeypatch.setattr(utils, "_TRIE_PATH", trie_path)
+    monkeypatch.setattr(search, "resolve_laws", fake_resolve_laws)
+    utils.reset_trie()
+
+def link_keys(links):
+    return sorted((link['context']['span'], link['resource']['bwb_id'], tuple(link['fragment'].items())) for link in links)
+
+def test_stream_equivalent(tmp_path, monkeypatch):
+    use_aliases(tmp_path, monkeypatch)
+    random.seed(0)
+    text = " ".join(random.choice(sentences) for _ in range(400))
+
+    expected = link_keys(search.extract_links(text))
+    assert len(expected) > 0
+
+    for chunk_size, overlap in ((500, 200), (1000, 300), (4000, 1000)):
+        streamed = list(extract_links_stream(io.StringIO(text), chunk_size=chunk_size, overlap=overlap))
+        assert link_keys(streamed) == expected, f"chunk size {chunk_size} should give the same links"
+        assert all(text[link['context']['span'][0]:link['context']['span'][1]] == link['context']['literal'] for link in streamed), \
+            "spans should be offsets in the whole text"
+
+    utils.reset_trie()
@@ -0,0 +1,52 @@
+from linkextractor import utils, watcher
+
+ALIASES = [("BW", "BWBR0005290"), ("Awb", "BWBR0005537")]
+
+def aliases_in(text):
+    return [hit.alias for hit in utils.find_aliases_in_text(text, use_trie=True)]
+
+def test_poll_rebuilds_and_swaps(law_db):
+    law_db.insert(aliases=ALIASES)
+    alias_watcher = watcher.AliasIndexWatcher(listen=False)
+    assert alias_watcher.check(), "an index that was never built by the watcher should be rebuilt"
+    assert aliases_in("artikel 1 Wft en artikel 2 BW") == ["bw"]
+    assert not alias_watcher.check(), "unchanged law_alias should not trigger a rebuild"
+
+    law_db.insert(aliases=[("Wft", "BWBR0020368")])
+    old_automaton = utils.get_automaton()
+    assert alias_watcher.check()
+
+    assert aliases_in("artikel 1 Wft en artikel 2 BW") == ["wft", "bw"]
+    assert utils.get_alias_bwb_ids("wft") == ["BWBR0020368"]
+    assert old_automaton is not utils.get_automaton(), "the automaton should be swapped, not mutated"
+    assert watcher.read_index_fingerprint() == alias_watcher.fingerprint
+
+def test_listen_reloads_on_notify(law_db):
+    law_db.insert(aliases=ALIASES)
+    channel = "linkextractor_test_aliases"
+    alias_watcher = watcher.AliasIndexWatcher(interval=3600, channel=channel)
+    try:
+        alias_watcher.start()
+        assert alias_watcher.reloaded.wait(10), "the first check should build the index"
+        alias_watcher.reloaded.clear()
+
+        law_db.insert(aliases=[("Wft", "BWBR0020368")])
+        law_db.execute(f"NOTIFY {channel}")
+        assert alias_watcher.reloaded.wait(10), "a notification should trigger a rebuild"
+        assert aliases_in("artikel 1 Wft") == ["wft"]
+    finally:
+        alias_watcher.stop()
+
+def test_swap_resets_ngram_limits(law_db):
+    law_db.insert(aliases=ALIASES)
+    alias_watcher = watcher.AliasIndexWatcher(listen=False)
+    alias_watcher.check()
+    text = "artikel 1 Wet op het financieel toezicht en artikel 2 BW"
+    assert [hit.alias for hit in utils.find_aliases_in_text(text, use_trie=False)] == ["bw"]
+
+    # more words and characters than any alias so far
+    law_db.insert(aliases=[("Wet op het financieel toezicht", "BWBR0020368")])
+    assert alias_watcher.check()
+
+    assert [hit.alias for hit in utils.find_aliases_in_text(text, use_trie=False)] == ["wet op het financieel toezicht", "bw"], \
+        "the n-grams should be as long as the longest alias after a reload"